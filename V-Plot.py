@@ -1,3 +1,4 @@
+import multiprocessing
 import os
 import time
 import sys
@@ -26,6 +27,8 @@ class MyWindow(QMainWindow):
 
 
 if __name__ == "__main__":
+    # The partitioned TSP solver starts worker processes, which need this in the bundled app
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     splash = QSplashScreen()
     splash.setPixmap(QPixmap(constants.SPLASH_PATH).scaled(400, 400))
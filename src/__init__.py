@@ -1,3 +1,2 @@
 from . import image_processing
 from . import utils
-from . import window
@@ -0,0 +1,236 @@
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageOps
+
+from src.image_processing import dithering, stippling, wave_generator
+from src.utils import (constants, motion_planner, path_maker, plot_simulator, simplify, stage_cache, step_codec,
+                       to_steps, tsp_solver)
+
+# Runs the same steps as the Process Image tab without the window, for a batch of images:
+# load -> scale -> grayscale -> wave or dither/stipple -> path -> steps
+#   python -m src.cli portrait1.jpg portrait2.jpg --mode stipple --output batch_output
+# Every image gets its own directory in <output> with the files the window writes to generated_files/,
+# and the images are spread over a pool of processes. The processes share a stage cache (<output>/.stage_cache by
+# default), so running a batch again with other step settings only redoes the stages after the change.
+MODES = ("wave", "dither", "ordered-dither", "blue-noise-dither", "stipple")
+
+
+def loadSettings(settings_path):
+    # Same as the Configure Machine tab: the saved settings, or the defaults when there are none
+    if settings_path is None:
+        settings_path = constants.SETTINGS if os.path.exists(constants.SETTINGS) else None
+    if settings_path is None:
+        return constants.DEFAULT_SETTINGS.copy()
+    with open(settings_path, "r") as settings_file:
+        return json.load(settings_file)
+
+
+def jobPaths(output_dir):
+    # The files of one job, named like the ones in generated_files/
+    return {
+        "tsp": os.path.join(output_dir, constants.IMAGE_TSP),
+        "cyc": os.path.join(output_dir, constants.IMAGE_CYC),
+        "coordinates": os.path.join(output_dir, constants.OUTPUT_COORDINATES_TXT),
+        "simplified": os.path.join(output_dir, constants.SIMPLIFIED_COORDINATES_TXT),
+        "steps": os.path.join(output_dir, constants.OUTPUT_STEPS_TXT),
+        "steps_bin": os.path.join(output_dir, constants.OUTPUT_STEPS_BIN),
+        "preview": os.path.join(output_dir, constants.PREVIEW_PNG),
+        "report": os.path.join(output_dir, "report.txt"),
+    }
+
+
+def solveTour(paths, options) -> None:
+    # Writes the tour of image.tsp to image.cyc, with linkern or the built-in solver
+    if options["solver"] == "linkern":
+        result = subprocess.run([constants.PATH_MAKER, "-o", paths["cyc"], paths["tsp"]], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"linkern failed: {result.stdout}{result.stderr}")
+        return
+
+    points = path_maker.loadTsp(paths["tsp"])
+    tour = tsp_solver.solve(points)
+    tsp_solver.writeCyc(paths["cyc"], points, tour)
+
+
+def runStage(cache, outputs, run, stage, files=(), blobs=(), params=None):
+    # Copies <outputs> ({name: path}) from the cache, or calls <run>() to write them and stores them.
+    # Returns the info <run> returned (stored with the outputs) and whether it came from the cache
+    key = cache.key(stage, files, blobs, params) if cache is not None else None
+    if key is not None:
+        info = cache.fetch(key, outputs)
+        if info is not None:
+            return info, True
+
+    info = run() or {}
+    if key is not None:
+        cache.store(key, outputs, info)
+    return info, False
+
+
+def runJob(input_path, output_dir, options) -> str:
+    # Runs the whole pipeline for one image, returns what would be shown in the output box
+    start_time = time.time()
+    os.makedirs(output_dir, exist_ok=True)
+    paths = jobPaths(output_dir)
+    output = [f"{input_path} -> {output_dir}"]
+    cache = stage_cache.StageCache(options["cache_dir"]) if options["cache_dir"] else None
+
+    image = Image.open(input_path)
+    if options["scale"] != 1:
+        image = image.resize((int(image.width / options["scale"]), int(image.height / options["scale"])))
+    image = ImageOps.invert(image.convert("L"))
+    image_blobs = [image.tobytes()]
+
+    coordinate_outputs = {
+        constants.OUTPUT_COORDINATES_TXT: paths["coordinates"],
+        constants.PREVIEW_PNG: paths["preview"],
+    }
+    mode = options["mode"]
+    if mode == "wave":
+        def wave():
+            wave_generator.applyWave(image, paths["coordinates"], smooth=options["wave_smooth"]).save(paths["preview"])
+
+        runStage(cache, coordinate_outputs, wave, "wave", blobs=image_blobs,
+                 params={"size": image.size, "smooth": options["wave_smooth"]})
+    else:
+        def dither():
+            if mode == "ordered-dither":
+                dithering.applyOrderedDithering(image, paths["tsp"])
+            elif mode == "blue-noise-dither":
+                dithering.applyBlueNoiseDithering(image, paths["tsp"])
+            elif mode == "stipple":
+                stippling.applyStippling(image, paths["tsp"], options["node_budget"])
+            else:
+                dithering.applyDithering(image, paths["tsp"])
+
+        params = {"size": image.size, "mode": mode}
+        if mode == "stipple":
+            params["node_budget"] = options["node_budget"]
+        runStage(cache, {constants.IMAGE_TSP: paths["tsp"]}, dither, "dither", blobs=image_blobs, params=params)
+        runStage(cache, {constants.IMAGE_CYC: paths["cyc"]}, lambda: solveTour(paths, options), "tour",
+                 files=[paths["tsp"]], params={"solver": options["solver"]})
+
+        def path():
+            path_maker.pathMaker(paths["tsp"], paths["cyc"], paths["coordinates"]).save(paths["preview"])
+
+        runStage(cache, coordinate_outputs, path, "path", files=[paths["tsp"], paths["cyc"]])
+
+    settings = options["settings"]
+
+    def steps():
+        steps_output = []
+        coordinates_path = paths["coordinates"]
+        if options["simplify_tolerance"] > 0:
+            points_before, points_after = simplify.simplifyFile(
+                coordinates_path, paths["simplified"], options["simplify_tolerance"], settings, fit=True
+            )
+            steps_output.append(f"Simplified {points_before} points to {points_after}")
+            coordinates_path = paths["simplified"]
+
+        steps_output.append(to_steps.convertToSteps(
+            settings, coordinates_path, paths["steps"], fit=True, min_pen_pickup=options["min_pen_pickup"],
+            max_deviation=options["max_deviation"] or None
+        ))
+        if options["merge_moves"]:
+            moves_before, moves_after = motion_planner.planFile(paths["steps"], paths["steps"])
+            steps_output.append(f"Merged {moves_before} moves into {moves_after}")
+        step_codec.encodeFile(paths["steps"], paths["steps_bin"])
+        steps_output.append(plot_simulator.formatReport(plot_simulator.simulate(paths["steps"], settings)))
+        return {"output": steps_output}
+
+    # Everything that changes the steps besides the coordinates
+    params = {key: options[key] for key in ("settings", "simplify_tolerance", "max_deviation", "min_pen_pickup",
+                                            "merge_moves")}
+    step_outputs = {constants.OUTPUT_STEPS_TXT: paths["steps"], constants.OUTPUT_STEPS_BIN: paths["steps_bin"]}
+    info, _ = runStage(cache, step_outputs, steps, "steps", files=[paths["coordinates"]], params=params)
+    output += info["output"]
+    if cache is not None:
+        output.append(cache.formatStats())
+    output.append(f"Total run time: {round(time.time() - start_time, 3)} seconds")
+
+    with open(paths["report"], "w") as report_file:
+        report_file.write("\n".join(output) + "\n")
+    return "\n".join(output)
+
+
+def outputDirs(input_paths, output_root):
+    # One directory per image, named after it. Images with the same name get a number
+    dirs = []
+    used = set()
+    for input_path in input_paths:
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        candidate = name
+        number = 2
+        while candidate in used:
+            candidate = f"{name}_{number}"
+            number += 1
+        used.add(candidate)
+        dirs.append(os.path.join(output_root, candidate))
+    return dirs
+
+
+def parseArguments(argv):
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Converts images to plotter step files")
+    parser.add_argument("inputs", nargs="+", help="images to convert")
+    parser.add_argument("--output", default="batch_output", help="directory for the per image output directories")
+    parser.add_argument("--mode", choices=MODES, default="wave")
+    parser.add_argument("--scale", type=float, default=1.0, help="divides the image size, like the Scale button")
+    parser.add_argument("--wave-smooth", action="store_true")
+    parser.add_argument("--node-budget", type=int, default=20000, help="number of stipple points")
+    parser.add_argument("--solver", choices=("builtin", "linkern"), default="builtin" if os.name != "nt" else "linkern")
+    parser.add_argument("--settings", help="machine settings file, the saved settings.json by default")
+    parser.add_argument("--simplify-tolerance", type=float, default=0.1, help="mm, 0 to not simplify")
+    parser.add_argument("--max-deviation", type=float, default=0.1, help="mm, 0 to not subdivide lines")
+    parser.add_argument("--min-pen-pickup", action="store_true")
+    parser.add_argument("--merge-moves", action="store_true")
+    parser.add_argument("--cache-dir", help="stage cache directory, <output>/.stage_cache by default")
+    parser.add_argument("--no-cache", action="store_true", help="run every stage even when it ran before")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all cores by default")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    arguments = parseArguments(argv)
+    options = {
+        "mode": arguments.mode,
+        "scale": arguments.scale,
+        "wave_smooth": arguments.wave_smooth,
+        "node_budget": arguments.node_budget,
+        "solver": arguments.solver,
+        "settings": loadSettings(arguments.settings),
+        "simplify_tolerance": arguments.simplify_tolerance,
+        "max_deviation": arguments.max_deviation,
+        "min_pen_pickup": arguments.min_pen_pickup,
+        "merge_moves": arguments.merge_moves,
+        "cache_dir": None if arguments.no_cache else arguments.cache_dir,
+    }
+    if not arguments.no_cache and options["cache_dir"] is None:
+        options["cache_dir"] = os.path.join(arguments.output, ".stage_cache")
+    dirs = outputDirs(arguments.inputs, arguments.output)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=arguments.workers) as executor:
+        futures = {
+            executor.submit(runJob, input_path, output_dir, options): input_path
+            for input_path, output_dir in zip(arguments.inputs, dirs)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                print(f"[{done}/{len(futures)}] {future.result()}\n", flush=True)
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(futures)}] {futures[future]} failed: {e}\n", flush=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,3 +1,8 @@
+from . import background_removal
 from . import dithering
+from . import quantize
+from . import stippling
+from . import text_format
+from . import wave_generator
 from . import wave_smoother
 from . import wave_smoother_standalone
@@ -0,0 +1,136 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Loading a model takes seconds, so every session is made once on first use and kept for the rest of the run
+sessions = {}
+sessions_lock = threading.Lock()
+
+# Results of the last <max_cached_results> removals, keyed by the content hash of the input image
+cached_results = OrderedDict()
+max_cached_results = 8
+cached_results_lock = threading.Lock()
+
+# The u2net models run on a 320x320 input, whatever size the image is
+model_input_size = 320
+# Size of the longest side the low resolution mask is refined at, before it is scaled to the full image
+refine_size = 1024
+
+
+def getSession(model_name="u2net_lite"):
+    # rembg is only imported when a background is removed: importing it loads onnxruntime and starts threads
+    # that keep the process pool of the batch cli from shutting down
+    from rembg import new_session
+
+    with sessions_lock:
+        if model_name not in sessions:
+            sessions[model_name] = new_session(model_name, providers=["CPUExecutionProvider"])
+        return sessions[model_name]
+
+
+def imageHash(image, *options) -> str:
+    # Same pixels, size, mode and options give the same hash
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((image.mode, image.size) + options).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def cachedResult(key):
+    with cached_results_lock:
+        if key not in cached_results:
+            return None
+        cached_results.move_to_end(key)
+        return cached_results[key]
+
+
+def cacheResult(key, image) -> None:
+    with cached_results_lock:
+        cached_results[key] = image
+        cached_results.move_to_end(key)
+        while len(cached_results) > max_cached_results:
+            cached_results.popitem(last=False)
+
+
+def boxFilter(array, radius) -> np.ndarray:
+    # Mean over a (2 * radius + 1) square window, windows are cut off at the edges of the array
+    def boxSum(values, axis):
+        values = np.cumsum(values, axis=axis)
+        size = values.shape[axis]
+        upper = np.take(values, np.minimum(np.arange(size) + radius, size - 1), axis=axis)
+        lower_index = np.arange(size) - radius - 1
+        lower = np.take(values, np.maximum(lower_index, 0), axis=axis)
+        lower_mask = (lower_index >= 0).reshape((-1, 1) if axis == 0 else (1, -1))
+        return upper - lower * lower_mask
+
+    counts = boxSum(np.ones(array.shape, dtype=np.float32), 0)
+    counts = boxSum(counts, 1)
+    return boxSum(boxSum(array, 0), 1) / counts
+
+
+def guidedFilter(guide, source, radius=8, eps=1e-3):
+    # Edge aware smoothing (He et al. 2010): <source> is fitted as a local linear function of <guide>,
+    # so edges of the mask snap to the edges of the image. Returns the (a, b) of q = a * guide + b
+    mean_guide = boxFilter(guide, radius)
+    mean_source = boxFilter(source, radius)
+    covariance = boxFilter(guide * source, radius) - mean_guide * mean_source
+    variance = boxFilter(guide * guide, radius) - mean_guide * mean_guide
+
+    a = covariance / (variance + eps)
+    b = mean_source - a * mean_guide
+    return boxFilter(a, radius), boxFilter(b, radius)
+
+
+def resizeArray(array, size) -> np.ndarray:
+    return np.asarray(Image.fromarray(array.astype(np.float32), "F").resize(size, Image.BILINEAR))
+
+
+def lowResolutionMask(image, model_name="u2net_lite") -> Image:
+    # Runs the model on a copy scaled down to its input size, then scales the mask back up with a guided
+    # filter (fast guided filter, He & Sun 2015): the filter runs at <refine_size> and its coefficients
+    # are scaled up and applied to the full resolution image, so the full image is only touched once.
+    from rembg import remove
+
+    small_image = image.convert("RGB")
+    small_image.thumbnail((model_input_size, model_input_size), Image.BILINEAR)
+    small_mask = remove(small_image, session=getSession(model_name), only_mask=True)
+
+    gray_image = image.convert("L")
+    refine_image = gray_image.copy()
+    refine_image.thumbnail((refine_size, refine_size), Image.BILINEAR)
+
+    guide = np.asarray(refine_image, dtype=np.float32) / 255
+    source = resizeArray(np.asarray(small_mask, dtype=np.float32) / 255, refine_image.size)
+    a, b = guidedFilter(guide, source)
+
+    mask = resizeArray(a, image.size) * (np.asarray(gray_image, dtype=np.float32) / 255)
+    mask += resizeArray(b, image.size)
+    mask = np.clip(mask * 255 + 0.5, 0, 255).astype(np.uint8)
+    return Image.fromarray(mask, "L")
+
+
+def removeBackground(image, model_name="u2net_lite", low_resolution=False) -> Image:
+    # Removes the background of the image, and replaces it with white background instead of transparent
+    # With <low_resolution> the mask is made by lowResolutionMask instead of running the model on the full image
+    key = imageHash(image, model_name, low_resolution)
+    result = cachedResult(key)
+    if result is not None:
+        return result
+
+    if low_resolution:
+        mask = lowResolutionMask(image, model_name)
+        result = Image.new("RGB", image.size, "white")
+        result.paste(image.convert("RGB"), (0, 0), mask)
+    else:
+        from rembg import remove
+
+        foreground = remove(image, session=getSession(model_name))
+
+        result = Image.new("RGB", foreground.size, "white")
+        result.paste(foreground, (0, 0), foreground)
+
+    cacheResult(key, result)
+    return result
@@ -1,65 +1,182 @@
 import numpy as np
+from numba import njit
 from PIL import Image, ImageOps
 
+from .text_format import formatRows
+
+
+# Jarvis-Judice-Ninke style error diffusion over a float32 error buffer.
+# Compiled with numba, cache=True stores the compiled code next to the module so only the very
+# first run pays for the JIT. Returns a mask of the pixels that were set to black.
+@njit(cache=True)
+def diffuseError(pixels):
+    height, width = pixels.shape
+    black = np.zeros((height, width), dtype=np.bool_)
+
+    # Weights kept in float32 so the compiled and the pure python (diffuseError.py_func) runs agree
+    w1 = np.float32(1 / 48)
+    w3 = np.float32(3 / 48)
+    w5 = np.float32(5 / 48)
+    w7 = np.float32(7 / 48)
+
+    for y in range(height):
+        for x in range(width):
+            old_pixel = pixels[y, x]
+            new_pixel = np.float32(255.0) if old_pixel >= 128 else np.float32(0.0)
+            if new_pixel == 0:
+                black[y, x] = True
+
+            quant_error = old_pixel - new_pixel
+
+            if x < width - 1:
+                pixels[y, x + 1] += quant_error * w7
+                if x < width - 2:
+                    pixels[y, x + 2] += quant_error * w5
+            if y < height - 1:
+                if x > 0:
+                    pixels[y + 1, x - 1] += quant_error * w3
+                pixels[y + 1, x] += quant_error * w5
+                if x < width - 1:
+                    pixels[y + 1, x + 1] += quant_error * w3
+                if x < width - 2:
+                    pixels[y + 1, x + 2] += quant_error * w1
+
+    return black
+
+
+def writeTsp(tsp_path, black):
+    # Writes every black pixel of the <black> mask as a TSP node, numbered from 1 in row order
+    ys, xs = np.nonzero(black)
+    return writeTspNodes(tsp_path, xs, ys)
+
+
+def writeTspNodes(tsp_path, xs, ys):
+    # Writes the integer node coordinates <xs>, <ys> in the TSP format linkern reads
+    count = len(xs)
+    nodes = np.column_stack((np.arange(1, count + 1), xs, ys))
+
+    with open(tsp_path, "w") as f:
+        f.write("NAME : \n")
+        f.write("COMMENT : \n")
+        f.write("TYPE : TSP\n")
+        # Include count in DIMENSION line
+        f.write("DIMENSION : {}\n".format(count))
+        f.write("EDGE_WEIGHT_TYPE : EUC_2D\n")
+        f.write("NODE_COORD_SECTION\n")
+        f.write(formatRows(nodes))
+        f.write("EOF\n")
+
+    return count
+
 
 def applyDithering(image, tsp_path):
     grayscale_image = image.convert("L")
     grayscale_image = ImageOps.invert(grayscale_image)
 
-    input_pixels = np.array(grayscale_image)
+    input_pixels = np.array(grayscale_image, dtype=np.float32)
 
-    output_image = Image.new("L", grayscale_image.size)
-    output_pixels = np.array(output_image)
-    count = 0
+    black = diffuseError(input_pixels)
+    writeTsp(tsp_path, black)
 
-    f = open(tsp_path, "w")
+    output_pixels = np.where(black, 0, 255).astype(np.uint8)
 
-    # Initialize a list to store lines
-    file_lines = []
+    output_image = Image.fromarray(output_pixels)
+    output_image = output_image.convert("RGBA")
+    return output_image
 
-    file_lines.append("NAME : \n")
-    file_lines.append("COMMENT : \n")
-    file_lines.append("TYPE : TSP\n")
-    file_lines.append("EDGE_WEIGHT_TYPE : EUC_2D\n")
-    file_lines.append("NODE_COORD_SECTION\n")
 
-    for y in range(input_pixels.shape[0]):
-        for x in range(input_pixels.shape[1]):
-            old_pixel = input_pixels[y, x]
-            new_pixel = 255 if old_pixel >= 128 else 0
-            if new_pixel == 0:
-                count += 1
-                file_lines.append(f"%s %s %s\n" % (count, x, y))
-            output_pixels[y, x] = new_pixel
+def bayerMatrix(size):
+    # Recursive Bayer index matrix, <size> has to be a power of 2
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2],
+                           [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
 
-            quant_error = old_pixel - new_pixel
 
-            if x < input_pixels.shape[1] - 1:
-                input_pixels[y, x + 1] += quant_error * 7 / 48
-                if x < input_pixels.shape[1] - 2:
-                    input_pixels[y, x + 2] += quant_error * 5 / 48
-            if y < input_pixels.shape[0] - 1:
-                if x > 0:
-                    input_pixels[y + 1, x - 1] += quant_error * 3 / 48
-                input_pixels[y + 1, x] += quant_error * 5 / 48
-                if x < input_pixels.shape[1] - 1:
-                    input_pixels[y + 1, x + 1] += quant_error * 3 / 48
-                if x < input_pixels.shape[1] - 2:
-                    input_pixels[y + 1, x + 2] += quant_error * 1 / 48
-
-    # Include count in DIMENSION line
-    file_lines.insert(3, "DIMENSION : {}\n".format(count))
-    # Now, write all lines to the file
-    f.writelines(file_lines)
-    f.write("EOF\n")
-    f.close()
+blue_noise_masks = {}
+
+
+def blueNoiseMask(size=64, sigma=1.5, seed=0):
+    # Threshold ranks generated with Ulichney's void-and-cluster method on a toroidal <size> x <size> grid.
+    # Generated once per size and kept in <blue_noise_masks>
+    if size in blue_noise_masks:
+        return blue_noise_masks[size]
+
+    # Gaussian energy kernel with wrap around distances, rolled onto each point that changes
+    offsets = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(offsets[:, None]**2 + offsets[None, :]**2) / (2 * sigma**2))
+
+    def toggle(energy, pattern, index, value):
+        y, x = divmod(index, size)
+        pattern[y, x] = value
+        energy += np.roll(kernel, (y, x), axis=(0, 1)) * (1 if value else -1)
+
+    rng = np.random.default_rng(seed)
+    pattern = np.zeros((size, size), dtype=bool)
+    energy = np.zeros((size, size))
+    for index in rng.choice(size * size, size * size // 10, replace=False):
+        toggle(energy, pattern, index, True)
+
+    # Move points from the tightest cluster to the largest void until the pattern settles
+    while True:
+        cluster = np.argmax(np.where(pattern, energy, -np.inf))
+        toggle(energy, pattern, cluster, False)
+        void = np.argmin(np.where(pattern, np.inf, energy))
+        toggle(energy, pattern, void, True)
+        if void == cluster:
+            break
+
+    ranks = np.zeros(size * size, dtype=np.int64)
+    initial_pattern, initial_energy = pattern.copy(), energy.copy()
+    ones = int(pattern.sum())
+
+    # Points of the initial pattern are ranked by removing the tightest cluster first
+    for rank in range(ones - 1, -1, -1):
+        cluster = np.argmax(np.where(pattern, energy, -np.inf))
+        toggle(energy, pattern, cluster, False)
+        ranks[cluster] = rank
+
+    # The rest is ranked by filling the largest void
+    pattern, energy = initial_pattern, initial_energy
+    for rank in range(ones, size * size):
+        void = np.argmin(np.where(pattern, np.inf, energy))
+        toggle(energy, pattern, void, True)
+        ranks[void] = rank
+
+    blue_noise_masks[size] = ranks.reshape(size, size)
+    return blue_noise_masks[size]
+
+
+def applyThresholdMap(image, tsp_path, ranks):
+    # Compares the whole image against <ranks> tiled over it, ranks are turned into thresholds in 0-255
+    grayscale_image = image.convert("L")
+    grayscale_image = ImageOps.invert(grayscale_image)
+
+    input_pixels = np.array(grayscale_image)
+    height, width = input_pixels.shape
+
+    thresholds = (ranks + 0.5) * 255 / ranks.size
+    thresholds = np.tile(thresholds, (height // ranks.shape[0] + 1, width // ranks.shape[1] + 1))
+
+    black = input_pixels < thresholds[:height, :width]
+    writeTsp(tsp_path, black)
+
+    output_pixels = np.where(black, 0, 255).astype(np.uint8)
 
     output_image = Image.fromarray(output_pixels)
     output_image = output_image.convert("RGBA")
-    # print(count)
     return output_image
 
 
+def applyOrderedDithering(image, tsp_path, matrix_size=8):
+    return applyThresholdMap(image, tsp_path, bayerMatrix(matrix_size))
+
+
+def applyBlueNoiseDithering(image, tsp_path, mask_size=64):
+    return applyThresholdMap(image, tsp_path, blueNoiseMask(mask_size))
+
+
 # downscale = 2
 
 # input_image = Image.open('input.png')
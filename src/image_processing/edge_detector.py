@@ -18,8 +18,9 @@ class EdgeDetector:
           [0, 0, 0],
           [1, 2, 1]]
 
-    def __init__(self, path):
-        self.loadImage(path)
+    def __init__(self, path=None):
+        if path is not None:
+            self.loadImage(path)
 
     def remap(self, val, in_min, in_max, out_min, out_max):
         return max(out_min, min((val - in_min) * (out_max - out_min) / (in_max - in_min) + out_min, out_max))
@@ -44,30 +45,28 @@ class EdgeDetector:
 
     def sobel(self, image):
         image = image.convert("L")
-        input_pixels = np.array(image)
+        input_pixels = np.array(image, dtype=np.int32)
+
+        # Pad once with the same reflection as reflect_index, then every kernel tap is an array slice
+        padded = np.pad(input_pixels, 1, mode="symmetric")
+        height, width = input_pixels.shape
 
-        output_pixels = np.zeros_like(input_pixels, dtype=np.uint8)
         Gx_out = np.zeros_like(input_pixels, dtype=np.int32)
         Gy_out = np.zeros_like(input_pixels, dtype=np.int32)
 
-        for y in range(input_pixels.shape[0]):
-            for x in range(input_pixels.shape[1]):
-                Gx_sum = 0
-                Gy_sum = 0
-                for j in range(-1, 2):
-                    for i in range(-1, 2):
-                        neighbor_y = self.reflect_index(y + j, input_pixels.shape[0])
-                        neighbor_x = self.reflect_index(x + i, input_pixels.shape[1])
-                        Gx_sum += input_pixels[neighbor_y, neighbor_x] * self.Gx[j + 1][i + 1]
-                        Gy_sum += input_pixels[neighbor_y, neighbor_x] * self.Gy[j + 1][i + 1]
-
-                Gx_out[y, x] = Gx_sum
-                Gy_out[y, x] = Gy_sum
-                G = math.sqrt(Gx_sum**2 + Gy_sum**2)
-                # Remap the gradient magnitude
-                G = self.remap(G, 0, math.sqrt(255**2 + 255**2), 0, 255)
-
-                output_pixels[y, x] = np.uint8(G)  # Ensure it's an 8-bit value
+        for j in range(3):
+            for i in range(3):
+                window = padded[j:j + height, i:i + width]
+                if self.Gx[j][i]:
+                    Gx_out += window * self.Gx[j][i]
+                if self.Gy[j][i]:
+                    Gy_out += window * self.Gy[j][i]
+
+        G = np.sqrt(Gx_out.astype(np.float64)**2 + Gy_out.astype(np.float64)**2)
+        # Remap the gradient magnitude
+        G = np.clip(G * 255 / math.sqrt(255**2 + 255**2), 0, 255)
+
+        output_pixels = G.astype(np.uint8)  # Ensure it's an 8-bit value
 
         output_image = Image.fromarray(output_pixels, mode="L")
         self.sobel_output = output_image
@@ -76,44 +75,41 @@ class EdgeDetector:
     def gaussianKernelGenerator(self, x, y, sigma):
         return (1 / (2 * np.pi * sigma**2)) * np.exp(-(x**2 + y**2) / (2 * sigma**2))
 
-    def gaussian(self, image, radius):
-        diam = radius * 2 + 1
-        kernel = []
+    def gaussianKernel1D(self, radius):
+        # The 2D gaussian kernel is the outer product of this with itself, so the blur can be done
+        # as a horizontal pass followed by a vertical pass
         sigma = max(radius / 2, 1)
+        offsets = np.arange(-radius, radius + 1)
+        kernel = np.exp(-(offsets**2) / (2 * sigma**2))
+        return kernel / kernel.sum()
 
-        # Generate Gaussian kernel
-        for i in range(-radius, radius + 1):
-            temp = []
-            for j in range(-radius, radius + 1):
-                temp.append(self.gaussianKernelGenerator(i, j, sigma))
-            kernel.append(temp)
-
-        # Normalize the kernel
-        kernel_sum = sum(sum(row) for row in kernel)
-        kernel = [[value / kernel_sum for value in row] for row in kernel]
+    def gaussian(self, image, radius):
+        kernel = self.gaussianKernel1D(radius)
 
         image = image.convert("L")
-        input_pixels = np.array(image)
+        input_pixels = np.array(image, dtype=np.float64)
+        height, width = input_pixels.shape
+
+        # Apply convolution, horizontal then vertical
+        padded = np.pad(input_pixels, ((0, 0), (radius, radius)), mode="symmetric")
+        horizontal = np.zeros_like(input_pixels)
+        for i in range(2 * radius + 1):
+            horizontal += padded[:, i:i + width] * kernel[i]
 
-        output_pixels = np.zeros_like(input_pixels, dtype=np.uint8)
+        padded = np.pad(horizontal, ((radius, radius), (0, 0)), mode="symmetric")
+        sum_val = np.zeros_like(input_pixels)
+        for j in range(2 * radius + 1):
+            sum_val += padded[j:j + height, :] * kernel[j]
 
-        # Apply convolution
-        for y in range(input_pixels.shape[0]):
-            for x in range(input_pixels.shape[1]):
-                sum_val = 0
-                for j in range(-radius, radius + 1):
-                    for i in range(-radius, radius + 1):
-                        neighbor_y = self.reflect_index(y + j, input_pixels.shape[0])
-                        neighbor_x = self.reflect_index(x + i, input_pixels.shape[1])
-                        sum_val += input_pixels[neighbor_y, neighbor_x] * kernel[j + radius][i + radius]
-                output_pixels[y, x] = np.clip(sum_val, 0, 255)  # Ensure pixel values are within valid range
+        output_pixels = np.clip(sum_val, 0, 255).astype(np.uint8)  # Ensure pixel values are within valid range
 
         output_image = Image.fromarray(output_pixels, mode="L")
         self.gaussian_output = output_image
         return self.gaussian_output
 
 
-# Usage example:
-edgeDetector = EdgeDetector("test.jpg")
-edgeDetector.gaussian(edgeDetector.image, 3).save("gausia.jpg")
-edgeDetector.sobel(edgeDetector.gaussian_output).save("sobel.jpg")
+if __name__ == "__main__":
+    # Usage example:
+    edgeDetector = EdgeDetector("test.jpg")
+    edgeDetector.gaussian(edgeDetector.image, 3).save("gausia.jpg")
+    edgeDetector.sobel(edgeDetector.gaussian_output).save("sobel.jpg")
@@ -0,0 +1,25 @@
+import numpy as np
+from PIL import Image
+
+
+def quantizeLut(levels) -> np.ndarray:
+    # 256 entry table that maps a grayscale value to one of <levels> evenly spaced values
+    levels = min(max(int(levels), 2), 256)
+    scaling_factor = 255 / (levels - 1)
+    return (np.floor(np.arange(256) / scaling_factor) * scaling_factor).astype(np.uint8)
+
+
+def quantizeGrayscaleImage(image, levels=10) -> Image:
+    # Sets the grayscale image colour range to <levels> - so instead of 255 colour values it only has <levels> amount
+    # Grayscale ("L") images stay grayscale, anything else is quantized on the red channel and returned as gray RGBA
+    lut = quantizeLut(levels)
+    pixels = np.asarray(image)
+
+    if pixels.ndim == 2:
+        return Image.fromarray(lut[pixels], "L")
+
+    gray = lut[pixels[..., 0]]
+    output_pixels = np.empty(gray.shape + (4,), dtype=np.uint8)
+    output_pixels[..., :3] = gray[..., None]
+    output_pixels[..., 3] = 255
+    return Image.fromarray(output_pixels, "RGBA")
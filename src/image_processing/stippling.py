@@ -0,0 +1,69 @@
+import numpy as np
+from PIL import Image, ImageOps
+from scipy.spatial import cKDTree
+
+from .dithering import writeTspNodes
+
+
+# Weighted Voronoi stippling (Secord 2002): <node_budget> points are spread over the image and moved
+# to the density weighted centroid of their Voronoi cell with Lloyd relaxation. Dark areas pull in
+# more points, so the tone is kept while the TSP node count is fixed by the user.
+# <progress> is called with (iterations done, iterations)
+def applyStippling(image, tsp_path, node_budget=20000, iterations=30, seed=0, progress=None):
+    grayscale_image = image.convert("L")
+    grayscale_image = ImageOps.invert(grayscale_image)
+
+    # Dark pixels have high density
+    density = 1 - np.array(grayscale_image, dtype=np.float64) / 255
+    height, width = density.shape
+
+    ys, xs = np.nonzero(density > 0)
+    weights = density[ys, xs]
+    samples = np.column_stack((xs, ys)).astype(np.float64)
+
+    node_budget = min(int(node_budget), len(weights))
+    if node_budget <= 0:
+        writeTspNodes(tsp_path, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        return Image.new("RGBA", (width, height), "white")
+
+    # Initial points are drawn with probability proportional to the density, like a dither would place them
+    rng = np.random.default_rng(seed)
+    initial = rng.choice(len(weights), node_budget, replace=False, p=weights / weights.sum())
+    points = samples[initial] + rng.uniform(-0.5, 0.5, (node_budget, 2))
+
+    for iteration in range(iterations):
+        # Nearest point of every pixel = the Voronoi cell the pixel belongs to
+        _, owner = cKDTree(points).query(samples, workers=-1)
+
+        cell_weight = np.bincount(owner, weights, minlength=node_budget)
+        centroid_x = np.bincount(owner, weights * samples[:, 0], minlength=node_budget)
+        centroid_y = np.bincount(owner, weights * samples[:, 1], minlength=node_budget)
+
+        # Points whose cell got no pixels stay where they are
+        has_pixels = cell_weight > 0
+        new_points = points.copy()
+        new_points[has_pixels, 0] = centroid_x[has_pixels] / cell_weight[has_pixels]
+        new_points[has_pixels, 1] = centroid_y[has_pixels] / cell_weight[has_pixels]
+
+        shift = np.abs(new_points - points).max()
+        points = new_points
+
+        if shift < 0.05:
+            break
+        if progress:
+            progress(iteration + 1, iterations)
+
+    if progress:
+        progress(iterations, iterations)
+
+    nodes = np.rint(points).astype(np.int64)
+    nodes[:, 0] = np.clip(nodes[:, 0], 0, width - 1)
+    nodes[:, 1] = np.clip(nodes[:, 1], 0, height - 1)
+    writeTspNodes(tsp_path, nodes[:, 0], nodes[:, 1])
+
+    output_pixels = np.full((height, width), 255, dtype=np.uint8)
+    output_pixels[nodes[:, 1], nodes[:, 0]] = 0
+
+    output_image = Image.fromarray(output_pixels)
+    output_image = output_image.convert("RGBA")
+    return output_image
@@ -0,0 +1,53 @@
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def numberLength(value):
+    length = 1
+    if value < 0:
+        length += 1
+        value = -value
+    while value >= 10:
+        value //= 10
+        length += 1
+    return length
+
+
+@njit(cache=True)
+def formatRowsKernel(rows, separator):
+    # First pass sizes the buffer, second pass writes the digits right to left for each number
+    n_rows, n_cols = rows.shape
+    size = 0
+    for r in range(n_rows):
+        for c in range(n_cols):
+            size += numberLength(rows[r, c]) + 1
+
+    out = np.empty(size, dtype=np.uint8)
+    pos = 0
+    for r in range(n_rows):
+        for c in range(n_cols):
+            value = rows[r, c]
+            length = numberLength(value)
+            end = pos + length
+            if value < 0:
+                out[pos] = 45  # "-"
+                value = -value
+            i = end - 1
+            while True:
+                out[i] = 48 + value % 10
+                value //= 10
+                i -= 1
+                if value == 0:
+                    break
+            out[end] = separator if c < n_cols - 1 else 10  # <separator> between values, "\n" after the row
+            pos = end + 1
+    return out
+
+
+def formatRows(rows, separator=" ") -> str:
+    # Same text as writing separator.join(str(v) for v in row) + "\n" for every row, without the per value python calls
+    rows = np.ascontiguousarray(rows, dtype=np.int64)
+    if rows.size == 0:
+        return ""
+    return formatRowsKernel(rows, ord(separator)).tobytes().decode("ascii")
@@ -0,0 +1,90 @@
+import numpy as np
+from PIL import Image, ImageDraw
+
+from . import wave_smoother, wave_smoother_standalone
+from .text_format import formatRows
+
+# Range of wave values: 0 = horizontal line, max = dense wave - hight amplitude and frequency
+scaled_colour_range = 10
+pixel_wave_size = 20
+max_amplitude = pixel_wave_size / 2
+
+
+def waveParameters(pixels):
+    # Quantizes the whole image to <scaled_colour_range> levels and returns the frequency and amplitude of every pixel
+    quantized = np.rint(pixels / ((2**8) / scaled_colour_range))
+    low = quantized < scaled_colour_range / 2
+    # If the pixel value is under half of the <scaled_colour_range> only increase the amplitude
+    # If the pixel value is over half of the <scaled_colour_range> use max amplitude and increase frequency
+    frequency = np.where(low, 1, quantized - scaled_colour_range / 2 + 1)
+    amplitude = np.where(low, quantized, max_amplitude)
+    return frequency, amplitude
+
+
+def applyWave(image: Image, output_path, smooth=False, progress=None) -> Image:
+    # Converts the image to waves, writes the wave coordinates to <output_path> and returns the preview.
+    # <progress> is called with (rows done, total rows) while the preview is drawn
+    pixels = np.array(image)
+
+    if smooth:
+        return applySmoothWave(pixels, output_path, progress)
+
+    height, width = pixels.shape
+    frequency, amplitude = waveParameters(pixels)
+
+    # Every other y level needs to start from the end so the other of the horizontal lines is: left-right-right-left...
+    rows = np.arange(height)
+    odd = (rows % 2 != 0)[:, None]
+    columns = np.where(odd, width - 1 - np.arange(width), np.arange(width))
+    # Sample positions inside each <pixel_wave_size> "super pixel", odd rows run 20..1 instead of 0..19.
+    # One extra sample is kept at the end, the preview line of each pixel runs to where the next pixel starts
+    samples = np.where(odd, pixel_wave_size - np.arange(pixel_wave_size + 1), np.arange(pixel_wave_size + 1))
+
+    row_frequency = frequency[rows[:, None], columns][:, :, None]
+    row_amplitude = amplitude[rows[:, None], columns][:, :, None]
+    y_centre = (rows * pixel_wave_size + pixel_wave_size / 2)[:, None, None]
+
+    # (height, width, pixel_wave_size + 1) tensor of every sample point
+    x_pos = columns[:, :, None] * pixel_wave_size + samples[:, None, :]
+    y_pos = y_centre + np.sin(samples[:, None, :] / (pixel_wave_size / 2) * row_frequency * np.pi) * row_amplitude
+
+    with open(output_path, "w") as f:
+        f.write(formatRows(np.column_stack((x_pos[:, :, :-1].ravel(), np.rint(y_pos[:, :, :-1]).ravel()))))
+
+    new_height, new_width = height * pixel_wave_size, width * pixel_wave_size
+    image = Image.new("RGB", (new_width, new_height), color="white")
+    draw = ImageDraw.Draw(image)
+
+    # One polyline per row
+    for y in range(height):
+        draw.line(np.column_stack((x_pos[y].ravel(), y_pos[y].ravel())).ravel().tolist(), fill=(0, 0, 0))
+        if progress:
+            progress(y + 1, height)
+
+    return image
+
+
+def applySmoothWave(pixels, output_path, progress=None) -> Image:
+    height = pixels.shape[0]
+
+    wave_function_arr = wave_smoother.genWave(pixels)
+    processed_wave = wave_smoother_standalone.process(wave_function_arr)
+    processed_height, processed_width = processed_wave.shape[0] * pixel_wave_size, processed_wave.shape[1]
+
+    y_offset = (np.arange(processed_wave.shape[0]) * pixel_wave_size + pixel_wave_size / 2)[:, None]
+    y_pos = y_offset + processed_wave.astype(np.float64)
+    x_pos = np.broadcast_to(np.arange(processed_width), y_pos.shape)
+
+    with open(output_path, "w") as f:
+        f.write(formatRows(np.column_stack((x_pos[:, :-1].ravel(), np.rint(y_pos[:, :-1]).ravel()))))
+
+    image = Image.new("RGB", (processed_width, processed_height), color="white")
+    draw = ImageDraw.Draw(image)
+
+    # One polyline per row
+    for y in range(processed_wave.shape[0]):
+        draw.line(np.column_stack((x_pos[y], y_pos[y])).ravel().tolist(), fill=(0, 0, 0))
+        if progress:
+            progress(y + 1, height)
+
+    return image
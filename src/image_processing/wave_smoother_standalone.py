@@ -1,10 +1,5 @@
 import numpy as np
 
-fEnd, gStart = (
-    1 * 20,
-    20,
-)  # fEnd = where the function f will end, gStart = where the function g will start
-
 pixel_size = 20
 minX, maxX = 0, 40  # min and max values of the x axis
 
@@ -38,46 +33,56 @@ def phiab(x, a, b):  # phi function with a and b as input for domain control
     return phi((x - a) / (b - a))
 
 
-def smooth(x_smoothed, a, b, x1, x2, f1, a1, f2, a2):
-    return (1 - phiab(x_smoothed, a, b)) * wave(x_smoothed, f1, a1) + phiab(
-        x_smoothed, a, b
-    ) * wave(x_smoothed, f2, a2)
-
-
 smoothing_start, smoothing_finish = pixel_size - pixel_size/2, pixel_size + pixel_size/2
 initial_append = [0, pixel_size + pixel_size/2]
 intermidiet_append = [pixel_size/2, pixel_size/2+pixel_size]
 end_append = [pixel_size/2, pixel_size + pixel_size/2]
 
 
+x_smoothed = np.linspace(minX, maxX - 1, pixel_size * 2)
+# Blend weights only depend on the constants above, so they are computed once
+blend_weights = phiab(x_smoothed, smoothing_start, smoothing_finish)
+
+
+def waveShapes(parameters):
+    # One smoothed-length wave for every (frequency, amplitude) pair, pre-multiplied by both halves of the blend
+    shapes = wave(x_smoothed[None, :], parameters[:, 0:1], parameters[:, 1:2])
+    return (1 - blend_weights) * shapes, blend_weights * shapes
+
+
 def process(arr):
-    processed_wave = []
-    for j in range(len(arr)):
-        processed_wave_row = []
-        for i in range(len(arr[j]) - 1):
-            n_offset = 1
-            n_i = i
-            if j % 2 != 0:
-                n_i = (len(arr[j]) - 1) - i
-                n_offset = -1
-
-            f1, a1 = arr[j][n_i]
-            f2, a2 = arr[j][n_i + n_offset]
-            x1 = np.linspace(minX, fEnd - 1, pixel_size)
-            x2 = np.linspace(gStart, maxX - 1, pixel_size)
-
-            x_smoothed = np.linspace(minX, maxX - 1, pixel_size * 2)
-            y_smoothed = smooth(
-                x_smoothed, smoothing_start, smoothing_finish, x1, x2, f1, a1, f2, a2
-            )
-            if i == 0:
-                current_range = initial_append
-            elif i == len(arr[j])-1-1:
-                current_range = end_append
-            else:
-                current_range = intermidiet_append
-
-            for val in range(int(current_range[0]), int(current_range[1])):
-                processed_wave_row.append(y_smoothed[val])
-        processed_wave.append(processed_wave_row)
+    # <arr> is (rows, pixels, 2) of [frequency, amplitude] as returned by wave_smoother.genWave.
+    # Pixel values are quantized, so there are only ~10 distinct waves. Those are blended once and
+    # each row is gathered from the table
+    parameters = np.asarray(arr, dtype=np.float64)
+    height, width = parameters.shape[:2]
+    if width < 2:
+        return np.zeros((height, 0), dtype=np.float32)
+
+    unique_parameters, codes = np.unique(parameters.reshape(-1, 2), axis=0, return_inverse=True)
+    codes = codes.reshape(height, width)
+    fading_out, fading_in = waveShapes(unique_parameters)
+
+    # Slices of each blended pair that are kept: the first pair, the pairs in between and the last pair
+    initial = slice(int(initial_append[0]), int(initial_append[1]))
+    intermidiet = slice(int(intermidiet_append[0]), int(intermidiet_append[1]))
+    end = slice(int(end_append[0]), int(end_append[1]))
+
+    initial_width = initial.stop - initial.start
+    intermidiet_width = (width - 3) * (intermidiet.stop - intermidiet.start) if width > 2 else 0
+    end_width = end.stop - end.start if width > 2 else 0
+
+    processed_wave = np.empty((height, initial_width + intermidiet_width + end_width), dtype=np.float32)
+    for j in range(height):
+        row = codes[j]
+        if j % 2 != 0:
+            row = row[::-1]
+
+        # Pair i blends the wave of pixel i into the wave of pixel i + 1
+        y_smoothed = fading_out[row[:-1]] + fading_in[row[1:]]
+
+        processed_wave[j, :initial_width] = y_smoothed[0, initial]
+        if width > 2:
+            processed_wave[j, initial_width:initial_width + intermidiet_width] = y_smoothed[1:-1, intermidiet].ravel()
+            processed_wave[j, initial_width + intermidiet_width:] = y_smoothed[-1, end]
     return processed_wave
@@ -1,8 +1,15 @@
 from . import path_maker
 from . import to_steps
+from . import simplify
 from . import svg_parser
 from . import constants
+from . import tsp_solver
+from . import stroke_optimizer
+from . import plot_simulator
+from . import motion_planner
+from . import step_codec
+from . import serial_sender
+from . import stage_cache
 from .function_types import FunctionTypeEnum
-from .worker_thread import WorkerThread
 
 #from . import gcodeConvertor
@@ -23,13 +23,23 @@ PATH_MAKER = os.path.normpath(path_maker)
 
 IMAGE_TSP = "image.tsp"
 IMAGE_CYC = "image.cyc"
+IMAGE_CYC_SNAPSHOT = "image_snapshot.cyc"
 OUTPUT_COORDINATES_TXT = "output_coordinates.txt"
+SIMPLIFIED_COORDINATES_TXT = "simplified_coordinates.txt"
 OUTPUT_STEPS_TXT = "path.txt"
+OUTPUT_STEPS_BIN = "path.vps"
+PREVIEW_PNG = "preview.png"
+STAGE_CACHE = "stage_cache"
 
 TSP_PATH = os.path.join(GENERATED_FILES, IMAGE_TSP)
 CYC_PATH = os.path.join(GENERATED_FILES, IMAGE_CYC)
+CYC_SNAPSHOT_PATH = os.path.join(GENERATED_FILES, IMAGE_CYC_SNAPSHOT)
 OUTPUT_COODINATES_PATH = os.path.join(GENERATED_FILES, OUTPUT_COORDINATES_TXT)
+SIMPLIFIED_COORDINATES_PATH = os.path.join(GENERATED_FILES, SIMPLIFIED_COORDINATES_TXT)
 OUTPUT_STEPS_PATH = os.path.join(GENERATED_FILES, OUTPUT_STEPS_TXT)
+OUTPUT_STEPS_BIN_PATH = os.path.join(GENERATED_FILES, OUTPUT_STEPS_BIN)
+PREVIEW_PATH = os.path.join(GENERATED_FILES, PREVIEW_PNG)
+STAGE_CACHE_PATH = os.path.join(GENERATED_FILES, STAGE_CACHE)
 
 SETTINGS = "settings.json"
 
@@ -0,0 +1,80 @@
+import re
+import time
+
+# linkern prints lines like "1000 Steps   Best: 2841421   12.57 seconds" while it improves the tour,
+# and "Starting Cycle: 2841421", "LK Cycle: 2841421" and "Final Cycle: 2841421" without a time
+timed_length_pattern = re.compile(r"Best:\s*([\d.]+)\s+([\d.]+)\s*sec")
+length_pattern = re.compile(r"(?:Starting Cycle|LK Cycle|Final Cycle|Best):\s*([\d.]+)")
+
+
+class ConvergenceMonitor:
+    # Keeps the (seconds, tour length) series of a solver run and decides when to stop it:
+    # after <time_budget> seconds, or when the tour got less than <plateau_improvement> (a fraction,
+    # 0.001 = 0.1%) shorter over the last <plateau_window> seconds. Either can be None to not use it.
+    def __init__(self, time_budget=None, plateau_improvement=None, plateau_window=60):
+        self.time_budget = time_budget
+        self.plateau_improvement = plateau_improvement
+        self.plateau_window = plateau_window
+        self.start_time = time.monotonic()
+        self.history = []
+        # Seconds the solver's own clock is behind elapsed(), so the plateau window keeps moving while
+        # the solver prints nothing
+        self.clock_offset = 0.0
+        self.stop_reason = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start_time
+
+    def add(self, seconds, length) -> None:
+        self.history.append((seconds, length))
+        self.clock_offset = self.elapsed() - seconds
+
+    def parseLine(self, line) -> bool:
+        # Adds the tour length in a line of solver output, returns True if the line had one
+        match = timed_length_pattern.search(line)
+        if match:
+            self.add(float(match.group(2)), float(match.group(1)))
+            return True
+        match = length_pattern.search(line)
+        if match:
+            self.add(self.elapsed(), float(match.group(1)))
+            return True
+        return False
+
+    def best(self):
+        # (seconds, length) of the shortest tour so far, or None
+        if not self.history:
+            return None
+        return min(self.history, key=lambda point: point[1])
+
+    def recentImprovement(self):
+        # How much shorter the tour got over the last <plateau_window> seconds, as a fraction of the best
+        # length. None until the run is longer than the window
+        if not self.history:
+            return None
+        now = max(self.history[-1][0], self.elapsed() - self.clock_offset)
+        if now < self.plateau_window:
+            return None
+
+        window_start = now - self.plateau_window
+        before = [length for seconds, length in self.history if seconds <= window_start]
+        if not before:
+            return None
+        best_length = self.best()[1]
+        if best_length <= 0:
+            return 0.0
+        return (min(before) - best_length) / best_length
+
+    def shouldStop(self) -> bool:
+        if self.time_budget is not None and self.elapsed() >= self.time_budget:
+            self.stop_reason = f"time budget of {self.time_budget} seconds used"
+            return True
+
+        if self.plateau_improvement is not None:
+            improvement = self.recentImprovement()
+            if improvement is not None and improvement < self.plateau_improvement:
+                self.stop_reason = (
+                    f"improved {100 * improvement:.3f}% in the last {self.plateau_window} seconds"
+                )
+                return True
+        return False
@@ -3,4 +3,10 @@ class FunctionTypeEnum:
     WAVE = 1
     LINKERN = 2
     DITHER = 3
+    ORDERED_DITHER = 4
+    BLUE_NOISE_DITHER = 5
+    STIPPLE = 6
+    QUANTIZE = 7
+    REMOVE_BG = 8
+    OPTIMIZE_STROKES = 9
 
@@ -0,0 +1,117 @@
+import numpy as np
+from numba import njit
+
+from src.image_processing.text_format import formatRows
+
+from . import plot_simulator, simplify
+
+# Rewrites a step file (path.txt) with fewer, longer moves. The firmware runs every "a,b" line as its own
+# runSpeedToPosition and stops at the end of it, so a straight or gently curving run of short moves is
+# merged into the moves between the positions the path can't do without: a position is dropped when it is
+# within <tolerance> steps of the straight move that replaces it (Ramer-Douglas-Peucker on the motor
+# positions). Moves are only merged between the PENUP/PENDOWN/PAUSE/maxSpeed lines, which stay where they are.
+#
+# With an <acceleration> every move also gets a planned speed as a third field, "a,b,speed" in steps/s of
+# the motor that moves most. It is the speed the move can start at: the pen stops at the lines that aren't
+# moves, and the corner between two moves is taken at the speed that keeps the pen within <junction_deviation>
+# steps of it (the junction deviation of Grbl), lowered so the motors can still speed up and slow down between
+# the corners at <acceleration>. The firmware reads the second number with toInt(), which stops at the comma,
+# so it ignores the field.
+
+
+def moveRuns(move_count, commands):
+    # (start, end) of the runs of moves that aren't separated by another line
+    breaks = sorted({count for count, _ in commands if 0 < count < move_count})
+    return list(zip([0] + breaks, breaks + [move_count]))
+
+
+def mergeMoves(positions, commands, tolerance) -> np.ndarray:
+    # Mask of the positions to keep. The end of every run is kept, the move into a run starts
+    # where the pen was before it
+    keep = np.ones(len(positions), dtype=np.bool_)
+    for start, end in moveRuns(len(positions), commands):
+        if end - start < 2:
+            continue
+        previous = positions[start - 1] if start > 0 else np.zeros(2, dtype=positions.dtype)
+        run = np.vstack((previous[None], positions[start:end])).astype(np.float64)
+        keep[start:end] = simplify.simplifyPolyline(run, tolerance)[1:]
+    return keep
+
+
+@njit(cache=True)
+def planSpeeds(positions, stop_before, max_speed, acceleration, junction_deviation):
+    # Start speed of every move, stop_before[i] is True when the pen stops before move i
+    count = len(positions)
+    entry = np.zeros(count)
+    lengths = np.zeros(count)
+    direction = np.zeros((count, 2))
+
+    previous_x = 0.0
+    previous_y = 0.0
+    for i in range(count):
+        dx = positions[i, 0] - previous_x
+        dy = positions[i, 1] - previous_y
+        previous_x = positions[i, 0]
+        previous_y = positions[i, 1]
+        lengths[i] = max(abs(dx), abs(dy))
+        norm = np.sqrt(dx * dx + dy * dy)
+        if norm > 0:
+            direction[i, 0] = dx / norm
+            direction[i, 1] = dy / norm
+
+    # Speed limit of every corner
+    for i in range(1, count):
+        if stop_before[i] or lengths[i] == 0 or lengths[i - 1] == 0:
+            continue
+        cos_theta = -(direction[i - 1, 0] * direction[i, 0] + direction[i - 1, 1] * direction[i, 1])
+        if cos_theta < -0.999999:
+            # Straight on
+            entry[i] = max_speed
+        elif cos_theta < 0.999999:
+            sin_half = np.sqrt(0.5 * (1.0 - cos_theta))
+            entry[i] = min(np.sqrt(acceleration * junction_deviation * sin_half / (1.0 - sin_half)), max_speed)
+
+    # Every move has to be able to slow down to the start speed of the next one, the last move of a run
+    # ends standing still
+    for i in range(count - 1, -1, -1):
+        exit_speed = 0.0
+        if i + 1 < count and not stop_before[i + 1]:
+            exit_speed = entry[i + 1]
+        entry[i] = min(entry[i], np.sqrt(exit_speed * exit_speed + 2.0 * acceleration * lengths[i]))
+    # and reach it from the start speed of the move before
+    for i in range(1, count):
+        if not stop_before[i]:
+            entry[i] = min(entry[i], np.sqrt(entry[i - 1] * entry[i - 1] + 2.0 * acceleration * lengths[i - 1]))
+    return entry
+
+
+def planFile(input_file, output_file, tolerance=1.0, acceleration=None, junction_deviation=1.0,
+             max_speed=plot_simulator.DEFAULT_MAX_SPEED):
+    # Returns the number of moves (before, after)
+    positions, commands, _ = plot_simulator.readSteps(input_file)
+    keep = mergeMoves(positions, commands, tolerance)
+    kept_before = np.concatenate(([0], np.cumsum(keep)))
+    commands = [(int(kept_before[count]), line) for count, line in commands]
+    positions = positions[keep]
+
+    rows = positions
+    if acceleration:
+        stop_before = np.zeros(len(positions), dtype=np.bool_)
+        stop_before[0:1] = True
+        for count, _ in commands:
+            if count < len(positions):
+                stop_before[count] = True
+        speeds = planSpeeds(positions.astype(np.float64), stop_before, float(max_speed), float(acceleration),
+                            float(junction_deviation))
+        rows = np.column_stack((positions, np.floor(speeds).astype(np.int64)))
+
+    move_lines = formatRows(rows, separator=",").splitlines(keepends=True)
+    with open(output_file, "w") as f:
+        start = 0
+        for count, line in commands + [(len(positions), None)]:
+            f.write("".join(move_lines[start:count]))
+            start = count
+            if line is not None:
+                f.write(f"{line}\n")
+
+    return len(keep), len(positions)
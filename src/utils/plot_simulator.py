@@ -0,0 +1,205 @@
+import numpy as np
+
+from . import to_steps
+
+# Estimates how long the plotter takes to draw a step file (path.txt), the way firmwareNanoV2 runs it:
+# - "a,b" lines are MultiStepper moves, both motors arrive together and the one with the longer move runs at
+#   maxSpeed steps/s (runSpeedToPosition doesn't accelerate), so a move takes max(|da|, |db|) / maxSpeed
+# - "maxSpeed:n" lines change the speed of the moves after them
+# - "PENUP:n" and "PENDOWN:n" lines move the servo and wait 1 second
+# - "PAUSE" stops until the button is pressed, the time waiting isn't counted. The file is split into
+#   sections at the pauses
+# Every line also costs <line_overhead> seconds on the machine (reading it from the SD card and refreshing the
+# display), it is 0 unless it was measured for the machine.
+# Distances are the straight lines between the positions on the paper, in mm.
+# With an <acceleration> (steps/s^2) the moves are timed for a firmware that speeds up and slows down: every move
+# starts at its planned speed (the third field motion_planner adds, 0 without it) and ends at the planned speed
+# of the next move, or standing still before a line that isn't a move.
+DEFAULT_MAX_SPEED = 3000
+SERVO_DELAY = 1.0
+
+
+def readSteps(steps_file):
+    # Returns the (N, 2) array of the motor positions in the step file, the other lines as a list of
+    # (number of positions before the line, line), and the planned speed of every move (NaN when it has none)
+    with open(steps_file, "r") as f:
+        lines = [line.strip() for line in f.read().split("\n")]
+    lines = [line for line in lines if line]
+
+    move_lines = [line for line in lines if "," in line]
+    commands = []
+    move_count = 0
+    for line in lines:
+        if "," in line:
+            move_count += 1
+        else:
+            commands.append((move_count, line))
+
+    if not move_lines:
+        return np.zeros((0, 2), dtype=np.int64), commands, np.zeros(0)
+    positions = np.loadtxt(move_lines, dtype=np.int64, delimiter=",", usecols=(0, 1), ndmin=2)
+    # motion_planner adds the speed as a third field
+    speeds = np.full(len(move_lines), np.nan)
+    if move_lines[0].count(",") >= 2:
+        speeds = np.array([float(line.split(",")[2]) if line.count(",") >= 2 else np.nan for line in move_lines])
+    return positions, commands, speeds
+
+
+def commandValue(line) -> int:
+    # The number after the colon, like toInt() on the firmware
+    value = line.split(":", 1)[1].strip()
+    digits = len(value) - len(value.lstrip("+-"))
+    while digits < len(value) and value[digits].isdigit():
+        digits += 1
+    try:
+        return int(value[:digits])
+    except ValueError:
+        return 0
+
+
+def stateOfMoves(move_count, changes, initial) -> np.ndarray:
+    # Value of every move, when the value is set by the (moves before, value) <changes> before the move
+    values = np.array([initial] + [value for _, value in changes])
+    if not changes:
+        return np.full(move_count, initial, dtype=values.dtype)
+    change_counts = np.array([count for count, _ in changes])
+    return values[np.searchsorted(change_counts, np.arange(move_count), side="right")]
+
+
+def penPositionsMm(positions, settings) -> np.ndarray:
+    # Where the pen is on the paper for every motor position, in mm from M1
+    mm_per_step = int(settings["beltToothDistance"]) * int(settings["toothOngear"]) / int(settings["stepsPerRev"])
+    s_distance_between_motors = round(int(settings["distanceBetweenMotors"]) / mm_per_step)
+    s_start_distance = np.array([
+        round(int(settings["startDistance"][0]) / mm_per_step),
+        round(int(settings["startDistance"][1]) / mm_per_step),
+    ])
+    motor_dir = np.array([int(settings["motorDir"][0]), int(settings["motorDir"][1])])
+
+    # to_steps writes (start - length) * motor_dir, the motors start at 0 with the belts at the start distance
+    lengths = s_start_distance - positions * motor_dir
+    return to_steps.penPositions(lengths, s_distance_between_motors) * mm_per_step
+
+
+def acceleratedMoveTimes(steps, speeds, entry, exit_speeds, acceleration) -> np.ndarray:
+    # Time of moves of <steps> that start at <entry> and end at <exit_speeds>, speeding up to at most <speeds>
+    peak = np.sqrt(np.maximum(acceleration * steps + (entry ** 2 + exit_speeds ** 2) / 2, 0))
+    peak = np.maximum(peak, np.maximum(entry, exit_speeds))
+    # Moves too short to get to the top speed only speed up and slow down
+    ramp_times = (2 * peak - entry - exit_speeds) / acceleration
+    cruise_steps = steps - (2 * speeds ** 2 - entry ** 2 - exit_speeds ** 2) / (2 * acceleration)
+    cruise_times = (2 * speeds - entry - exit_speeds) / acceleration + cruise_steps / speeds
+    return np.where(peak <= speeds, ramp_times, cruise_times)
+
+
+def simulate(steps_file, settings, max_speed=DEFAULT_MAX_SPEED, servo_delay=SERVO_DELAY, line_overhead=0.0,
+             acceleration=None):
+    # Returns a dict with the totals for the whole file, and the same for every section in "sections"
+    positions, commands, planned_speeds = readSteps(steps_file)
+    move_count = len(positions)
+
+    servo_changes = [(count, line.startswith("PENDOWN")) for count, line in commands
+                     if line.startswith(("PENUP:", "PENDOWN:"))]
+    speed_changes = [(count, commandValue(line)) for count, line in commands if line.startswith("maxSpeed:")]
+    pauses = [count for count, line in commands if line.startswith("PAUSE")]
+
+    # The motors start at position 0, every move goes from the position before it
+    previous = np.vstack((np.zeros((1, 2), dtype=np.int64), positions[:-1]))
+    steps = np.abs(positions - previous).max(axis=1, initial=0)
+    speeds = stateOfMoves(move_count, speed_changes, max_speed).astype(np.float64)
+    # A speed of 0 or less never finishes the move on the firmware
+    speeds = np.where(speeds > 0, speeds, np.nan)
+    if acceleration:
+        # The pen stops before the lines that aren't moves, and at the end of the file
+        stop_before = np.zeros(move_count + 1, dtype=np.bool_)
+        stop_before[[count for count, _ in commands] + [0, move_count]] = True
+        entry = np.minimum(np.nan_to_num(planned_speeds), speeds)
+        entry[stop_before[:-1]] = 0.0
+        exit_speeds = np.append(entry[1:], 0.0)
+        exit_speeds[stop_before[1:]] = 0.0
+        move_times = np.where(steps > 0, acceleratedMoveTimes(steps, speeds, entry, exit_speeds, acceleration), 0.0)
+    else:
+        move_times = np.where(steps > 0, steps / speeds, 0.0)
+
+    # Without a PENDOWN line the file is one line drawn from start to end, like the steps of a wave or a tour
+    if any(down for _, down in servo_changes):
+        pen_down = stateOfMoves(move_count, servo_changes, False)
+    else:
+        pen_down = np.ones(move_count, dtype=np.bool_)
+    pen = penPositionsMm(np.vstack((np.zeros((1, 2), dtype=np.int64), positions)), settings)
+    distances = np.sqrt((np.diff(pen, axis=0) ** 2).sum(axis=1))
+
+    # Moves and lines after the k-th pause are in section k
+    section_count = len(pauses) + 1
+    pause_counts = np.array(pauses, dtype=np.int64)
+    move_sections = np.searchsorted(pause_counts, np.arange(move_count), side="right")
+
+    def perSection(weights=None):
+        return np.bincount(move_sections, weights=weights, minlength=section_count)
+
+    section_move_time = perSection(move_times)
+    section_pen_down = perSection(np.where(pen_down, distances, 0.0))
+    section_pen_up = perSection(np.where(pen_down, 0.0, distances))
+    section_moves = perSection(steps > 0).astype(np.int64)
+    section_lines = perSection().astype(np.int64)
+
+    section_servo_moves = np.zeros(section_count, dtype=np.int64)
+    section_lifts = np.zeros(section_count, dtype=np.int64)
+    section = 0
+    down = False
+    for _, line in commands:
+        section_lines[section] += 1
+        if line.startswith("PAUSE"):
+            section += 1
+        elif line.startswith(("PENUP:", "PENDOWN:")):
+            section_servo_moves[section] += 1
+            if down and line.startswith("PENUP:"):
+                section_lifts[section] += 1
+            down = line.startswith("PENDOWN:")
+
+    section_time = section_move_time + section_servo_moves * servo_delay + section_lines * line_overhead
+
+    sections = [
+        {
+            "time": float(section_time[k]),
+            "move_time": float(section_move_time[k]),
+            "servo_time": float(section_servo_moves[k] * servo_delay),
+            "pen_down_mm": float(section_pen_down[k]),
+            "pen_up_mm": float(section_pen_up[k]),
+            "lifts": int(section_lifts[k]),
+            "moves": int(section_moves[k]),
+            "lines": int(section_lines[k]),
+        }
+        for k in range(section_count)
+    ]
+    report = {key: sum(section[key] for section in sections) for key in sections[0]}
+    report["pauses"] = len(pauses)
+    report["sections"] = sections
+    return report
+
+
+def formatDuration(seconds) -> str:
+    if not np.isfinite(seconds):
+        return "never (maxSpeed is 0)"
+    seconds = round(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def formatDistance(mm) -> str:
+    return f"{mm / 1000:.2f} m" if mm >= 1000 else f"{mm:.0f} mm"
+
+
+def formatReport(report) -> str:
+    lines = [
+        f"Estimated plot time: {formatDuration(report['time'])} "
+        f"(moving {formatDuration(report['move_time'])}, pen servo {formatDuration(report['servo_time'])})",
+        f"Pen down: {formatDistance(report['pen_down_mm'])}, pen up: {formatDistance(report['pen_up_mm'])}, "
+        f"lifts: {report['lifts']}, moves: {report['moves']}",
+    ]
+    if len(report["sections"]) > 1:
+        for k, section in enumerate(report["sections"]):
+            lines.append(
+                f"Section {k + 1}: {formatDuration(section['time'])}, pen down {formatDistance(section['pen_down_mm'])}, "
+                f"pen up {formatDistance(section['pen_up_mm'])}, lifts {section['lifts']}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,32 @@
+import time
+
+
+class ProgressReporter:
+    # Coalesces the progress updates of a long job, so the gui gets at most one every <interval> seconds.
+    # <callback> is called with (fraction done, estimated seconds left), the estimate is -1 until there is
+    # something to base it on. Without a callback calling the reporter returns straight away.
+    def __init__(self, callback=None, interval=0.1):
+        self.callback = callback
+        self.interval = interval
+        self.start_time = time.monotonic()
+        self.last_report = None
+
+    def __call__(self, done, total) -> None:
+        if self.callback is None:
+            return
+
+        now = time.monotonic()
+        finished = done >= total
+        if not finished and self.last_report is not None and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+
+        fraction = min(done / total, 1.0) if total > 0 else 1.0
+        eta = -1.0
+        if finished:
+            eta = 0.0
+        elif fraction > 0:
+            elapsed = now - self.start_time
+            eta = elapsed * (1 - fraction) / fraction
+
+        self.callback(fraction, eta)
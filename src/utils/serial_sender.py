@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import deque
+
+import serial
+
+# Streams the lines of a step file (path.txt) to the plotter over a serial port, instead of copying the
+# file to the SD card. The plotter answers every line it has run with "ok" (or "error..." when it can't run
+# it). A few lines are kept in flight so the plotter has the next move when it finishes one: at most
+# <window> lines, and at most <buffer_size> bytes so they always fit in the serial receive buffer of the
+# Nano (64 bytes).
+# PAUSE lines aren't sent: the sender waits for the lines before it and pauses itself, like the firmware
+# does with the button. resume() goes on with the line after it.
+
+
+def newStats() -> dict:
+    return {"sent": 0, "acknowledged": 0, "bytes": 0, "seconds": 0.0, "commands_per_second": 0.0}
+
+
+class SerialSender:
+    def __init__(self, port, baudrate=115200, window=4, buffer_size=64, ack_timeout=60.0):
+        self.serial = serial.serial_for_url(port, baudrate=baudrate, timeout=0.05)
+        self.window = window
+        self.buffer_size = buffer_size
+        # Seconds to wait for an answer, a long move can take a while
+        self.ack_timeout = ack_timeout
+
+        self.running = threading.Event()
+        self.running.set()
+        self.stopping = threading.Event()
+        # The first line that wasn't run yet, where to resume from after stop() or an error
+        self.next_line = 0
+        self.stats = newStats()
+
+    def pause(self) -> None:
+        # The lines already sent are still run
+        self.running.clear()
+
+    def resume(self) -> None:
+        self.running.set()
+
+    def isPaused(self) -> bool:
+        return not self.running.is_set()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        self.running.set()
+
+    def close(self) -> None:
+        self.serial.close()
+
+    def stream(self, lines, start_line=0, progress=None, on_pause=None):
+        # Sends <lines> from <start_line> on, returns the stats. <progress>(next line, line count) is called for
+        # every answer, <on_pause>(line) when a PAUSE line paused the stream
+        lines = [line.strip() for line in lines]
+        lines = [line for line in lines if line]
+        # (line, text) of every command, the lines that restore the machine when resuming have no line
+        commands = [(None, text) for text in restoreLines(lines, start_line)]
+        commands += [(index, lines[index]) for index in range(start_line, len(lines))]
+        for _, text in commands:
+            if len(text) + 1 > self.buffer_size:
+                raise ValueError(f"Line is longer than the plotter buffer: {text}")
+
+        in_flight = deque()
+        in_flight_bytes = 0
+        position = 0
+        self.next_line = start_line
+        self.stopping.clear()
+        # The stats are for this call only, a resumed stream starts over
+        self.stats = newStats()
+        start_time = time.monotonic()
+        last_answer = start_time
+
+        while (position < len(commands) or in_flight) and not self.stopping.is_set():
+            index, text = commands[position] if position < len(commands) else (None, None)
+            if text == "PAUSE" and not in_flight and self.running.is_set():
+                position += 1
+                self.next_line = index + 1
+                self.pause()
+                if on_pause:
+                    on_pause(index)
+                continue
+
+            while self.running.is_set() and text is not None and text != "PAUSE" and len(in_flight) < self.window:
+                data = f"{text}\n".encode("ascii")
+                if in_flight_bytes + len(data) > self.buffer_size:
+                    break
+                self.serial.write(data)
+                in_flight.append((index, len(data)))
+                in_flight_bytes += len(data)
+                self.stats["sent"] += 1
+                self.stats["bytes"] += len(data)
+                position += 1
+                index, text = commands[position] if position < len(commands) else (None, None)
+
+            if not in_flight:
+                # Paused, or at a PAUSE line
+                self.running.wait(0.05)
+                last_answer = time.monotonic()
+                continue
+
+            answer = self.serial.readline()
+            if not answer:
+                if time.monotonic() - last_answer > self.ack_timeout:
+                    raise TimeoutError(f"No answer from the plotter for {self.ack_timeout} seconds")
+                continue
+            last_answer = time.monotonic()
+
+            answer = answer.decode("ascii", "replace").strip()
+            if answer == "ok":
+                index, size = in_flight.popleft()
+                in_flight_bytes -= size
+                self.stats["acknowledged"] += 1
+                if index is not None:
+                    self.next_line = index + 1
+                if progress:
+                    progress(self.next_line, len(lines))
+            elif answer.startswith("error"):
+                line = in_flight[0][0]
+                raise RuntimeError(f"Plotter error on line {line}: {answer}")
+            # Anything else is the firmware talking, like "Set maxSpeed: 3000"
+
+        self.stats["seconds"] = time.monotonic() - start_time
+        if self.stats["seconds"] > 0:
+            self.stats["commands_per_second"] = self.stats["acknowledged"] / self.stats["seconds"]
+        return self.stats
+
+
+def restoreLines(lines, start_line):
+    # Lines that get the machine to where it was before <start_line> of the step file: the pen goes up,
+    # moves to the last position before the line, and the speed and pen are set back
+    if start_line <= 0:
+        return []
+
+    pen_up = "PENUP:45"
+    for line in lines:
+        if line.startswith("PENUP:"):
+            pen_up = line
+            break
+
+    position = None
+    pen = None
+    speed = None
+    for line in lines[:start_line]:
+        if "," in line:
+            position = ",".join(line.split(",")[:2])
+        elif line.startswith(("PENUP:", "PENDOWN:")):
+            pen = line
+            if line.startswith("PENUP:"):
+                pen_up = line
+        elif line.startswith("maxSpeed:"):
+            speed = line
+
+    restore = [pen_up]
+    if speed is not None:
+        restore.append(speed)
+    if position is not None:
+        restore.append(position)
+    if pen is not None and pen.startswith("PENDOWN:"):
+        restore.append(pen)
+    return restore
+
+
+def streamFile(port, steps_file, start_line=0, **options):
+    # Sends the step file to the plotter on <port>, returns the stats
+    with open(steps_file, "r") as f:
+        lines = f.read().split("\n")
+    sender = SerialSender(port, **options)
+    try:
+        return sender.stream(lines, start_line)
+    finally:
+        sender.close()
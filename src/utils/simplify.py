@@ -0,0 +1,97 @@
+import numpy as np
+from numba import njit
+
+from . import to_steps
+
+# Drops the coordinate points that lie within a tolerance of the line through their neighbours
+# (Ramer-Douglas-Peucker), so straight and gently curving runs are sent to the plotter as a few long moves.
+# The tolerance is in mm on the paper, so it is converted to coordinate units with the same scale
+# to_steps.convertToSteps fits the image to the paper with.
+
+
+@njit(cache=True)
+def simplifyPolyline(points, tolerance):
+    # Returns a mask of the points to keep, the first and last points are always kept
+    count = len(points)
+    keep = np.zeros(count, dtype=np.bool_)
+    if count == 0:
+        return keep
+    keep[0] = True
+    keep[count - 1] = True
+
+    stack = np.empty((count, 2), dtype=np.int64)
+    stack[0, 0] = 0
+    stack[0, 1] = count - 1
+    size = 1
+    while size > 0:
+        size -= 1
+        first = stack[size, 0]
+        last = stack[size, 1]
+        if last - first < 2:
+            continue
+
+        ax = points[first, 0]
+        ay = points[first, 1]
+        dx = points[last, 0] - ax
+        dy = points[last, 1] - ay
+        length_sq = dx * dx + dy * dy
+
+        # Furthest point from the segment first-last
+        furthest = -1
+        furthest_sq = -1.0
+        for i in range(first + 1, last):
+            px = points[i, 0] - ax
+            py = points[i, 1] - ay
+            if length_sq > 0:
+                t = min(max((px * dx + py * dy) / length_sq, 0.0), 1.0)
+                px -= t * dx
+                py -= t * dy
+            distance_sq = px * px + py * py
+            if distance_sq > furthest_sq:
+                furthest_sq = distance_sq
+                furthest = i
+
+        if furthest_sq > tolerance * tolerance:
+            keep[furthest] = True
+            stack[size, 0] = first
+            stack[size, 1] = furthest
+            stack[size + 1, 0] = furthest
+            stack[size + 1, 1] = last
+            size += 2
+    return keep
+
+
+def simplifyFile(input_file, output_file, tolerance_mm, settings, fit=True):
+    # Simplifies every run of coordinate lines between PENUP/PENDOWN/PAUSE lines of <input_file>.
+    # Points on the edges of the image are kept, to_steps uses them for the scale and the pen pickups.
+    # Returns (points before, points after)
+    with open(input_file) as f:
+        lines = [line.strip() for line in f]
+    lines = [line for line in lines if line]
+
+    is_point = np.array([line not in ("PENUP", "PENDOWN", "PAUSE") for line in lines], dtype=np.bool_)
+    point_lines = [line for line, point in zip(lines, is_point) if point]
+    if not point_lines:
+        return 0, 0
+    points = np.array([line.split()[:2] for line in point_lines], dtype=np.float64)
+
+    # convertToSteps works on the integer part of the coordinates
+    whole = points.astype(np.int64)
+    max_x, max_y = whole.max(axis=0)
+    tolerance = tolerance_mm / to_steps.mmPerUnit(settings, max_x, max_y, fit)
+
+    keep = (whole[:, 0] == 0) | (whole[:, 0] == max_x) | (whole[:, 1] == 0) | (whole[:, 1] == max_y)
+    # Runs of points are separated by the marker lines
+    run_ids = np.cumsum(~is_point)[is_point]
+    run_starts = np.flatnonzero(np.diff(run_ids, prepend=-1))
+    run_ends = np.append(run_starts[1:], len(points))
+    for start, end in zip(run_starts, run_ends):
+        keep[start:end] |= simplifyPolyline(points[start:end], tolerance)
+
+    kept = iter(keep)
+    with open(output_file, "w") as f:
+        for line, point in zip(lines, is_point):
+            if not point or next(kept):
+                f.write(f"{line}\n")
+
+    return len(points), int(keep.sum())
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+# On disk cache of the files every stage of the pipeline writes (the .tsp of a dither, the .cyc of a tour,
+# the coordinates, the steps), so a stage that runs again on the same input is a file copy instead of a
+# rerun. An entry is keyed by the hash of the stage name, the contents of its input files and images, and its
+# parameters (machine settings included), so any change to them is a different entry.
+# Every entry is a directory named by its key with a copy of the output files and info.json. The least
+# recently used entries (by the modified time of the directory, which a hit updates) are removed when the
+# cache is over <max_bytes>.
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+INFO_FILE = "info.json"
+
+
+class StageCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # The worker thread and the window both use the cache
+        self.lock = threading.Lock()
+
+    def key(self, stage, files=(), blobs=(), params=None) -> str:
+        # <files> are paths of input files, <blobs> bytes like the pixels of an image, <params> anything json can write
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(stage.encode())
+        for path in files:
+            digest.update(b"\0file\0")
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        for blob in blobs:
+            digest.update(b"\0blob\0" + len(blob).to_bytes(8, "little"))
+            digest.update(blob)
+        digest.update(b"\0params\0" + json.dumps(params, sort_keys=True, default=str).encode())
+        return f"{stage}-{digest.hexdigest()}"
+
+    def entryPath(self, key) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key, outputs):
+        # Copies the cached files to <outputs> ({name: path}) and returns the info stored with them,
+        # or returns None when there is no entry for the key
+        entry = self.entryPath(key)
+        with self.lock:
+            try:
+                for name, path in outputs.items():
+                    shutil.copyfile(os.path.join(entry, name), path)
+                with open(os.path.join(entry, INFO_FILE), "r") as f:
+                    info = json.load(f)
+                os.utime(entry)
+            except (OSError, ValueError):
+                # Not cached, or removed by another process while it was read
+                self.misses += 1
+                return None
+            self.hits += 1
+            return info
+
+    def store(self, key, outputs, info=None) -> None:
+        # Stores a copy of the files in <outputs> ({name: path}) and <info> under <key>
+        if sum(os.path.getsize(path) for path in outputs.values()) > self.max_bytes:
+            return
+
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Written next to the cache and renamed, so a half written entry is never read
+            temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+            try:
+                for name, path in outputs.items():
+                    shutil.copyfile(path, os.path.join(temp_dir, name))
+                with open(os.path.join(temp_dir, INFO_FILE), "w") as f:
+                    json.dump(info or {}, f)
+                os.replace(temp_dir, self.entryPath(key))
+            except OSError:
+                # Another process stored the same key first
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            self.evict()
+
+    def entries(self):
+        # (last used, bytes, path) of every entry, least recently used first
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+                entries.append((os.path.getmtime(entry), size, entry))
+            except OSError:
+                continue
+        return sorted(entries)
+
+    def evict(self) -> None:
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        with self.lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+    def formatStats(self) -> str:
+        stats = self.stats()
+        return (f"Stage cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries, {stats['bytes'] / 1024 ** 2:.1f} MB")
@@ -0,0 +1,259 @@
+import numpy as np
+from numba import njit
+
+from . import plot_simulator
+
+# Binary version of the step file (path.txt), so the firmware can read moves without parsing text.
+# The file starts with MAGIC, then every line of the step file is a record of LEB128 varints
+# (7 bits per byte, low bits first, the high bit is set on every byte but the last):
+# - "a,b": the change from the position before (0, 0 at the start) as zigzag numbers (0, -1, 1, -2, ... are
+#   0, 1, 2, 3, ...), first (zigzag(da) << 1), then zigzag(db). A move of up to 31 steps on both motors is 2 bytes
+# - "a,b,speed" (motion_planner): (zigzag(da) << 2) | 1, zigzag(db), speed
+# - the other lines: (opcode << 2) | 3, followed by the value after the colon for the opcodes that have one
+MAGIC = b"VPS1"
+
+OP_PENUP = 0
+OP_PENDOWN = 1
+OP_PAUSE = 2
+OP_MAX_SPEED = 3
+# Text of the line, before the value for the opcodes that have one
+OPCODES = {
+    OP_PENUP: "PENUP:",
+    OP_PENDOWN: "PENDOWN:",
+    OP_PAUSE: "PAUSE",
+    OP_MAX_SPEED: "maxSpeed:",
+}
+VALUE_OPCODES = {OP_PENUP, OP_PENDOWN, OP_MAX_SPEED}
+
+
+def zigzag(value) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def unzigzag(value) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+@njit(cache=True)
+def varintLength(value):
+    length = 1
+    while value >= 128:
+        value >>= 7
+        length += 1
+    return length
+
+
+@njit(cache=True)
+def writeVarint(out, pos, value):
+    while value >= 128:
+        out[pos] = (value & 127) | 128
+        value >>= 7
+        pos += 1
+    out[pos] = value
+    return pos + 1
+
+
+@njit(cache=True)
+def encodeKernel(firsts, seconds, speeds, command_counts, command_words, command_values):
+    # <firsts>, <seconds> and <speeds> (-1 for none) are the varints of every move, the commands are written
+    # before the move at their count. First pass sizes the buffer, the second writes it
+    move_count = len(firsts)
+    size = 0
+    for i in range(move_count):
+        size += varintLength(firsts[i]) + varintLength(seconds[i])
+        if speeds[i] >= 0:
+            size += varintLength(speeds[i])
+    for k in range(len(command_words)):
+        size += varintLength(command_words[k])
+        if command_values[k] >= 0:
+            size += varintLength(command_values[k])
+
+    out = np.empty(size, dtype=np.uint8)
+    pos = 0
+    k = 0
+    for i in range(move_count + 1):
+        while k < len(command_words) and command_counts[k] == i:
+            pos = writeVarint(out, pos, command_words[k])
+            if command_values[k] >= 0:
+                pos = writeVarint(out, pos, command_values[k])
+            k += 1
+        if i == move_count:
+            break
+        pos = writeVarint(out, pos, firsts[i])
+        pos = writeVarint(out, pos, seconds[i])
+        if speeds[i] >= 0:
+            pos = writeVarint(out, pos, speeds[i])
+    return out
+
+
+def commandRecord(line):
+    # (opcode word, value or -1) of a line that isn't a move
+    for opcode, text in OPCODES.items():
+        if opcode in VALUE_OPCODES and line.startswith(text):
+            value = int(line[len(text):])
+            if value < 0:
+                raise ValueError(f"Can't encode negative value in step file line: {line}")
+            return (opcode << 2) | 3, value
+        if opcode not in VALUE_OPCODES and line == text:
+            return (opcode << 2) | 3, -1
+    raise ValueError(f"Can't encode step file line: {line}")
+
+
+def encodeSteps(positions, commands, speeds=None) -> bytes:
+    # <positions>, <commands> and <speeds> as plot_simulator.readSteps returns them
+    positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+    deltas = np.diff(positions, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    zigzags = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+    if speeds is None:
+        speeds = np.full(len(positions), np.nan)
+    has_speed = ~np.isnan(speeds)
+    firsts = np.where(has_speed, (zigzags[:, 0] << np.uint64(2)) | np.uint64(1), zigzags[:, 0] << np.uint64(1))
+    move_speeds = np.where(has_speed, np.nan_to_num(speeds), -1).astype(np.int64)
+
+    records = [commandRecord(line) for _, line in commands]
+    command_counts = np.array([count for count, _ in commands], dtype=np.int64)
+    command_words = np.array([word for word, _ in records], dtype=np.int64)
+    command_values = np.array([value for _, value in records], dtype=np.int64)
+
+    body = encodeKernel(firsts, zigzags[:, 1].copy(), move_speeds, command_counts, command_words, command_values)
+    return MAGIC + body.tobytes()
+
+
+def encodeFile(steps_file, output_file):
+    # Writes the binary version of the step file, returns (text size, binary size) in bytes
+    data = encodeSteps(*plot_simulator.readSteps(steps_file))
+    with open(output_file, "wb") as f:
+        f.write(data)
+    with open(steps_file, "rb") as f:
+        text_size = len(f.read())
+    return text_size, len(data)
+
+
+def readVarint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Step data ends in the middle of a record")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value, pos
+        shift += 7
+
+
+def decodeSteps(data):
+    # Reference decoder, returns the lines of the step file. decodeArrays is the fast one
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a binary step file")
+
+    lines = []
+    a = b = 0
+    pos = len(MAGIC)
+    while pos < len(data):
+        word, pos = readVarint(data, pos)
+        if word & 1 == 0:
+            a += unzigzag(word >> 1)
+            second, pos = readVarint(data, pos)
+            b += unzigzag(second)
+            lines.append(f"{a},{b}")
+        elif word & 3 == 1:
+            a += unzigzag(word >> 2)
+            second, pos = readVarint(data, pos)
+            b += unzigzag(second)
+            speed, pos = readVarint(data, pos)
+            lines.append(f"{a},{b},{speed}")
+        else:
+            opcode = word >> 2
+            if opcode not in OPCODES:
+                raise ValueError(f"Unknown opcode {opcode}")
+            if opcode in VALUE_OPCODES:
+                value, pos = readVarint(data, pos)
+                lines.append(f"{OPCODES[opcode]}{value}")
+            else:
+                lines.append(OPCODES[opcode])
+    return lines
+
+
+@njit(cache=True)
+def readVarintAt(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Step data ends in the middle of a record")
+        byte = np.int64(data[pos])
+        pos += 1
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value, pos
+        shift += 7
+
+
+@njit(cache=True)
+def decodeKernel(data, start):
+    # Goes through the records once, like the firmware would. Returns the positions and speeds (-1 for none)
+    # of the moves, and the moves before, opcode and value (-1 for none) of the other lines
+    # Every record takes at least 1 byte and a move at least 2, which sizes the arrays
+    positions = np.empty((max((len(data) - start) // 2, 1), 2), dtype=np.int64)
+    speeds = np.empty(len(positions), dtype=np.int64)
+    command_counts = np.empty(max(len(data) - start, 1), dtype=np.int64)
+    command_opcodes = np.empty(len(command_counts), dtype=np.int64)
+    command_values = np.empty(len(command_counts), dtype=np.int64)
+
+    a = 0
+    b = 0
+    move_count = 0
+    command_count = 0
+    pos = start
+    while pos < len(data):
+        word, pos = readVarintAt(data, pos)
+        if word & 3 == 3:
+            opcode = word >> 2
+            if opcode > OP_MAX_SPEED:
+                raise ValueError("Unknown opcode")
+            value = -1
+            if opcode != OP_PAUSE:
+                value, pos = readVarintAt(data, pos)
+            command_counts[command_count] = move_count
+            command_opcodes[command_count] = opcode
+            command_values[command_count] = value
+            command_count += 1
+            continue
+
+        has_speed = word & 1 == 1
+        first = word >> 2 if has_speed else word >> 1
+        second, pos = readVarintAt(data, pos)
+        a += (first >> 1) ^ -(first & 1)
+        b += (second >> 1) ^ -(second & 1)
+        speed = -1
+        if has_speed:
+            speed, pos = readVarintAt(data, pos)
+        positions[move_count, 0] = a
+        positions[move_count, 1] = b
+        speeds[move_count] = speed
+        move_count += 1
+
+    return (positions[:move_count], speeds[:move_count], command_counts[:command_count],
+            command_opcodes[:command_count], command_values[:command_count])
+
+
+def decodeArrays(data):
+    # Returns (positions, commands, speeds) like plot_simulator.readSteps does for the text file
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a binary step file")
+    positions, speeds, counts, opcodes, values = decodeKernel(np.frombuffer(data, dtype=np.uint8), len(MAGIC))
+    commands = [
+        (int(count), OPCODES[opcode] + (str(value) if opcode in VALUE_OPCODES else ""))
+        for count, opcode, value in zip(counts.tolist(), opcodes.tolist(), values.tolist())
+    ]
+    return positions, commands, np.where(speeds >= 0, speeds, np.nan)
+
+
+def decodeFile(input_file, steps_file):
+    with open(input_file, "rb") as f:
+        lines = decodeSteps(f.read())
+    with open(steps_file, "w") as f:
+        f.writelines(f"{line}\n" for line in lines)
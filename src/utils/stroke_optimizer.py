@@ -0,0 +1,261 @@
+import numpy as np
+from numba import njit
+from scipy.spatial import cKDTree
+
+# Reorders the strokes of a coordinate file (PENUP, start point, PENDOWN, points...) to cut the distance the
+# pen travels while it is up. Strokes can also be drawn backwards. Strokes are only moved inside the
+# PAUSE separated sections, so pen changes still happen after the same strokes.
+# Ordering is nearest neighbour over the stroke end points, improved with 2-opt (reversing a run of strokes
+# also reverses every stroke in it, which keeps the pen down travel the same).
+
+
+def parseStrokes(input_file):
+    # Returns the sections of the file, every section is (list of strokes, ends with PAUSE)
+    # A stroke is the list of its coordinate lines, as they are in the file
+    sections = []
+    strokes = []
+    stroke = None
+    pen_up_point = None
+
+    with open(input_file) as f:
+        for line in f:
+            line = line.strip()
+            if line == "":
+                continue
+            if line == "PAUSE":
+                stroke = None
+                sections.append((strokes, True))
+                strokes = []
+            elif line == "PENUP":
+                stroke = None
+            elif line == "PENDOWN":
+                if stroke is None:
+                    # The pen goes down where it moved to with the pen up
+                    stroke = [pen_up_point] if pen_up_point is not None else []
+                    strokes.append(stroke)
+                    pen_up_point = None
+            elif stroke is not None:
+                stroke.append(line)
+            else:
+                pen_up_point = line
+
+    sections.append((strokes, False))
+    # Strokes that had PENDOWN but no points draw nothing
+    return [([stroke for stroke in strokes if stroke], pause) for strokes, pause in sections]
+
+
+def pointOf(line):
+    values = line.split()
+    return float(values[0]), float(values[1])
+
+
+def strokeEnds(strokes) -> np.ndarray:
+    # (2 * strokes, 2) array, row 2k is the first point of stroke k and row 2k + 1 the last
+    ends = np.empty((2 * len(strokes), 2), dtype=np.float64)
+    for k, stroke in enumerate(strokes):
+        ends[2 * k] = pointOf(stroke[0])
+        ends[2 * k + 1] = pointOf(stroke[-1])
+    return ends
+
+
+def travelDistance(ends, order, flip, origin) -> float:
+    # Pen up distance from <origin> through the strokes in <order>, drawing stroke k backwards when flip[k]
+    if len(order) == 0:
+        return 0.0
+    starts = ends[2 * order + flip[order]]
+    finishes = ends[2 * order + 1 - flip[order]]
+    # Every stroke is started from where the one before it finished
+    previous = np.vstack((np.asarray(origin, dtype=np.float64)[None], finishes[:-1]))
+    return float(np.sqrt(((starts - previous) ** 2).sum(axis=1)).sum())
+
+
+def nearestNeighbourOrder(ends, origin):
+    # Greedy order: from where the pen is, go to the closest unused stroke end, draw that stroke
+    # from that end, and repeat. The tree is rebuilt without the used ends once half of it is used
+    stroke_count = len(ends) // 2
+    order = np.empty(stroke_count, dtype=np.int64)
+    flip = np.zeros(stroke_count, dtype=np.int64)
+    used = np.zeros(stroke_count, dtype=np.bool_)
+
+    live = np.arange(len(ends))
+    tree = cKDTree(ends)
+    used_in_tree = 0
+    position = np.asarray(origin, dtype=np.float64)
+
+    for step in range(stroke_count):
+        if used_in_tree * 2 > len(live):
+            live = live[~used[live // 2]]
+            tree = cKDTree(ends[live])
+            used_in_tree = 0
+
+        k = 8
+        while True:
+            _, found = tree.query(position, k=min(k, len(live)))
+            found = live[np.atleast_1d(found)]
+            free = found[~used[found // 2]]
+            if len(free) or k >= len(live):
+                break
+            k *= 4
+
+        end = free[0]
+        stroke = end // 2
+        order[step] = stroke
+        flip[stroke] = end % 2
+        used[stroke] = True
+        used_in_tree += 2
+        position = ends[2 * stroke + 1 - flip[stroke]]
+
+    return order, flip
+
+
+@njit(cache=True)
+def strokeStart(ends, flip, stroke):
+    return ends[2 * stroke + flip[stroke]]
+
+
+@njit(cache=True)
+def strokeFinish(ends, flip, stroke):
+    return ends[2 * stroke + 1 - flip[stroke]]
+
+
+@njit(cache=True)
+def gap(a, b):
+    return np.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
+
+
+@njit(cache=True)
+def reverseStrokes(order, pos, flip, i, j):
+    # Reverses order[i..j] and the direction of every stroke in it
+    for k in range(i, j + 1):
+        flip[order[k]] = 1 - flip[order[k]]
+    while i < j:
+        a = order[i]
+        b = order[j]
+        order[i] = b
+        pos[b] = i
+        order[j] = a
+        pos[a] = j
+        i += 1
+        j -= 1
+
+
+@njit(cache=True)
+def twoOptStrokes(ends, neighbours, order, flip, origin):
+    # 2-opt over the open stroke path that starts at <origin>: the pen up move after position i and the
+    # move after position m are replaced by finish(i) -> finish(m) and start(i + 1) -> start(m + 1),
+    # by drawing the strokes between them backwards in reverse order. Candidates for m come from the
+    # strokes whose ends are close to finish(i) or start(i + 1). Position -1 is the origin.
+    count = len(order)
+    pos = np.empty(count, dtype=np.int64)
+    for k in range(count):
+        pos[order[k]] = k
+    active = np.ones(count, dtype=np.bool_)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(-1, count - 1):
+            if i >= 0 and not active[order[i]]:
+                continue
+
+            moved = False
+            for side in range(2):
+                # side 0 looks for m with an end close to finish(i), side 1 for m + 1 with an end close
+                # to start(i + 1)
+                if side == 0:
+                    if i < 0:
+                        continue
+                    point = 2 * order[i] + 1 - flip[order[i]]
+                else:
+                    point = 2 * order[i + 1] + flip[order[i + 1]]
+
+                for n in range(neighbours.shape[1]):
+                    candidate = neighbours[point, n] // 2
+                    m = pos[candidate] if side == 0 else pos[candidate] - 1
+                    if m < 0 or m == i:
+                        continue
+                    lo = min(i, m)
+                    hi = max(i, m)
+
+                    finish_lo = origin if lo < 0 else strokeFinish(ends, flip, order[lo])
+                    finish_hi = strokeFinish(ends, flip, order[hi])
+                    start_after_lo = strokeStart(ends, flip, order[lo + 1])
+                    old = gap(finish_lo, start_after_lo)
+                    new = gap(finish_lo, finish_hi)
+                    if hi + 1 < count:
+                        start_after_hi = strokeStart(ends, flip, order[hi + 1])
+                        old += gap(finish_hi, start_after_hi)
+                        new += gap(start_after_lo, start_after_hi)
+
+                    if old - new > 1e-9:
+                        reverseStrokes(order, pos, flip, lo + 1, hi)
+                        if lo >= 0:
+                            active[order[lo]] = True
+                        active[order[lo + 1]] = True
+                        active[order[hi]] = True
+                        if hi + 1 < count:
+                            active[order[hi + 1]] = True
+                        moved = True
+                        improved = True
+                        break
+                if moved:
+                    break
+
+            if not moved and i >= 0:
+                active[order[i]] = False
+    return order, flip
+
+
+def optimizeSection(strokes, origin):
+    # Returns (order, flip) for the strokes of one section, starting from <origin>
+    ends = strokeEnds(strokes)
+    order, flip = nearestNeighbourOrder(ends, origin)
+    if len(strokes) > 2:
+        neighbour_count = min(8, len(ends) - 1)
+        _, neighbours = cKDTree(ends).query(ends, k=neighbour_count + 1, workers=-1)
+        order, flip = twoOptStrokes(ends, neighbours[:, 1:].astype(np.int64), order, flip,
+                                    np.asarray(origin, dtype=np.float64))
+    return order, flip
+
+
+def optimizeStrokes(input_file, output_file):
+    # Rewrites the coordinate file with the strokes reordered, returns the pen up travel (before, after)
+    sections = parseStrokes(input_file)
+    all_strokes = [stroke for strokes, _ in sections for stroke in strokes]
+    if not all_strokes:
+        return 0.0, 0.0
+
+    origin = pointOf(all_strokes[0][0])
+    before_origin = after_origin = origin
+    travel_before = travel_after = 0.0
+    lines = []
+
+    for strokes, pause in sections:
+        if strokes:
+            ends = strokeEnds(strokes)
+            original_order = np.arange(len(strokes))
+            original_flip = np.zeros(len(strokes), dtype=np.int64)
+            travel_before += travelDistance(ends, original_order, original_flip, before_origin)
+            before_origin = ends[-1]
+
+            order, flip = optimizeSection(strokes, after_origin)
+            travel_after += travelDistance(ends, order, flip, after_origin)
+            after_origin = ends[2 * order[-1] + 1 - flip[order[-1]]]
+
+            for stroke_index in order:
+                stroke = strokes[stroke_index]
+                if flip[stroke_index]:
+                    stroke = stroke[::-1]
+                lines.append("PENUP\n")
+                lines.append(f"{stroke[0]}\n")
+                lines.append("PENDOWN\n")
+                lines.extend(f"{line}\n" for line in stroke[1:])
+
+        lines.append("PENUP\n")
+        if pause:
+            lines.append("PAUSE\n")
+
+    with open(output_file, "w") as f:
+        f.writelines(lines)
+
+    return travel_before, travel_after
@@ -1,12 +1,153 @@
 import math
 
+import numpy as np
+
+from src.image_processing.text_format import formatRows
+
 """ ========== TODO ========= """
 """
 detail of the curve image is being lost when converting to steps, floating values getting compressed into ints
 """
 
-def convertToSteps(settings, input_file, output_file, fit=False, min_pen_pickup=False):
-    global s_current_distance
+def mmPerUnit(settings, max_x, max_y, fit=False):
+    # mm on paper per unit of the coordinate file, when convertToSteps scales coordinates up to
+    # <max_x>, <max_y> to the paper. Without fit x and y are scaled differently, the larger one is returned
+    mm_per_step = int(settings["beltToothDistance"]) * int(settings["toothOngear"]) / int(settings["stepsPerRev"])
+    s_paper_dimensions = [
+        round(int(settings["paperSize"][0]) / mm_per_step),
+        round(int(settings["paperSize"][1]) / mm_per_step),
+    ]
+    max_x, max_y = max(max_x, 1), max(max_y, 1)
+    x_scale = s_paper_dimensions[0] / max_x
+    y_scale = s_paper_dimensions[1] / max_y
+    if fit:
+        # Same choice as in convertToSteps, the image is fitted by its width or by its height
+        image_ar = max_x / max_y
+        canvas_ar = s_paper_dimensions[0] / s_paper_dimensions[1]
+        steps_per_unit = x_scale if image_ar >= canvas_ar else y_scale
+    else:
+        steps_per_unit = max(x_scale, y_scale)
+    return steps_per_unit * mm_per_step
+
+
+def readCoordinates(input_file):
+    # Returns the (N, 2) array of the points in the coordinate file, and the PAUSE/PENUP/PENDOWN lines
+    # as a list of (number of points before the line, line)
+    with open(input_file, "r") as f:
+        lines = [line.strip() for line in f.read().split("\n")]
+    lines = [line for line in lines if line]
+    marker_lines = [i for i, line in enumerate(lines) if line in ("PAUSE", "PENUP", "PENDOWN")]
+
+    markers = [(i - k, lines[i]) for k, i in enumerate(marker_lines)]
+    point_lines = lines
+    if marker_lines:
+        marker_set = set(marker_lines)
+        point_lines = [line for i, line in enumerate(lines) if i not in marker_set]
+
+    # Coordinates are cut to whole numbers
+    if not point_lines:
+        return np.zeros((0, 2), dtype=np.int64), markers
+    points = np.loadtxt(point_lines, dtype=np.float64, usecols=(0, 1), ndmin=2).astype(np.int64)
+    return points, markers
+
+
+def coordinateLines(points, markers):
+    # The lines of the coordinate file in order, points as their index in <points>
+    start = 0
+    for point_count, marker in markers:
+        yield from range(start, point_count)
+        yield marker
+        start = point_count
+    yield from range(start, len(points))
+
+
+def beltLengths(positions, s_distance_between_motors) -> np.ndarray:
+    # Lengths of the belts from M1 and M2 to the (N, 2) <positions>, M1 is at (0, 0) and M2 at (distance, 0)
+    return np.column_stack((
+        np.sqrt(positions[:, 0] ** 2 + positions[:, 1] ** 2),
+        np.sqrt((s_distance_between_motors - positions[:, 0]) ** 2 + positions[:, 1] ** 2),
+    ))
+
+
+def penPositions(lengths, s_distance_between_motors) -> np.ndarray:
+    # Where the pen hangs for the (N, 2) belt <lengths>, the inverse of beltLengths
+    x = (lengths[:, 0] ** 2 - lengths[:, 1] ** 2 + s_distance_between_motors ** 2) / (2 * s_distance_between_motors)
+    y = np.sqrt(np.maximum(lengths[:, 0] ** 2 - x ** 2, 0))
+    return np.column_stack((x, y))
+
+
+def chordDeviation(starts, ends, s_distance_between_motors) -> np.ndarray:
+    # Both motors run at a constant speed during a move, so halfway through it the belts are at the
+    # average of their start and end lengths. Returns how far that is from the middle of the straight line
+    lengths = (beltLengths(starts, s_distance_between_motors) + beltLengths(ends, s_distance_between_motors)) / 2
+    middle = penPositions(lengths, s_distance_between_motors)
+    return np.sqrt(((middle - (starts + ends) / 2) ** 2).sum(axis=1))
+
+
+def subdivisionCounts(starts, ends, s_distance_between_motors, max_deviation, max_rounds=8) -> np.ndarray:
+    # Number of pieces every segment has to be cut into so no piece bends more than <max_deviation>
+    # away from the straight line. The bend shrinks with the square of the piece length, which gives
+    # the first guess. Pieces near the motors bend more than the middle one, so segments are checked
+    # piece by piece and cut further until they all fit
+    counts = np.maximum(np.ceil(np.sqrt(chordDeviation(starts, ends, s_distance_between_motors) / max_deviation)), 1)
+    counts = counts.astype(np.int64)
+
+    check = np.flatnonzero(counts > 1)
+    for _ in range(max_rounds):
+        if len(check) == 0:
+            break
+        # Every piece of the segments in <check>
+        segment = np.repeat(check, counts[check])
+        piece = np.arange(len(segment)) - np.repeat(np.cumsum(counts[check]) - counts[check], counts[check])
+        step = (ends[segment] - starts[segment]) / counts[segment, None]
+        piece_starts = starts[segment] + step * piece[:, None]
+        deviation = chordDeviation(piece_starts, piece_starts + step, s_distance_between_motors)
+
+        worst = np.zeros(len(counts))
+        np.maximum.at(worst, segment, deviation)
+        check = check[worst[check] > max_deviation]
+        counts[check] = np.maximum(np.ceil(counts[check] * np.sqrt(worst[check] / max_deviation)), counts[check] + 1)
+    return counts
+
+
+def subdivide(positions, drawn, s_distance_between_motors, max_deviation):
+    # Adds points along the segments between <positions> that are drawn (drawn[i] for the segment from
+    # point i to point i + 1) and would bend more than <max_deviation>.
+    # Returns the new positions and the index in them of every original point, the points added to a
+    # segment come right before the point it ends at
+    counts = np.ones(len(positions) - 1, dtype=np.int64)
+    segments = np.flatnonzero(drawn)
+    if len(segments):
+        counts[segments] = subdivisionCounts(
+            positions[segments], positions[segments + 1], s_distance_between_motors, max_deviation)
+    point_index = np.concatenate(([0], np.cumsum(counts)))
+    if point_index[-1] == len(positions) - 1:
+        return positions, point_index
+
+    # Segment and fraction of it for every new position, 0 is its start point
+    segment = np.repeat(np.arange(len(counts)), counts)
+    fraction = (np.arange(len(segment)) - np.repeat(point_index[:-1], counts)) / counts[segment]
+    new_positions = np.empty((len(segment) + 1, 2))
+    new_positions[:-1] = positions[segment] + (positions[segment + 1] - positions[segment]) * fraction[:, None]
+    # The original points keep their exact positions
+    new_positions[point_index] = positions
+    return new_positions, point_index
+
+
+def penDownSegments(point_count, markers) -> np.ndarray:
+    # drawn[i] is True when the pen is down on the way from point i to point i + 1
+    # Wave and tour coordinates have no PENDOWN lines, they are one line drawn from start to end
+    changes = [(count, line == "PENDOWN") for count, line in markers if line in ("PENUP", "PENDOWN")]
+    if not any(down for _, down in changes):
+        return np.ones(max(point_count - 1, 0), dtype=np.bool_)
+    change_counts = np.array([count for count, _ in changes])
+    change_down = np.array([down for _, down in changes])
+    # The last pen change before point i + 1, the pen starts up
+    last_change = np.searchsorted(change_counts, np.arange(1, point_count), side="right") - 1
+    return np.where(last_change >= 0, change_down[last_change], False)
+
+
+def convertToSteps(settings, input_file, output_file, fit=False, min_pen_pickup=False, max_deviation=None):
     # mm | Distance between each tooth on the belt
     mm_belt_tooth_distance = int(settings["beltToothDistance"])
     tooth_on_gear = int(settings["toothOngear"])
@@ -46,8 +187,6 @@ def convertToSteps(settings, input_file, output_file, fit=False, min_pen_pickup=
         ),
     ]
 
-    s_current_distance = s_start_distance
-
     """
     M1 -------------------------------------------------------------- M2
      \                                                                /
@@ -85,47 +224,8 @@ def convertToSteps(settings, input_file, output_file, fit=False, min_pen_pickup=
                                      \/
     """
 
-    imgs = []
-    f = open(input_file, "r")
-    max_x = 0
-    max_y = 0
-
-    for line in f:
-        line = line.strip()
-        if line == "PAUSE":
-            imgs.append("PAUSE")
-        elif line == "PENUP":
-            imgs.append("PENUP")
-        elif line == "PENDOWN":
-            imgs.append("PENDOWN")
-        else:
-            line = line.split()
-            x, y = int(float(line[0])), int(float(line[1]))
-            imgs.append([x, y])
-            if x > max_x:
-                max_x = x
-            if y > max_y:
-                max_y = y
-    f.close()
-
-    def remap(x, in_min, in_max, out_min, out_max):
-        return (x - in_min) * (out_max - out_min) // (in_max - in_min) + out_min
-
-    def calculate(img):
-        global s_current_distance
-
-        s_new_distance = [
-            (math.sqrt(img[0] ** 2 + img[1] ** 2)),
-            (math.sqrt((s_distance_between_motors - img[0]) ** 2 + img[1] ** 2)),
-        ]
-
-        s_change = [
-            round(s_current_distance[0] - s_new_distance[0]),
-            round(s_current_distance[1] - s_new_distance[1]),
-        ]
-
-        s_current_distance = [round(s_new_distance[0]), round(s_new_distance[1])]
-        return s_change
+    points, markers = readCoordinates(input_file)
+    max_x, max_y = (int(value) for value in points.max(axis=0, initial=0))
 
     image_offset = [0, 0]
     new_max = [s_paper_dimensions[0], s_paper_dimensions[1]]
@@ -146,62 +246,57 @@ def convertToSteps(settings, input_file, output_file, fit=False, min_pen_pickup=
             new_max = [max_x * (s_paper_dimensions[1] / max_y), s_paper_dimensions[1]]
             image_offset = [(s_paper_dimensions[0] / 2) - (new_max[0] / 2), 0]
 
-    def writePos(pos, f, s_motor_current_offset, last_written_pos):
-        pos = [
-            remap(
-                pos[0],
-                0,
-                max_x,
-                s_paper_offset_calculated[0],
-                s_paper_offset_calculated[0] + new_max[0],
-            )
-            + image_offset[0],
-            remap(
-                pos[1],
-                0,
-                max_y,
-                s_paper_offset_calculated[1],
-                s_paper_offset_calculated[1] + new_max[1],
-            )
-            + image_offset[1],
-        ]
-
-        values = calculate(pos)
-
-        s_motor_current_offset = [
-            round(s_motor_current_offset[0] + values[0]),
-            round(s_motor_current_offset[1] + values[1]),
-        ]
-
-        uno_input = (
-            str(s_motor_current_offset[0] * motor_dir[0])
-            + ","
-            + str(s_motor_current_offset[1] * motor_dir[1])
-            + "\n"
-        )
-        if uno_input == last_written_pos:
-            return s_motor_current_offset, last_written_pos
-
-        f.write(uno_input)
-        return s_motor_current_offset, uno_input
-
-    s_motor_current_offset = [0, 0]
+    # Remap the points onto the paper: (x - 0) * (out_max - out_min) // (max_x - 0) + out_min, for x and y
+    out_min = np.array(s_paper_offset_calculated)
+    out_span = np.array([
+        (s_paper_offset_calculated[0] + new_max[0]) - s_paper_offset_calculated[0],
+        (s_paper_offset_calculated[1] + new_max[1]) - s_paper_offset_calculated[1],
+    ])
+    positions = points * out_span // np.array([max_x, max_y]) + out_min + np.array(image_offset)
+
+    # With both motors moving at a constant speed the pen draws a curve instead of a straight line.
+    # Segments where the curve is more than <max_deviation> mm off get extra points along the line,
+    # point_index[i] is where point i ended up. With min pen pickup some pen up moves are drawn, so all
+    # moves are checked
+    point_index = np.arange(len(positions))
+    if max_deviation and len(positions) > 1:
+        if min_pen_pickup:
+            drawn = np.ones(len(positions) - 1, dtype=np.bool_)
+        else:
+            drawn = penDownSegments(len(positions), markers)
+        positions, point_index = subdivide(positions, drawn, s_distance_between_motors, max_deviation / mm_per_step)
+
+    # Belt lengths from M1 and M2 to every position, in steps
+    s_lengths = beltLengths(positions, s_distance_between_motors)
+    # The motors have moved start - length steps to get to a point. Every offset comes from the rounded
+    # length of its own point, so the rounding errors of the moves before it don't add up
+    s_motor_offsets = (np.array(s_start_distance) - np.rint(s_lengths).astype(np.int64)) * np.array(motor_dir)
+
+    # A point that gives the same steps as the point before it isn't written again
+    written = np.ones(len(s_motor_offsets), dtype=np.bool_)
+    written[1:] = (s_motor_offsets[1:] != s_motor_offsets[:-1]).any(axis=1)
+    # The lines of point i and the points added before it are step_lines[line_start[i]:line_start[i + 1]]
+    line_start = np.concatenate(([0], np.cumsum(written)))[np.concatenate(([0], point_index + 1))].tolist()
+    step_lines = formatRows(s_motor_offsets[written], separator=",").splitlines(keepends=True)
+
+    def writePos(point, f):
+        f.write("".join(step_lines[line_start[point]:line_start[point + 1]]))
+
     f = open(output_file, "w")
 
     min_dist_for_servo = 20
     pen_down = False
-    last_pos = [0, 0]
+    last_pos = 0
     last_line = None
     first = True
     hit_penup = False
 
     raw_penup_counter = 0
     processed_penup_counter = 0
-    last_written_pos = ""
 
     f.write("PENUP:45\n")
     if min_pen_pickup:
-        for line in imgs:
+        for line in coordinateLines(points, markers):
             if line == "PAUSE":
                 f.write(f"{line}\n")
                 continue
@@ -221,7 +316,7 @@ def convertToSteps(settings, input_file, output_file, fit=False, min_pen_pickup=
                 last_line = line
                 continue
             if first:
-                s_motor_current_offset, last_written_pos = writePos(line, f, s_motor_current_offset, last_written_pos)
+                writePos(line, f)
                 last_pos = line
                 first = False
                 last_line = line
@@ -234,39 +329,43 @@ def convertToSteps(settings, input_file, output_file, fit=False, min_pen_pickup=
                 continue
             if hit_penup:
                 hit_penup = False
-                dist = math.sqrt((line[0] - last_pos[0])**2 + (line[1] - last_pos[1])**2)
-                if (dist > min_dist_for_servo) or (line[0] == 0 or line[0] == max_x or line[1] == 0 or line[1] == max_y):
+                x, y = points[line]
+                last_x, last_y = points[last_pos]
+                dist = math.sqrt((x - last_x)**2 + (y - last_y)**2)
+                if (dist > min_dist_for_servo) or (x == 0 or x == max_x or y == 0 or y == max_y):
                     f.write("PENUP:45\n")
                     processed_penup_counter += 1
-                    s_motor_current_offset, last_written_pos = writePos(line, f, s_motor_current_offset, last_written_pos)
+                    writePos(line, f)
                     last_pos = line
                     last_line = line
                     pen_down = False
                     continue
                 else:
-                    s_motor_current_offset, last_written_pos = writePos(line, f, s_motor_current_offset, last_written_pos)
+                    writePos(line, f)
                     last_pos = line
                     last_line = line
                     continue
-            s_motor_current_offset, last_written_pos = writePos(line, f, s_motor_current_offset, last_written_pos)
+            writePos(line, f)
             last_pos = line
             last_line = line
         output_txt = f"Finished-\nRaw penups: {raw_penup_counter} Processed penups: {processed_penup_counter}"
 
     else:
-        for line in imgs:
+        # Points between two marker lines are written in one go
+        start = 0
+        for point_count, line in markers + [(len(points), None)]:
+            f.write("".join(step_lines[line_start[start]:line_start[point_count]]))
+            start = point_count
             if line == "PAUSE":
                 f.write(f"{line}\n")
-                continue
-            if line == "PENUP":
+            elif line == "PENUP":
                 f.write(f"{line}:45\n")
-                continue
-            if line == "PENDOWN":
+            elif line == "PENDOWN":
                 f.write(f"{line}:0\n")
-                continue
-            s_motor_current_offset, last_written_pos = writePos(line, f, s_motor_current_offset, last_written_pos)
         output_txt = "Finished"
 
     f.write("PENUP:45\n")
     f.close()
+    if len(positions) > len(points):
+        output_txt += f"\nAdded {len(positions) - len(points)} points to lines that bend more than {max_deviation} mm"
     return output_txt
@@ -0,0 +1,408 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numba
+import numpy as np
+from numba import njit, prange
+from scipy.spatial import cKDTree
+
+from src.image_processing.text_format import formatRows
+
+# Built-in replacement for linkern.exe: a space filling curve tour improved with 2-opt and Or-opt moves
+# over KD-tree neighbour lists. Reads the nodes of image.tsp and writes image.cyc in the same format as
+# linkern, so path_maker works on the output of either.
+#
+# The tour is split into chunks of consecutive positions that are improved in parallel, the end points of
+# every chunk stay in place. Each round the tour is rotated by half a chunk so the next round can improve
+# the edges that sat on the chunk borders.
+
+# Gains smaller than this are rounding noise, not an improvement
+min_gain = 1e-7
+# Positions on either side of a chunk border whose cities are looked at again after a round of local repairs
+border_window = 32
+
+
+def hilbertOrder(points) -> np.ndarray:
+    # Order of the points along a Hilbert curve over their bounding box, close points get close positions
+    coords = (points - points.min(axis=0)).astype(np.int64)
+    order = max(int(coords.max(initial=0)).bit_length(), 1)
+    side = 1 << order
+
+    x = coords[:, 0].copy()
+    y = coords[:, 1].copy()
+    d = np.zeros(len(points), dtype=np.int64)
+    s = side // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+
+        # Rotate the quadrant so the curve continues in the right direction
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s //= 2
+
+    return np.argsort(d, kind="stable")
+
+
+def neighbourLists(points, neighbour_count=8) -> np.ndarray:
+    # The <neighbour_count> nearest other points of every point, closest first
+    neighbour_count = min(neighbour_count, len(points) - 1)
+    if neighbour_count <= 0:
+        return np.zeros((len(points), 0), dtype=np.int64)
+    _, neighbours = cKDTree(points).query(points, k=neighbour_count + 1, workers=-1)
+    return neighbours[:, 1:].astype(np.int64)
+
+
+@njit(cache=True)
+def distance(points, a, b):
+    dx = points[a, 0] - points[b, 0]
+    dy = points[a, 1] - points[b, 1]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+@njit(cache=True)
+def reverse(tour, pos, i, j):
+    # Reverses tour[i..j]
+    while i < j:
+        a = tour[i]
+        b = tour[j]
+        tour[i] = b
+        pos[b] = i
+        tour[j] = a
+        pos[a] = j
+        i += 1
+        j -= 1
+
+
+@njit(cache=True)
+def twoOptMove(tour, pos, points, neighbours, active, lo, hi, i):
+    # Tries to replace one of the two edges of tour[i] and an edge of a neighbour with two shorter edges,
+    # makes the first improving move and returns True
+    a = tour[i]
+    for direction in range(2):
+        # direction 0 uses the edge to the next city, 1 the edge to the previous city
+        other = i + 1 if direction == 0 else i - 1
+        if other < lo or other >= hi:
+            continue
+        b = tour[other]
+        d_ab = distance(points, a, b)
+
+        for k in range(neighbours.shape[1]):
+            c = neighbours[a, k]
+            d_ac = distance(points, a, c)
+            if d_ac >= d_ab:
+                break
+            j = pos[c]
+            other_j = j + 1 if direction == 0 else j - 1
+            if j < lo or j >= hi or other_j < lo or other_j >= hi or j == i:
+                continue
+            d = tour[other_j]
+
+            gain = d_ab + distance(points, c, d) - d_ac - distance(points, b, d)
+            if gain > min_gain:
+                if direction == 0:
+                    if j > i:
+                        reverse(tour, pos, i + 1, j)
+                    else:
+                        reverse(tour, pos, j + 1, i)
+                else:
+                    if j > i:
+                        reverse(tour, pos, i, j - 1)
+                    else:
+                        reverse(tour, pos, j, i - 1)
+                active[a] = True
+                active[b] = True
+                active[c] = True
+                active[d] = True
+                return True
+    return False
+
+
+@njit(cache=True)
+def orOptMove(tour, pos, points, neighbours, active, lo, hi, i):
+    # Tries to move the 1 to 3 cities starting at tour[i] between two other cities close to them,
+    # either way round. Makes the first improving move and returns True
+    segment = np.empty(3, dtype=tour.dtype)
+    for length in range(1, 4):
+        if i - 1 < lo or i + length >= hi:
+            break
+        first = tour[i]
+        last = tour[i + length - 1]
+        before = tour[i - 1]
+        after = tour[i + length]
+        removal_gain = (distance(points, before, first) + distance(points, last, after)
+                        - distance(points, before, after))
+        if removal_gain <= min_gain:
+            continue
+
+        for end in range(2):
+            city = first if end == 0 else last
+            for k in range(neighbours.shape[1]):
+                c = neighbours[city, k]
+                if distance(points, city, c) >= removal_gain:
+                    break
+                j = pos[c]
+                if j < lo or j >= hi or (j >= i and j < i + length):
+                    continue
+
+                # The segment goes between tour[x] and tour[x + 1], on either side of c
+                for x in range(j - 1, j + 1):
+                    if x < lo or x + 1 >= hi or (x >= i - 1 and x <= i + length - 1):
+                        continue
+                    p = tour[x]
+                    q = tour[x + 1]
+                    base = distance(points, p, q)
+                    forward = distance(points, p, first) + distance(points, last, q) - base
+                    backward = distance(points, p, last) + distance(points, first, q) - base
+                    flip = backward < forward
+                    insert_cost = backward if flip else forward
+                    if removal_gain - insert_cost <= min_gain:
+                        continue
+
+                    for s in range(length):
+                        segment[s] = tour[i + length - 1 - s] if flip else tour[i + s]
+                    if x > i:
+                        # Cities between the segment and the gap move back
+                        for t in range(i + length, x + 1):
+                            tour[t - length] = tour[t]
+                            pos[tour[t - length]] = t - length
+                        start = x - length + 1
+                    else:
+                        # Cities between the gap and the segment move forward
+                        for t in range(i - 1, x, -1):
+                            tour[t + length] = tour[t]
+                            pos[tour[t + length]] = t + length
+                        start = x + 1
+                    for s in range(length):
+                        tour[start + s] = segment[s]
+                        pos[segment[s]] = start + s
+
+                    active[before] = True
+                    active[after] = True
+                    active[p] = True
+                    active[q] = True
+                    active[first] = True
+                    active[last] = True
+                    return True
+    return False
+
+
+@njit(cache=True)
+def optimizeChunk(tour, pos, points, neighbours, active, lo, hi):
+    # Improves tour[lo:hi] until no move helps, tour[lo] and tour[hi - 1] stay in place. Returns the move count
+    moves = 0
+    improved = True
+    while improved:
+        improved = False
+        for i in range(lo, hi):
+            a = tour[i]
+            if not active[a]:
+                continue
+            if twoOptMove(tour, pos, points, neighbours, active, lo, hi, i):
+                moves += 1
+                improved = True
+            elif orOptMove(tour, pos, points, neighbours, active, lo, hi, i):
+                moves += 1
+                improved = True
+            else:
+                active[a] = False
+    return moves
+
+
+@njit(parallel=True, cache=True)
+def optimizeChunks(tour, pos, points, neighbours, active, bounds):
+    # Chunks only move their own cities inside their own positions, so they can run at the same time
+    moves = np.zeros(len(bounds) - 1, dtype=np.int64)
+    for k in prange(len(bounds) - 1):
+        moves[k] = optimizeChunk(tour, pos, points, neighbours, active, bounds[k], bounds[k + 1])
+    return moves.sum()
+
+
+def tourLength(points, tour) -> float:
+    # Length of the closed tour
+    if len(tour) < 2:
+        return 0.0
+    path = points[tour]
+    return float(np.sqrt((np.diff(path, axis=0, append=path[:1]) ** 2).sum(axis=1)).sum())
+
+
+def improveTour(points, tour, neighbours, closed=True, active=None, chunk_size=50000, max_rounds=20,
+                time_limit=None, progress=None) -> np.ndarray:
+    # Runs rounds of optimizeChunks over <tour> until two rounds in a row make no moves
+    # A closed tour is rotated between rounds to move the chunk borders, an open path keeps its two end
+    # cities in place and moves the inner chunk borders instead.
+    # Without <active> every city is looked at each round, with it only the given cities and the chunk
+    # borders are, which keeps repairs local.
+    count = len(tour)
+    pos = np.empty(count, dtype=np.int64)
+    look_everywhere = active is None
+    if look_everywhere:
+        active = np.ones(count, dtype=np.bool_)
+
+    # At least one chunk per thread, and chunks short enough that moving cities inside one stays cheap
+    chunk_count = max(numba.get_num_threads(), -(-count // chunk_size))
+    chunk_count = min(chunk_count, max(count // 16, 1))
+    bounds = np.linspace(0, count, chunk_count + 1).astype(np.int64)
+    shift = max(count // chunk_count // 2, 1)
+    shifted_bounds = np.concatenate(([0], bounds[1:-1] - shift, [count])) if chunk_count > 1 else bounds
+
+    start_time = time.time()
+    idle_rounds = 0
+    for round_index in range(max_rounds):
+        round_bounds = shifted_bounds if not closed and round_index % 2 else bounds
+        pos[tour] = np.arange(count)
+        if not look_everywhere:
+            was_active = active.copy()
+        moves = optimizeChunks(tour, pos, points, neighbours, active, round_bounds)
+
+        if progress:
+            progress(round_index + 1, max_rounds)
+
+        # One round without moves leaves only the chunk borders to check, which the next round covers
+        idle_rounds = idle_rounds + 1 if moves == 0 else 0
+        if idle_rounds >= 2:
+            break
+        if time_limit is not None and time.time() - start_time > time_limit:
+            break
+
+        # Let the cities be looked at again now that their surroundings changed. The ones on the chunk borders
+        # of this round couldn't be moved, and the ones close to them may have had their move cut off by the
+        # border, so they are looked at again too if they were before. Then move the chunk borders
+        if look_everywhere:
+            active[:] = True
+        else:
+            border_cities = tour[(round_bounds[1:-1, None] + np.arange(-border_window, border_window)) % count]
+            active[border_cities[was_active[border_cities]]] = True
+            active[tour[np.maximum(round_bounds[1:-1] - 1, 0)]] = True
+            active[tour[round_bounds[1:-1]]] = True
+        if closed:
+            tour = np.roll(tour, -shift)
+
+    if progress:
+        progress(max_rounds, max_rounds)
+
+    return tour
+
+
+def solve(points, chunk_size=50000, neighbour_count=8, max_rounds=20, time_limit=None, progress=None,
+          ends=None) -> np.ndarray:
+    # Returns the order to visit <points> in as a closed tour
+    # With <ends> = (first, last) it is an open path that starts at point first and finishes at point last
+    # <progress> is called with (rounds done, max_rounds)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    count = len(points)
+    if count == 0:
+        # An all white dither or a tiny stipple has nothing to visit
+        return np.zeros(0, dtype=np.int64)
+    tour = hilbertOrder(points).astype(np.int64)
+    if ends is not None:
+        first, last = ends
+        tour = tour[(tour != first) & (tour != last)]
+        tour = np.concatenate(([first], tour, [last] if last != first else [])).astype(np.int64)
+    if count < 5:
+        return tour
+
+    neighbours = neighbourLists(points, neighbour_count)
+    return improveTour(points, tour, neighbours, closed=ends is None, chunk_size=chunk_size,
+                       max_rounds=max_rounds, time_limit=time_limit, progress=progress)
+
+
+def solveTile(task) -> np.ndarray:
+    # Runs in a worker process of solvePartitioned, the processes already use every core
+    points, ends = task
+    numba.set_num_threads(1)
+    return solve(points, ends=ends)
+
+
+def tileEnds(points, tile_indices, tile_order, centroids):
+    # Picks where the path enters and leaves every tile: it leaves at the point closest to the centroid of
+    # the next tile, and enters at the point closest to where it left the previous tile
+    exits = {}
+    for k, tile in enumerate(tile_order):
+        next_centroid = centroids[tile_order[(k + 1) % len(tile_order)]]
+        tile_points = points[tile_indices[tile]]
+        exits[tile] = int(np.argmin(((tile_points - next_centroid) ** 2).sum(axis=1)))
+
+    ends = {}
+    for k, tile in enumerate(tile_order):
+        previous = tile_order[k - 1]
+        previous_exit = points[tile_indices[previous][exits[previous]]]
+        tile_points = points[tile_indices[tile]]
+        distances = ((tile_points - previous_exit) ** 2).sum(axis=1)
+        if len(tile_points) > 1:
+            # Entering and leaving at the same point would leave the path nowhere to go
+            distances[exits[tile]] = np.inf
+        ends[tile] = (int(np.argmin(distances)), exits[tile])
+    return ends
+
+
+def solvePartitioned(points, tile_size=100000, workers=None, progress=None) -> np.ndarray:
+    # For very large point sets: the points are split into a grid of tiles of about <tile_size> points,
+    # the tiles are put in order by a tour of their centroids, and every tile is solved as an open path
+    # in its own process, from where the previous tile left off to the side facing the next tile.
+    # The joined tour is then repaired around the joins.
+    # <progress> is called with (tiles done + 1, tiles + 1)
+    points = np.asarray(points, dtype=np.float64)
+    count = len(points)
+    if count <= tile_size:
+        return solve(points, progress=progress)
+
+    # Grid with square-ish tiles
+    low = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - low, 1)
+    tile_count = -(-count // tile_size)
+    columns = max(int(round(np.sqrt(tile_count * extent[0] / extent[1]))), 1)
+    rows = max(-(-tile_count // columns), 1)
+    column = np.minimum(((points[:, 0] - low[0]) / extent[0] * columns).astype(np.int64), columns - 1)
+    row = np.minimum(((points[:, 1] - low[1]) / extent[1] * rows).astype(np.int64), rows - 1)
+    tile_ids = row * columns + column
+
+    sorted_indices = np.argsort(tile_ids, kind="stable")
+    tiles, tile_starts = np.unique(tile_ids[sorted_indices], return_index=True)
+    tile_indices = dict(zip(tiles.tolist(), np.split(sorted_indices, tile_starts[1:])))
+    centroids = {tile: points[indices].mean(axis=0) for tile, indices in tile_indices.items()}
+
+    tile_list = list(tile_indices)
+    coarse_tour = solve(np.array([centroids[tile] for tile in tile_list]))
+    tile_order = [tile_list[k] for k in coarse_tour]
+    ends = tileEnds(points, tile_indices, tile_order, centroids)
+
+    tasks = [(points[tile_indices[tile]], ends[tile]) for tile in tile_order]
+    paths = []
+    # Forking after numba started its threading layer (the centroid tour above, or any solve before this one)
+    # leaves the interpreter hanging at exit, spawned workers start clean
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        for tile, path in zip(tile_order, executor.map(solveTile, tasks)):
+            paths.append(tile_indices[tile][path])
+            if progress:
+                progress(len(paths), len(tile_order) + 1)
+    tour = np.concatenate(paths)
+
+    # 2-opt and Or-opt only around the joins, where the tile paths were not optimised together
+    join_window = 32
+    active = np.zeros(count, dtype=np.bool_)
+    join_positions = np.cumsum([len(path) for path in paths])
+    for position in join_positions:
+        active[tour[np.arange(position - join_window, position + join_window) % count]] = True
+    tour = improveTour(points, tour, neighbourLists(points), active=active)
+
+    if progress:
+        progress(len(tile_order) + 1, len(tile_order) + 1)
+    return tour
+
+
+def writeCyc(cyc_path, points, tour) -> None:
+    # Writes the tour like linkern does: "<count> <count>", then "<from> <to> <distance>" for every edge
+    tour = np.asarray(tour, dtype=np.int64)
+    following = np.roll(tour, -1)
+    delta = np.asarray(points, dtype=np.float64)[following] - np.asarray(points, dtype=np.float64)[tour]
+    distances = np.rint(np.sqrt((delta ** 2).sum(axis=1))).astype(np.int64)
+
+    with open(cyc_path, "w") as f:
+        f.write(f"{len(tour)} {len(tour)}\n")
+        f.write(formatRows(np.column_stack((tour, following, distances))))
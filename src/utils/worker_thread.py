@@ -1,18 +1,34 @@
+import os
+import queue
+import threading
 import time
 import subprocess
-import numpy as np
 
+import numpy as np
 from PyQt5.QtCore import QThread, pyqtSignal
-from PIL import Image, ImageDraw
+from PIL import Image
+
+from src.image_processing import background_removal, dithering, quantize, stippling, wave_generator
+from . import FunctionTypeEnum, constants, path_maker, stroke_optimizer, tsp_solver
+from .convergence import ConvergenceMonitor
+from .progress import ProgressReporter
+
 
-from src.image_processing import dithering, wave_smoother, wave_smoother_standalone
-from . import FunctionTypeEnum, constants
+def readLines(stream, lines) -> None:
+    # Puts every line of <stream> in the <lines> queue, then None when it ends
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
 
 
 class WorkerThread(QThread):
     # Runs lengthy functions on a separate "worker thread" so the gui doesn't freeze
     # function_signal is "emited" to set the right function to run (eg. linkern, wave, dithering)
     update_signal = pyqtSignal(str)
+    # (fraction done, estimated seconds left), see ProgressReporter
+    progress_signal = pyqtSignal(float, float)
+    # (seconds, best tour length, improvement over the plateau window or -1), see ConvergenceMonitor
+    convergence_signal = pyqtSignal(float, float, float)
     finish_signal = pyqtSignal()
     image_signal = pyqtSignal()
 
@@ -22,6 +38,15 @@ class WorkerThread(QThread):
         self.image = None
         self.function_type = None
         self.wave_smooth = None
+        self.node_budget = None
+        self.quantize_levels = None
+        self.bg_low_resolution = None
+        self.builtin_solver = None
+        self.partition_tsp = None
+        self.time_budget = None
+        self.plateau_improvement = None
+        # StageCache shared with the window, None runs every stage
+        self.stage_cache = None
 
     def run(self):
         # Called by QThread automatically when WorkerThread.start() is called
@@ -29,118 +54,76 @@ class WorkerThread(QThread):
             self.image = self.wave(self.image)
             self.image_signal.emit()
         elif self.function_type == FunctionTypeEnum.LINKERN:
-            self.linkern()
-        elif self.function_type == FunctionTypeEnum.DITHER:
+            self.tour()
+        elif self.function_type in (FunctionTypeEnum.DITHER, FunctionTypeEnum.ORDERED_DITHER,
+                                    FunctionTypeEnum.BLUE_NOISE_DITHER, FunctionTypeEnum.STIPPLE):
             self.image = self.dither(self.image)
             self.image_signal.emit()
+        elif self.function_type == FunctionTypeEnum.QUANTIZE:
+            self.image = self.quantize(self.image)
+            self.image_signal.emit()
+        elif self.function_type == FunctionTypeEnum.OPTIMIZE_STROKES:
+            self.optimizeStrokes()
+        elif self.function_type == FunctionTypeEnum.REMOVE_BG:
+            self.image = self.removeBg(self.image)
+            self.image_signal.emit()
+
+    def progressReporter(self) -> ProgressReporter:
+        # Reports are only made when something is connected to progress_signal
+        if self.receivers(self.progress_signal) == 0:
+            return ProgressReporter()
+        return ProgressReporter(self.progress_signal.emit)
+
+    def cachedStage(self, key, outputs):
+        # Copies the outputs of a stage that already ran on the same input from the cache, returns its info
+        # or None when the stage has to run
+        if self.stage_cache is None:
+            return None
+        info = self.stage_cache.fetch(key, outputs)
+        if info is not None:
+            self.update_signal.emit(f"Using the cached result of {key.split('-')[0]}")
+            self.update_signal.emit(self.stage_cache.formatStats())
+        return info
+
+    def storeStage(self, key, outputs, info=None) -> None:
+        if self.stage_cache is not None:
+            self.stage_cache.store(key, outputs, info)
+            self.update_signal.emit(self.stage_cache.formatStats())
+
+    def imageKey(self, stage, image, params):
+        # Key of a stage that runs on the pixels of <image>
+        if self.stage_cache is None:
+            return None
+        params = dict(params, size=image.size, mode=image.mode)
+        return self.stage_cache.key(stage, blobs=[image.tobytes()], params=params)
+
+    def cachedPreview(self) -> Image:
+        with Image.open(constants.PREVIEW_PATH) as preview:
+            return preview.copy()
 
     def wave(self, image: Image) -> Image:
         # Converts the image to waves
         if not image:
             return None
 
-        f = open(constants.OUTPUT_COODINATES_PATH, "w")
-
         self.update_signal.emit("Starting conversion to wave")
         start_time = time.time()
 
-        # Range of wave values: 0 = horizontal line, max = dense wave - hight amplitude and frequency
-        scaled_colour_range = 10
-        pixel_wave_size = 20
-
-        max_amplitude = pixel_wave_size / 2
-
-        pixels = np.array(image)
-        height, width = pixels.shape
-
-        if self.wave_smooth:
-            wave_function_arr = wave_smoother.genWave(
-                pixels
-            )
-
-            processed_wave = wave_smoother_standalone.process(wave_function_arr)
-            processed_height, processed_width = len(processed_wave) * pixel_wave_size, len(
-                processed_wave[0]
-            )
-
-            image = Image.new("RGB", (processed_width, processed_height), color="white")
-            draw = ImageDraw.Draw(image)
-
-            for y in range(len(processed_wave)):
-                for x in range(processed_width-1):
-                    self.update_signal.emit(
-                        f"{str((y*width)+int(x/pixel_wave_size)+1)}/{str(height*width)}, {str(round(time.time() - start_time, 3))}"
-                    )
-
-                    y_offset = y * pixel_wave_size + pixel_wave_size / 2
-                    draw.line(((x, y_offset + processed_wave[y][x]), (x+1, y_offset + processed_wave[y][x+1])), fill=(0, 0, 0))
-
-                    f.write(str(x) + " " + str(round(y_offset + processed_wave[y][x])) + "\n")
-
-            f.close()
-            self.result = (f"\nTotal run time: {round(time.time() - start_time, 3)} seconds\n")
+        key = self.imageKey("wave", image, {"smooth": bool(self.wave_smooth)})
+        outputs = {constants.OUTPUT_COORDINATES_TXT: constants.OUTPUT_COODINATES_PATH,
+                   constants.PREVIEW_PNG: constants.PREVIEW_PATH}
+        if self.cachedStage(key, outputs) is not None:
+            self.result = f"\nTotal run time: {round(time.time() - start_time, 3)} seconds\n"
             self.finish_signal.emit()
+            return self.cachedPreview()
 
-            return image
-
-        new_height, new_width = height * pixel_wave_size, width * pixel_wave_size
-
-        image = Image.new("RGB", (new_width, new_height), color="white")
-        draw = ImageDraw.Draw(image)
+        image = wave_generator.applyWave(
+            image, constants.OUTPUT_COODINATES_PATH, smooth=self.wave_smooth, progress=self.progressReporter()
+        )
+        if key is not None:
+            image.save(constants.PREVIEW_PATH)
+            self.storeStage(key, outputs)
 
-        for y in range(height):
-            for x in range(width):
-                self.update_signal.emit(
-                    f"{str((y*width)+x)}/{str(height*width-1)}, {str(round(time.time() - start_time, 3))}"
-                )
-                n_x = x
-                # Every other y level needs to start from the end so the other of the horizontal lines is: left-right-right-left...
-                if y % 2 != 0:
-                    n_x = width - 1 - x
-                amplitude = 0
-                frequency = 0
-
-                pixels[y, n_x] = round(
-                    pixels[y, n_x] / ((2**8)/scaled_colour_range))
-                # If the pixel value is under half of the <scaled_colour_range> only increase the amplitude
-                if pixels[y, n_x] < scaled_colour_range / 2:
-                    frequency = 1
-                    amplitude = pixels[y, n_x]
-                # If the pixel value is over half of the <scaled_colour_range> use max amplitude and increase frequency
-                else:
-                    frequency = pixels[y, n_x] - scaled_colour_range / 2 + 1
-                    amplitude = max_amplitude
-
-                # For each pixel of the processed image, <pixel_wave_size> x <pixel_wave_size> "super pixel" is created, that holds the wave for that pixel
-                for i in range(pixel_wave_size):
-                    n_i = i
-                    n_offset = 1
-                    if y % 2 != 0:
-                        n_i = 0 - i + pixel_wave_size
-                        n_offset = -1
-
-                    # Calculate the current pixel coordinates and the next pixel coordinates, so they can be joined with a line
-                    x_pos = n_x * pixel_wave_size + n_i
-                    y_pos = (y * pixel_wave_size + pixel_wave_size / 2) + (
-                        np.sin((n_i) / (pixel_wave_size / 2)
-                               * frequency * np.pi)
-                        * amplitude
-                    )
-
-                    next_x_pos = n_x * pixel_wave_size + n_i + n_offset
-                    next_y_pos = (y * pixel_wave_size + pixel_wave_size / 2) + (
-                        np.sin(
-                            (n_i + n_offset) /
-                            (pixel_wave_size / 2) * frequency * np.pi
-                        )
-                        * amplitude
-                    )
-                    f.write(str(x_pos) + " " + str(round(y_pos)) + "\n")
-
-                    draw.line(
-                        ((x_pos, y_pos), (next_x_pos, next_y_pos)), fill=(0, 0, 0)
-                    )
-        f.close()
         self.result = (
             f"\nTotal run time: {round(time.time() - start_time, 3)} seconds\n"
         )
@@ -149,32 +132,184 @@ class WorkerThread(QThread):
 
         return image
 
+    def tour(self) -> None:
+        # Solves the tour of image.tsp with the built-in solver or linkern, unless the same tour was solved before
+        key = None
+        outputs = {constants.IMAGE_CYC: constants.CYC_PATH}
+        if self.stage_cache is not None:
+            if self.builtin_solver:
+                params = {"solver": "builtin", "partition": bool(self.partition_tsp)}
+            else:
+                params = {"solver": "linkern", "time_budget": self.time_budget, "plateau": self.plateau_improvement}
+            key = self.stage_cache.key("tour", files=[constants.TSP_PATH], params=params)
+            if self.cachedStage(key, outputs) is not None:
+                self.result = subprocess.CompletedProcess(["stage_cache", constants.TSP_PATH], 0)
+                self.finish_signal.emit()
+                return
+
+        if self.builtin_solver:
+            self.solveTsp()
+        else:
+            self.linkern()
+        if key is not None and self.result.returncode == 0 and os.path.exists(constants.CYC_PATH):
+            self.storeStage(key, outputs)
+
     def linkern(self) -> None:
         # Runs the linkern.exe program
-        linker_command = f"{constants.PATH_MAKER} -o {constants.CYC_PATH} {constants.TSP_PATH}"
+        # The tour lengths it prints are followed by a ConvergenceMonitor and emited through convergence_signal.
+        # When the monitor says to stop, linkern is ended and the last tour it saved to the -S snapshot file
+        # is used as the result
+        monitor = ConvergenceMonitor(self.time_budget, self.plateau_improvement)
+        if os.path.exists(constants.CYC_SNAPSHOT_PATH):
+            os.remove(constants.CYC_SNAPSHOT_PATH)
+
+        linker_command = [constants.PATH_MAKER, "-o", constants.CYC_PATH, "-S", constants.CYC_SNAPSHOT_PATH]
+        if self.time_budget is not None:
+            linker_command += ["-t", str(self.time_budget)]
+        linker_command.append(constants.TSP_PATH)
         linker_result = subprocess.Popen(
             linker_command,
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True,
+            stderr=subprocess.STDOUT,
             text=True,
         )
 
+        # The output is read on its own thread, so the stop rules are still checked while linkern is quiet,
+        # like during a long LK pass on a big instance
+        lines = queue.Queue()
+        reader = threading.Thread(target=readLines, args=(linker_result.stdout, lines), daemon=True)
+        reader.start()
+
         # Continuous updates are emited through update_signal
-        while linker_result.poll() is None:
-            line = linker_result.stdout.readline()
-            self.update_signal.emit(line)
+        stopped = False
+        while True:
+            try:
+                line = lines.get(timeout=0.5)
+            except queue.Empty:
+                line = ""
+            if line is None:
+                # linkern finished
+                break
+            if line:
+                self.update_signal.emit(line)
+            if line and monitor.parseLine(line):
+                improvement = monitor.recentImprovement()
+                self.convergence_signal.emit(
+                    monitor.history[-1][0], monitor.best()[1], -1.0 if improvement is None else improvement
+                )
+            if monitor.shouldStop():
+                stopped = True
+                linker_result.terminate()
+                break
+        linker_result.wait()
 
         # Finished result/output emited through finish_signal
         self.result = linker_result
+        if stopped and os.path.exists(constants.CYC_SNAPSHOT_PATH):
+            self.update_signal.emit(f"Stopped linkern: {monitor.stop_reason}, using the best tour so far")
+            self.result = self.snapshotToCyc(linker_command)
 
         # Emit a signal with the output
         self.finish_signal.emit()
 
+    def snapshotToCyc(self, linker_command) -> subprocess.CompletedProcess:
+        # The snapshot is a node list, makePath reads the edge list that -o writes
+        points = path_maker.loadTsp(constants.TSP_PATH)
+        try:
+            order = path_maker.loadCycle(constants.CYC_SNAPSHOT_PATH)
+        except ValueError as e:
+            # linkern was stopped while it wrote the snapshot
+            self.update_signal.emit(f"Can't read the linkern snapshot: {e}")
+            return subprocess.CompletedProcess(linker_command, 1)
+        if not np.array_equal(np.sort(order), np.arange(len(points))):
+            self.update_signal.emit("The linkern snapshot doesn't visit every point once")
+            return subprocess.CompletedProcess(linker_command, 1)
+        tsp_solver.writeCyc(constants.CYC_PATH, points, order)
+        return subprocess.CompletedProcess(linker_command, 0)
+
+    def solveTsp(self) -> None:
+        # Runs the built-in solver, the result looks like a finished linkern run so makePath can use either
+        start_time = time.time()
+        points = path_maker.loadTsp(constants.TSP_PATH)
+        self.update_signal.emit(f"Solving tour of {len(points)} points")
+
+        if self.partition_tsp:
+            tour = tsp_solver.solvePartitioned(points, progress=self.progressReporter())
+        else:
+            tour = tsp_solver.solve(points, progress=self.progressReporter())
+        tsp_solver.writeCyc(constants.CYC_PATH, points, tour)
+
+        self.update_signal.emit(
+            f"Tour length: {round(tsp_solver.tourLength(points, tour))}, "
+            f"run time: {round(time.time() - start_time, 3)} seconds"
+        )
+        self.result = subprocess.CompletedProcess(["tsp_solver", constants.TSP_PATH], 0)
+        self.finish_signal.emit()
+
+    def optimizeStrokes(self) -> None:
+        # Reorders the strokes of the coordinate file in place to cut the pen up travel
+        start_time = time.time()
+        self.update_signal.emit("Optimizing stroke order")
+        travel_before, travel_after = stroke_optimizer.optimizeStrokes(
+            constants.OUTPUT_COODINATES_PATH, constants.OUTPUT_COODINATES_PATH
+        )
+
+        saved = 100 * (1 - travel_after / travel_before) if travel_before > 0 else 0
+        self.result = (
+            f"\nPen up travel: {round(travel_before)} before, {round(travel_after)} after ({round(saved, 1)}% less)"
+            f"\nTotal run time: {round(time.time() - start_time, 3)} seconds\n"
+        )
+        self.finish_signal.emit()
+
     def dither(self, image) -> Image:
         start_time = time.time()
         self.update_signal.emit("Starting dithering")
-        image = dithering.applyDithering(image, constants.TSP_PATH)
+
+        params = {"function_type": int(self.function_type)}
+        if self.function_type == FunctionTypeEnum.STIPPLE:
+            params["node_budget"] = self.node_budget
+        key = self.imageKey("dither", image, params)
+        outputs = {constants.IMAGE_TSP: constants.TSP_PATH, constants.PREVIEW_PNG: constants.PREVIEW_PATH}
+        if self.cachedStage(key, outputs) is not None:
+            self.result = f"\nTotal run time: {time.time() - start_time} seconds\n"
+            self.finish_signal.emit()
+            return self.cachedPreview()
+
+        progress = self.progressReporter()
+        progress(0, 1)
+        if self.function_type == FunctionTypeEnum.ORDERED_DITHER:
+            image = dithering.applyOrderedDithering(image, constants.TSP_PATH)
+        elif self.function_type == FunctionTypeEnum.BLUE_NOISE_DITHER:
+            image = dithering.applyBlueNoiseDithering(image, constants.TSP_PATH)
+        elif self.function_type == FunctionTypeEnum.STIPPLE:
+            if self.node_budget is None:
+                image = stippling.applyStippling(image, constants.TSP_PATH, progress=progress)
+            else:
+                image = stippling.applyStippling(image, constants.TSP_PATH, self.node_budget, progress=progress)
+        else:
+            image = dithering.applyDithering(image, constants.TSP_PATH)
+        progress(1, 1)
+        if key is not None:
+            image.save(constants.PREVIEW_PATH)
+            self.storeStage(key, outputs)
+        self.result = f"\nTotal run time: {time.time() - start_time} seconds\n"
+        self.finish_signal.emit()
+        return image
+
+    def quantize(self, image) -> Image:
+        start_time = time.time()
+        if self.quantize_levels is None:
+            image = quantize.quantizeGrayscaleImage(image)
+        else:
+            image = quantize.quantizeGrayscaleImage(image, self.quantize_levels)
+        self.result = f"\nTotal run time: {time.time() - start_time} seconds\n"
+        self.finish_signal.emit()
+        return image
+
+    def removeBg(self, image) -> Image:
+        start_time = time.time()
+        self.update_signal.emit("Removing background")
+        image = background_removal.removeBackground(image, low_resolution=self.bg_low_resolution)
         self.result = f"\nTotal run time: {time.time() - start_time} seconds\n"
         self.finish_signal.emit()
         return image
@@ -1,3 +1,4 @@
+from .image_buffer import ImageBuffer
 from .configure_machine import ConfigureMachine
 from .configuration_canvas import ConfigurationCanvas
 from .process_image import ProcessImage
@@ -0,0 +1,65 @@
+import numpy as np
+from PIL import Image
+from PyQt5.QtGui import QImage
+
+
+class QImageMemory:
+    # Exposes the pixel memory of a QImage to numpy, arrays made from it keep the QImage alive
+    def __init__(self, qimage: QImage):
+        self.qimage = qimage
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": (qimage.height(), qimage.bytesPerLine()),
+            "typestr": "|u1",
+            "data": (int(qimage.constBits()), True),
+        }
+
+
+# Holds one copy of an image and exposes it as a QImage, a NumPy array and a PIL image that all
+# share the same memory, so canvas operations don't copy the frame every time they change hands.
+# Images are kept as Grayscale8 (array of (height, width)) or RGBA8888 (array of (height, width, 4)).
+# The memory is shared, so the array is read only - changed images go into a new ImageBuffer.
+class ImageBuffer:
+    def __init__(self, qimage: QImage, array: np.ndarray):
+        self.qimage = qimage
+        self.array = array
+
+    @staticmethod
+    def fromQImage(qimage: QImage) -> "ImageBuffer":
+        if qimage.format() not in (QImage.Format_Grayscale8, QImage.Format_RGBA8888):
+            qimage = qimage.convertToFormat(QImage.Format_RGBA8888)
+
+        rows = np.asarray(QImageMemory(qimage))
+        if qimage.format() == QImage.Format_Grayscale8:
+            # Grayscale rows are padded to 4 bytes
+            array = rows[:, :qimage.width()]
+        else:
+            array = rows.reshape(qimage.height(), qimage.width(), 4)
+        return ImageBuffer(qimage, array)
+
+    @staticmethod
+    def fromArray(array: np.ndarray) -> "ImageBuffer":
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        height, width = array.shape[:2]
+        image_format = QImage.Format_Grayscale8 if array.ndim == 2 else QImage.Format_RGBA8888
+
+        qimage = QImage(array.data, width, height, array.strides[0], image_format)
+        return ImageBuffer(qimage, array)
+
+    @staticmethod
+    def fromPil(image: Image) -> "ImageBuffer":
+        if image.mode not in ("L", "RGBA"):
+            image = image.convert("RGBA")
+        return ImageBuffer.fromArray(np.asarray(image))
+
+    def toPil(self) -> Image:
+        mode = "L" if self.array.ndim == 2 else "RGBA"
+        if not self.array.flags.c_contiguous:
+            return Image.fromarray(self.array, mode)
+        return Image.frombuffer(mode, (self.width(), self.height()), self.array, "raw", mode, 0, 1)
+
+    def width(self) -> int:
+        return self.array.shape[1]
+
+    def height(self) -> int:
+        return self.array.shape[0]
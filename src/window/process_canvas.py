@@ -1,15 +1,14 @@
 import os
 import time
 import subprocess
-import numpy as np
-from rembg import remove, new_session
 
-from PIL import Image
 from PyQt5.QtCore import QPoint, Qt
-from PyQt5.QtGui import QColor, QImage, QPainter, QPixmap, QTransform
+from PyQt5.QtGui import QImage, QPainter, QPixmap, QTransform
 from PyQt5.QtWidgets import QWidget
+from PIL import Image
 
-from src.utils import constants, path_maker, to_steps
+from src.utils import constants, motion_planner, path_maker, plot_simulator, simplify, step_codec, to_steps
+from .image_buffer import ImageBuffer
 
 
 # Canvas that displays the image being processed
@@ -30,7 +29,10 @@ class ProcessCanvas(QWidget):
 
         self.image_scale = 1
 
+        # <input_image> is the QImage view of <image_buffer>, both are set through setImage
+        self.image_buffer = None
         self.input_image = None
+        self.pixmap = None
         self.processed_image = None
 
     def paintEvent(self, event) -> None:
@@ -43,148 +45,126 @@ class ProcessCanvas(QWidget):
         transform.scale(self.scale_factor, self.scale_factor)
         transform.translate(self.cur_pos.x(), self.cur_pos.y())
         painter.setTransform(transform)
-        painter.drawPixmap(0, 0, QPixmap.fromImage(self.input_image))
-
-    def qimageToPil(self, qimage):
-        # Get image dimensions
-        width = qimage.width()
-        height = qimage.height()
-
-        # Convert QImage to a format suitable for PIL
-        qimage = qimage.convertToFormat(QImage.Format_RGBA8888)
-
-        # Get the binary data from QImage
-        ptr = qimage.constBits()
-        ptr.setsize(height * width * 4)  # 4 bytes per pixel (RGBA)
-
-        # Convert to numpy array and reshape
-        arr = np.frombuffer(ptr, np.uint8).reshape(height, width, 4)
-
-        # Convert numpy array to PIL Image
-        return Image.fromarray(arr)
-
-    def quantizeGrayscaleImage(self) -> None:
-        if self.input_image is None:
-            return
-        # Sets the grayscale image colour range to <num_colors> - so instead of 255 colour values it only has <num_colors> amount
-        num_colors = 10
-        scaling_factor = 255 / (num_colors - 1)
-
-        quantized_image = self.input_image.copy()
-
-        for x in range(quantized_image.width()):
-            for y in range(quantized_image.height()):
-                original_pixel_value = quantized_image.pixelColor(x, y).red()
-
-                scaled_value = int(
-                    int(original_pixel_value / scaling_factor) * scaling_factor
-                )
-
-                quantized_pixel_color = QColor(
-                    scaled_value, scaled_value, scaled_value)
-                quantized_image.setPixelColor(x, y, quantized_pixel_color)
-
-        self.input_image = quantized_image
+        painter.drawPixmap(0, 0, self.pixmap)
+
+    def setImage(self, image_buffer: ImageBuffer) -> None:
+        # Replaces the displayed image, <image_buffer> can be None to clear the canvas
+        self.image_buffer = image_buffer
+        if image_buffer is None:
+            self.input_image = None
+            self.pixmap = None
+        else:
+            self.input_image = image_buffer.qimage
+            self.pixmap = QPixmap.fromImage(self.input_image)
         self.update()
 
     def loadImage(self, path: str) -> None:
         if not os.path.exists(path):
             return
 
-        self.input_image = QImage(path)
-        self.update()
+        image = QImage(path)
+        if image.isNull():
+            return
+
+        self.setImage(ImageBuffer.fromQImage(image))
 
     def makePath(self, linker_result: subprocess.CompletedProcess) -> None:
         # Converts the output of linkern program to usable files for this program
         # linker_result = self.linkern()
 
         if linker_result.returncode == 0:
-
-            image = path_maker.pathMaker(
-                constants.TSP_PATH, constants.CYC_PATH, constants.OUTPUT_COODINATES_PATH)
-
-            image = image.convert("RGBA")
-            data = image.tobytes("raw", "RGBA")
-
-            self.input_image = QImage(
-                data, image.size[0], image.size[1], QImage.Format_RGBA8888
-            )
-            self.update()
+            stage_cache = self.process_image_window.stage_cache
+            key = stage_cache.key("path", files=[constants.TSP_PATH, constants.CYC_PATH])
+            outputs = {constants.OUTPUT_COORDINATES_TXT: constants.OUTPUT_COODINATES_PATH,
+                       constants.PREVIEW_PNG: constants.PREVIEW_PATH}
+            if stage_cache.fetch(key, outputs) is not None:
+                with Image.open(constants.PREVIEW_PATH) as preview:
+                    image = preview.copy()
+            else:
+                image = path_maker.pathMaker(
+                    constants.TSP_PATH, constants.CYC_PATH, constants.OUTPUT_COODINATES_PATH)
+                image.save(constants.PREVIEW_PATH)
+                stage_cache.store(key, outputs)
+
+            self.setImage(ImageBuffer.fromPil(image))
 
     def convertToSteps(self) -> None:
         # Converts the coordinates of the points to steps of the stepper motor based on the <settings>
         if not os.path.exists(constants.OUTPUT_COODINATES_PATH):
             return
-        steps_output = to_steps.convertToSteps(
-            self.settings, constants.OUTPUT_COODINATES_PATH, constants.OUTPUT_STEPS_PATH, fit=True, min_pen_pickup=self.process_image_window.cbx_min_pen_pickup.isChecked()
-        )
-        if steps_output:
-            self.process_image_window.updateOutput(steps_output)
-
-    def qpixmapToImage2(self, qimage) -> Image:
-        # Convert QImage to numpy array (raw data)
-        width = qimage.width()
-        height = qimage.height()
 
-        # Extract the pixel data from QImage
-        ptr = qimage.bits()
-        ptr.setsize(qimage.byteCount())
-
-        # Create a numpy array from the QImage data
-        arr = np.array(ptr).reshape((height, width, 4))  # 4 channels (RGBA)
-        arr = arr[..., [2, 1, 0, 3]]  # Swap the Blue and Red channels
-
-        # Convert numpy array to PIL Image
-        pil_image = Image.fromarray(arr, 'RGBA')
-
-        return pil_image
-
-    def removeBg(self) -> None:
-        # Removes the background of the image, and replaces it with white background instead of transparent
-        if self.input_image is None:
+        tolerance = self.process_image_window.txt_simplify_tolerance.text().strip()
+        max_deviation = self.process_image_window.txt_max_deviation.text().strip()
+        min_pen_pickup = self.process_image_window.cbx_min_pen_pickup.isChecked()
+        merge_moves = self.process_image_window.cbx_merge_moves.isChecked()
+
+        # The same coordinates, settings and options give the same steps
+        stage_cache = self.process_image_window.stage_cache
+        key = stage_cache.key("steps", files=[constants.OUTPUT_COODINATES_PATH], params={
+            "settings": self.settings, "tolerance": tolerance, "max_deviation": max_deviation,
+            "min_pen_pickup": min_pen_pickup, "merge_moves": merge_moves,
+        })
+        outputs = {constants.OUTPUT_STEPS_TXT: constants.OUTPUT_STEPS_PATH,
+                   constants.OUTPUT_STEPS_BIN: constants.OUTPUT_STEPS_BIN_PATH}
+        info = stage_cache.fetch(key, outputs)
+        if info is not None:
+            for line in info["output"]:
+                self.process_image_window.updateOutput(line)
+            self.process_image_window.updateOutput(f"Using the cached steps\n{stage_cache.formatStats()}")
             return
 
-        image = self.qpixmapToImage2(self.input_image)
-
-        session = new_session("u2net_lite", providers=["CPUExecutionProvider"])
-        image = remove(image, session=session)
-
-        jpg_image = Image.new("RGB", image.size, "white")
-        jpg_image.paste(image, (0, 0), image)
-        image = jpg_image
+        # Points closer than <tolerance> mm to the simplified path are dropped before converting
+        output = []
+        coordinates_path = constants.OUTPUT_COODINATES_PATH
+        if tolerance and float(tolerance) > 0:
+            points_before, points_after = simplify.simplifyFile(
+                constants.OUTPUT_COODINATES_PATH, constants.SIMPLIFIED_COORDINATES_PATH, float(tolerance), self.settings, fit=True
+            )
+            output.append(f"Simplified {points_before} points to {points_after}")
+            coordinates_path = constants.SIMPLIFIED_COORDINATES_PATH
 
-        image = image.convert("RGBA")
-        data = image.tobytes("raw", "RGBA")
-        self.input_image = QImage(
-            data, image.size[0], image.size[1], QImage.Format_RGBA8888
+        # Lines that would bend more than <max_deviation> mm between the motors get extra points
+        steps_output = to_steps.convertToSteps(
+            self.settings, coordinates_path, constants.OUTPUT_STEPS_PATH, fit=True, min_pen_pickup=min_pen_pickup,
+            max_deviation=float(max_deviation) if max_deviation else None
         )
-        self.update()
+        if steps_output:
+            output.append(steps_output)
+            if merge_moves:
+                moves_before, moves_after = motion_planner.planFile(constants.OUTPUT_STEPS_PATH, constants.OUTPUT_STEPS_PATH)
+                output.append(f"Merged {moves_before} moves into {moves_after}")
+            text_size, binary_size = step_codec.encodeFile(constants.OUTPUT_STEPS_PATH, constants.OUTPUT_STEPS_BIN_PATH)
+            output.append(
+                f"Binary steps: {binary_size} bytes, {100 * binary_size / max(text_size, 1):.0f}% of {constants.OUTPUT_STEPS_TXT}")
+            output.append(plot_simulator.formatReport(plot_simulator.simulate(constants.OUTPUT_STEPS_PATH, self.settings)))
+            stage_cache.store(key, outputs, {"output": output})
+
+        for line in output:
+            self.process_image_window.updateOutput(line)
+        self.process_image_window.updateOutput(stage_cache.formatStats())
 
     def rotate90(self) -> None:
         if self.input_image is None:
             return
 
-        self.input_image = self.input_image.transformed(QTransform().rotate(90))
-        self.update()
+        self.setImage(ImageBuffer.fromQImage(self.input_image.transformed(QTransform().rotate(90))))
 
     def grayscale(self) -> None:
         # Converts the image to grayscale
         if self.input_image is None:
             return
 
-        self.input_image = self.input_image.convertToFormat(
-            QImage.Format_Grayscale8)
-        self.update()
+        self.setImage(ImageBuffer.fromQImage(self.input_image.convertToFormat(
+            QImage.Format_Grayscale8)))
 
     def scale(self) -> None:
         if self.input_image is None:
             return
 
-        self.input_image = self.input_image.scaled(
+        self.setImage(ImageBuffer.fromQImage(self.input_image.scaled(
             int(self.input_image.width() / self.image_scale),
             int(self.input_image.height() / self.image_scale),
-        )
-        self.update()
+        )))
 
     def saveImage(self) -> None:
         if self.input_image is None:
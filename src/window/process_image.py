@@ -1,13 +1,15 @@
 import os
 
 from PIL import Image, ImageDraw, ImageOps
-from PyQt5.QtGui import QImage
 from PyQt5.QtWidgets import (QFileDialog, QGridLayout,
                              QHBoxLayout, QLabel, QLineEdit,
-                             QPushButton, QSizePolicy, QSpacerItem,
+                             QProgressBar, QPushButton, QSizePolicy, QSpacerItem,
                              QTextEdit, QWidget, QCheckBox)
 
-from src.utils import constants, svg_parser, FunctionTypeEnum, WorkerThread
+from src.utils import constants, svg_parser, FunctionTypeEnum
+from src.utils.stage_cache import StageCache
+from src.utils.worker_thread import WorkerThread
+from .image_buffer import ImageBuffer
 from .process_canvas import ProcessCanvas
 
 # Image processing windows
@@ -30,16 +32,44 @@ class ProcessImage(QWidget):
         self.btn_scale = QPushButton("Scale")
         self.btn_grayscale = QPushButton("Grayscale")
         self.btn_colourscale = QPushButton("Colour scale")
+        self.txt_colour_levels = QLineEdit("10")
+        self.txt_colour_levels.setPlaceholderText("Colour levels")
+        self.lbl_colour_levels = QLabel("Colour levels")
         self.btn_dither = QPushButton("Dither")
+        self.btn_ordered_dither = QPushButton("Bayer Dither")
+        self.btn_blue_noise_dither = QPushButton("Blue Noise Dither")
+        self.btn_stipple = QPushButton("Stipple")
+        self.txt_node_budget = QLineEdit("20000")
+        self.txt_node_budget.setPlaceholderText("Stipple points")
+        self.txt_node_budget.setToolTip("Number of stipple points")
         self.btn_wave = QPushButton("Wave")
         self.btn_remove_BG = QPushButton("Remove BG")
         self.btn_make_path = QPushButton("Make Path")
         self.btn_convert_to_steps = QPushButton("Convert to steps")
+        self.btn_optimize_strokes = QPushButton("Optimize Strokes")
+        self.txt_simplify_tolerance = QLineEdit("0.1")
+        self.lbl_simplify_tolerance = QLabel("Simplify tolerance (mm)")
+        self.txt_max_deviation = QLineEdit("0.1")
+        self.lbl_max_deviation = QLabel("Max line deviation (mm)")
+        self.cbx_merge_moves = QCheckBox("Merge Collinear Moves")
         self.btn_save_image = QPushButton("Save Image")
         self.cbx_wave_smooth = QCheckBox("Use Wave Smoother")
         self.cbx_min_pen_pickup = QCheckBox("Use Minimum Pen Pickup Distance")
+        self.cbx_bg_low_resolution = QCheckBox("Low Resolution BG Mask")
+        self.cbx_builtin_solver = QCheckBox("Use Built-in TSP Solver")
+        # linkern.exe only runs on Windows
+        self.cbx_builtin_solver.setChecked(os.name != "nt")
+        self.cbx_partition_tsp = QCheckBox("Partition Large Tours")
+        self.txt_time_budget = QLineEdit("")
+        self.txt_time_budget.setPlaceholderText("Linkern time budget (s)")
+        self.txt_plateau = QLineEdit("0.1")
+        self.txt_plateau.setPlaceholderText("Stop below % per minute")
+        self.lbl_convergence = QLabel("")
 
         self.lbl_output = QLabel("Output")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(0)
         self.output_text_edit = QTextEdit()
         self.output_text_edit.setReadOnly(True)
 
@@ -50,13 +80,16 @@ class ProcessImage(QWidget):
         self.btn_scale.clicked.connect(self.scaleImage)
         self.btn_grayscale.clicked.connect(self.image_canvas.grayscale)
         self.btn_dither.clicked.connect(self.startDither)
+        self.btn_ordered_dither.clicked.connect(self.startOrderedDither)
+        self.btn_blue_noise_dither.clicked.connect(self.startBlueNoiseDither)
+        self.btn_stipple.clicked.connect(self.startStipple)
         self.btn_wave.clicked.connect(self.startWave)
-        self.btn_remove_BG.clicked.connect(self.image_canvas.removeBg)
-        self.btn_colourscale.clicked.connect(
-        self.image_canvas.quantizeGrayscaleImage)
+        self.btn_remove_BG.clicked.connect(self.startRemoveBg)
+        self.btn_colourscale.clicked.connect(self.startQuantize)
         self.btn_make_path.clicked.connect(self.startLinkern)
         self.btn_convert_to_steps.clicked.connect(self.image_canvas.convertToSteps)
         self.btn_convert_to_steps.setObjectName("testBtn")
+        self.btn_optimize_strokes.clicked.connect(self.startOptimizeStrokes)
         self.btn_save_image.clicked.connect(self.image_canvas.saveImage)
 
         self.vertical_spacer = QSpacerItem(
@@ -80,9 +113,30 @@ class ProcessImage(QWidget):
         self.lyt_inputs.addWidget(self.btn_save_image, 6, 0)
         self.lyt_inputs.addWidget(self.cbx_wave_smooth, 6, 1)
         self.lyt_inputs.addWidget(self.cbx_min_pen_pickup, 7, 0)
-
-        self.lyt_inputs.addWidget(self.lbl_output, 9, 0)
-        self.lyt_inputs.addWidget(self.output_text_edit, 10, 0, 1, 2)
+        self.lyt_inputs.addWidget(self.btn_optimize_strokes, 7, 1)
+        self.lyt_inputs.addWidget(self.btn_ordered_dither, 8, 0)
+        self.lyt_inputs.addWidget(self.btn_blue_noise_dither, 8, 1)
+        self.lyt_inputs.addWidget(self.btn_stipple, 9, 0)
+        self.lyt_inputs.addWidget(self.txt_node_budget, 9, 1)
+        self.lyt_inputs.addWidget(self.lbl_colour_levels, 10, 0)
+        self.lyt_inputs.addWidget(self.txt_colour_levels, 10, 1)
+        self.lyt_inputs.addWidget(self.cbx_builtin_solver, 11, 0)
+        self.lyt_inputs.addWidget(self.cbx_partition_tsp, 11, 1)
+        self.lyt_inputs.addWidget(self.txt_time_budget, 12, 0)
+        self.lyt_inputs.addWidget(self.txt_plateau, 12, 1)
+        self.lyt_inputs.addWidget(self.lbl_simplify_tolerance, 13, 0)
+        self.lyt_inputs.addWidget(self.txt_simplify_tolerance, 13, 1)
+
+        self.lyt_inputs.addWidget(self.lbl_max_deviation, 14, 0)
+        self.lyt_inputs.addWidget(self.txt_max_deviation, 14, 1)
+
+        self.lyt_inputs.addWidget(self.cbx_merge_moves, 15, 0)
+        self.lyt_inputs.addWidget(self.cbx_bg_low_resolution, 15, 1)
+
+        self.lyt_inputs.addWidget(self.lbl_output, 16, 0)
+        self.lyt_inputs.addWidget(self.progress_bar, 17, 0, 1, 2)
+        self.lyt_inputs.addWidget(self.lbl_convergence, 18, 0, 1, 2)
+        self.lyt_inputs.addWidget(self.output_text_edit, 19, 0, 1, 2)
 
         self.lyt_inputs.addItem(self.vertical_spacer)
 
@@ -94,8 +148,14 @@ class ProcessImage(QWidget):
         self.lyt_process_image_tab.setStretchFactor(self.left_input_panel, 2)
         self.lyt_process_image_tab.setStretchFactor(self.image_canvas, 7)
 
+        # Outputs of the stages, so running a stage again on the same input is skipped
+        self.stage_cache = StageCache(constants.STAGE_CACHE_PATH)
+
         self.worker_thread = WorkerThread()
+        self.worker_thread.stage_cache = self.stage_cache
         self.worker_thread.update_signal.connect(self.updateOutput)
+        self.worker_thread.progress_signal.connect(self.updateProgress)
+        self.worker_thread.convergence_signal.connect(self.updateConvergence)
         self.worker_thread.finish_signal.connect(self.finishOutput)
         self.worker_thread.image_signal.connect(self.imageOutput)
 
@@ -104,13 +164,26 @@ class ProcessImage(QWidget):
     def startLinkern(self):
         if os.path.exists(constants.TSP_PATH):
             self.worker_thread.function_type = FunctionTypeEnum.LINKERN
+            self.worker_thread.builtin_solver = self.cbx_builtin_solver.isChecked()
+            self.worker_thread.partition_tsp = self.cbx_partition_tsp.isChecked()
+            # Empty inputs turn the stop rules off
+            time_budget = self.txt_time_budget.text().strip()
+            plateau = self.txt_plateau.text().strip()
+            self.worker_thread.time_budget = float(time_budget) if time_budget else None
+            self.worker_thread.plateau_improvement = float(plateau) / 100 if plateau else None
+            self.lbl_convergence.setText("")
             self.worker_thread.start()
 
 
+    def startOptimizeStrokes(self):
+        if os.path.exists(constants.OUTPUT_COODINATES_PATH):
+            self.worker_thread.function_type = FunctionTypeEnum.OPTIMIZE_STROKES
+            self.worker_thread.start()
+
     def startWave(self):
         if self.image_canvas.input_image is None:
             return
-        image = self.image_canvas.qimageToPil(self.image_canvas.input_image).convert("L")
+        image = self.image_canvas.image_buffer.toPil().convert("L")
         #image = Image.fromqpixmap(self.image_canvas.input_image).convert("L")
         image = ImageOps.invert(image)
 
@@ -121,20 +194,68 @@ class ProcessImage(QWidget):
 
 
     def startDither(self):
+        self.startDitherMode(FunctionTypeEnum.DITHER)
+
+    def startOrderedDither(self):
+        self.startDitherMode(FunctionTypeEnum.ORDERED_DITHER)
+
+    def startBlueNoiseDither(self):
+        self.startDitherMode(FunctionTypeEnum.BLUE_NOISE_DITHER)
+
+    def startStipple(self):
+        # An empty input uses the default number of points
+        node_budget = self.txt_node_budget.text().strip()
+        self.worker_thread.node_budget = int(node_budget) if node_budget else None
+        self.startDitherMode(FunctionTypeEnum.STIPPLE)
+
+    def startDitherMode(self, function_type):
         if self.image_canvas.input_image is None:
             return
 
-        image = self.image_canvas.qimageToPil(self.image_canvas.input_image).convert("L")
+        image = self.image_canvas.image_buffer.toPil().convert("L")
         #image = Image.fromqpixmap(self.image_canvas.input_image).convert("L")
         image = ImageOps.invert(image)
 
-        self.worker_thread.function_type = FunctionTypeEnum.DITHER
+        self.worker_thread.function_type = function_type
         self.worker_thread.image = image
         self.worker_thread.start()
 
+    def startQuantize(self):
+        if self.image_canvas.input_image is None:
+            return
+
+        self.worker_thread.function_type = FunctionTypeEnum.QUANTIZE
+        # An empty input uses the default number of levels
+        levels = self.txt_colour_levels.text().strip()
+        self.worker_thread.quantize_levels = int(levels) if levels else None
+        self.worker_thread.image = self.image_canvas.image_buffer.toPil()
+        self.worker_thread.start()
+
+    def startRemoveBg(self):
+        if self.image_canvas.input_image is None:
+            return
+
+        self.worker_thread.function_type = FunctionTypeEnum.REMOVE_BG
+        self.worker_thread.bg_low_resolution = self.cbx_bg_low_resolution.isChecked()
+        self.worker_thread.image = self.image_canvas.image_buffer.toPil()
+        self.worker_thread.start()
+
     def updateOutput(self, output):
         self.output_text_edit.append(output)
 
+    def updateProgress(self, fraction, eta):
+        self.progress_bar.setValue(round(fraction * self.progress_bar.maximum()))
+        if eta < 0:
+            self.progress_bar.setFormat("%p%")
+        else:
+            self.progress_bar.setFormat(f"%p% - {round(eta)}s left")
+
+    def updateConvergence(self, seconds, length, improvement):
+        text = f"Best tour: {round(length)} after {round(seconds)}s"
+        if improvement >= 0:
+            text += f", {100 * improvement:.3f}% shorter than a minute ago"
+        self.lbl_convergence.setText(text)
+
     def finishOutput(self):
         if self.worker_thread.function_type == FunctionTypeEnum.LINKERN:
             result = self.worker_thread.getResult()
@@ -144,14 +265,7 @@ class ProcessImage(QWidget):
         self.output_text_edit.append(result)
 
     def imageOutput(self):
-        image = self.worker_thread.image
-        image = image.convert("RGBA")
-        data = image.tobytes("raw", "RGBA")
-
-        self.image_canvas.input_image = QImage(
-            data, image.size[0], image.size[1], QImage.Format_RGBA8888
-        )
-        self.image_canvas.update()
+        self.image_canvas.setImage(ImageBuffer.fromPil(self.worker_thread.image))
 
     def scaleImage(self) -> None:
         if self.image_canvas.input_image is None:
@@ -161,9 +275,8 @@ class ProcessImage(QWidget):
         self.image_canvas.scale()
 
     def clearAll(self) -> None:
-        self.image_canvas.input_image = None
         self.image_canvas.scale_factor = 1.0
-        self.image_canvas.update()
+        self.image_canvas.setImage(None)
         self.output_text_edit.clear()
 
     def openImage(self) -> None:
@@ -195,13 +308,7 @@ class ProcessImage(QWidget):
         if image == None:
             return
 
-        image = image.convert("RGBA")
-        data = image.tobytes("raw", "RGBA")
-
-        self.image_canvas.input_image = QImage(
-            data, image.size[0], image.size[1], QImage.Format_RGBA8888
-        )
-        self.image_canvas.update()
+        self.image_canvas.setImage(ImageBuffer.fromPil(image))
 
     def SVGToGCODE(self, path) -> None:
         """
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+import warnings
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from src.image_processing import dithering
+
+
+# The previous pure python applyDithering, kept as the baseline the compiled path is timed against
+def applyDitheringLoop(image, tsp_path):
+    input_pixels = np.array(ImageOps.invert(image.convert("L")))
+    output_pixels = np.zeros_like(input_pixels)
+    count = 0
+    file_lines = []
+
+    for y in range(input_pixels.shape[0]):
+        for x in range(input_pixels.shape[1]):
+            old_pixel = input_pixels[y, x]
+            new_pixel = 255 if old_pixel >= 128 else 0
+            if new_pixel == 0:
+                count += 1
+                file_lines.append(f"%s %s %s\n" % (count, x, y))
+            output_pixels[y, x] = new_pixel
+
+            quant_error = old_pixel - new_pixel
+
+            if x < input_pixels.shape[1] - 1:
+                input_pixels[y, x + 1] += quant_error * 7 / 48
+                if x < input_pixels.shape[1] - 2:
+                    input_pixels[y, x + 2] += quant_error * 5 / 48
+            if y < input_pixels.shape[0] - 1:
+                if x > 0:
+                    input_pixels[y + 1, x - 1] += quant_error * 3 / 48
+                input_pixels[y + 1, x] += quant_error * 5 / 48
+                if x < input_pixels.shape[1] - 1:
+                    input_pixels[y + 1, x + 1] += quant_error * 3 / 48
+                if x < input_pixels.shape[1] - 2:
+                    input_pixels[y + 1, x + 2] += quant_error * 1 / 48
+
+    with open(tsp_path, "w") as f:
+        f.writelines(file_lines)
+    return count
+
+
+def readNodes(tsp_path):
+    with open(tsp_path) as f:
+        return f.read().split("NODE_COORD_SECTION\n")[1].split("EOF")[0]
+
+
+def benchmark():
+    rng = np.random.default_rng(0)
+    tmp_dir = tempfile.mkdtemp()
+    tsp_path = os.path.join(tmp_dir, "image.tsp")
+
+    # The compiled kernel gives the same node list as running the same float32 kernel as plain python
+    small = Image.fromarray(rng.integers(0, 256, (300, 400), dtype=np.uint8), mode="L")
+    pixels = np.array(ImageOps.invert(small), dtype=np.float32)
+    dithering.writeTsp(tsp_path, dithering.diffuseError.py_func(pixels))
+    reference_nodes = readNodes(tsp_path)
+    dithering.applyDithering(small, tsp_path)
+    print(f"Node lists match: {readNodes(tsp_path) == reference_nodes}")
+
+    start_time = time.time()
+    with warnings.catch_warnings():
+        # The uint8 buffer of the old loop overflows, which numpy warns about
+        warnings.simplefilter("ignore")
+        applyDitheringLoop(small, tsp_path)
+    loop_per_pixel = (time.time() - start_time) / pixels.size
+
+    for height, width in ((750, 1000), (1500, 2000), (3000, 4000)):
+        image = Image.fromarray(rng.integers(0, 256, (height, width), dtype=np.uint8), mode="L")
+        start_time = time.time()
+        dithering.applyDithering(image, tsp_path)
+        compiled_time = time.time() - start_time
+        loop_estimate = loop_per_pixel * height * width
+        print(f"{width}x{height}: compiled {compiled_time:.3f}s, python loop ~{loop_estimate:.1f}s "
+              f"(extrapolated from {small.width}x{small.height}), speedup ~{loop_estimate / compiled_time:.0f}x")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,93 @@
+import math
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.image_processing.edge_detector import EdgeDetector
+
+
+# Pixel-by-pixel versions of EdgeDetector.sobel and EdgeDetector.gaussian, kept as the reference
+# the vectorized filters are checked against
+def sobelLoop(detector, image):
+    input_pixels = np.array(image.convert("L"))
+    output_pixels = np.zeros_like(input_pixels, dtype=np.uint8)
+
+    for y in range(input_pixels.shape[0]):
+        for x in range(input_pixels.shape[1]):
+            Gx_sum = 0
+            Gy_sum = 0
+            for j in range(-1, 2):
+                for i in range(-1, 2):
+                    neighbor_y = detector.reflect_index(y + j, input_pixels.shape[0])
+                    neighbor_x = detector.reflect_index(x + i, input_pixels.shape[1])
+                    Gx_sum += int(input_pixels[neighbor_y, neighbor_x]) * detector.Gx[j + 1][i + 1]
+                    Gy_sum += int(input_pixels[neighbor_y, neighbor_x]) * detector.Gy[j + 1][i + 1]
+
+            G = math.sqrt(Gx_sum**2 + Gy_sum**2)
+            G = detector.remap(G, 0, math.sqrt(255**2 + 255**2), 0, 255)
+            output_pixels[y, x] = np.uint8(G)
+
+    return output_pixels
+
+
+def gaussianLoop(detector, image, radius):
+    sigma = max(radius / 2, 1)
+    kernel = [[detector.gaussianKernelGenerator(i, j, sigma) for j in range(-radius, radius + 1)]
+              for i in range(-radius, radius + 1)]
+    kernel_sum = sum(sum(row) for row in kernel)
+    kernel = [[value / kernel_sum for value in row] for row in kernel]
+
+    input_pixels = np.array(image.convert("L"))
+    output_pixels = np.zeros_like(input_pixels, dtype=np.uint8)
+
+    for y in range(input_pixels.shape[0]):
+        for x in range(input_pixels.shape[1]):
+            sum_val = 0
+            for j in range(-radius, radius + 1):
+                for i in range(-radius, radius + 1):
+                    neighbor_y = detector.reflect_index(y + j, input_pixels.shape[0])
+                    neighbor_x = detector.reflect_index(x + i, input_pixels.shape[1])
+                    sum_val += input_pixels[neighbor_y, neighbor_x] * kernel[j + radius][i + radius]
+            output_pixels[y, x] = np.clip(sum_val, 0, 255)
+
+    return output_pixels
+
+
+def timeIt(function, *args):
+    start_time = time.time()
+    result = function(*args)
+    return result, time.time() - start_time
+
+
+def benchmark(sizes=(32, 64, 128), radius=3):
+    detector = EdgeDetector()
+    rng = np.random.default_rng(0)
+
+    for size in sizes:
+        image = Image.fromarray(rng.integers(0, 256, (size, size), dtype=np.uint8), mode="L")
+
+        sobel_ref, sobel_loop_time = timeIt(sobelLoop, detector, image)
+        sobel_out, sobel_time = timeIt(detector.sobel, image)
+        gauss_ref, gauss_loop_time = timeIt(gaussianLoop, detector, image, radius)
+        gauss_out, gauss_time = timeIt(detector.gaussian, image, radius)
+
+        sobel_diff = np.abs(np.array(sobel_out, dtype=np.int16) - sobel_ref).max()
+        gauss_diff = np.abs(np.array(gauss_out, dtype=np.int16) - gauss_ref).max()
+
+        print(f"{size}x{size}")
+        print(f"  sobel:    loop {sobel_loop_time:.3f}s, numpy {sobel_time:.4f}s, "
+              f"speedup {sobel_loop_time / max(sobel_time, 1e-9):.0f}x, max diff {sobel_diff}")
+        print(f"  gaussian: loop {gauss_loop_time:.3f}s, numpy {gauss_time:.4f}s, "
+              f"speedup {gauss_loop_time / max(gauss_time, 1e-9):.0f}x, max diff {gauss_diff}")
+
+    # The loop versions take minutes at photo sizes, so only the numpy filters are timed there
+    for size in (1000, 2000):
+        image = Image.fromarray(rng.integers(0, 256, (size, size), dtype=np.uint8), mode="L")
+        _, sobel_time = timeIt(detector.sobel, image)
+        _, gauss_time = timeIt(detector.gaussian, image, radius)
+        print(f"{size}x{size}: sobel {sobel_time:.3f}s, gaussian {gauss_time:.3f}s")
+
+
+if __name__ == "__main__":
+    benchmark()
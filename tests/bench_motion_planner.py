@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src.utils import constants, motion_planner, plot_simulator, to_steps
+
+
+# Compares the plot time of step files before and after motion_planner, with plot_simulator:
+# python -m tests.bench_motion_planner [path.txt ...]
+# Without files, a step file is made from strokes of densely sampled circles and spirals, the kind of
+# path the wave and svg output gives.
+ACCELERATION = 6000
+LINE_OVERHEAD = 0.01
+
+
+def makeSteps(steps_path, stroke_count=2000, points_per_stroke=400):
+    rng = np.random.default_rng(0)
+    coordinates_path = steps_path + ".coordinates.txt"
+    with open(coordinates_path, "w") as f:
+        for _ in range(stroke_count):
+            center = rng.uniform(100, 900, 2)
+            radius = rng.uniform(5, 100)
+            angles = np.linspace(0, rng.uniform(2, 12), points_per_stroke)
+            radii = radius * (1 + 0.2 * angles / angles[-1]) if rng.random() < 0.5 else np.full_like(angles, radius)
+            points = center + np.column_stack((np.cos(angles), np.sin(angles))) * radii[:, None]
+            f.write(f"PENUP\n{points[0, 0]:.2f} {points[0, 1]:.2f}\nPENDOWN\n")
+            f.writelines(f"{x:.2f} {y:.2f}\n" for x, y in points[1:])
+        f.write("PENUP\n")
+    to_steps.convertToSteps(constants.DEFAULT_SETTINGS, coordinates_path, steps_path, fit=True)
+
+
+def plotTimes(steps_path):
+    # (constant speed firmware, with LINE_OVERHEAD seconds per line, accelerating firmware) in seconds
+    return tuple(
+        plot_simulator.simulate(steps_path, constants.DEFAULT_SETTINGS, **options)["time"]
+        for options in ({}, {"line_overhead": LINE_OVERHEAD}, {"acceleration": ACCELERATION})
+    )
+
+
+def benchmark(steps_paths):
+    tmp_dir = tempfile.mkdtemp()
+    if not steps_paths:
+        steps_path = os.path.join(tmp_dir, "path.txt")
+        makeSteps(steps_path)
+        steps_paths.append(steps_path)
+
+    planned_path = os.path.join(tmp_dir, "planned.txt")
+    for steps_path in steps_paths:
+        start_time = time.time()
+        moves_before, moves_after = motion_planner.planFile(steps_path, planned_path, acceleration=ACCELERATION)
+        planner_time = time.time() - start_time
+        print(f"{steps_path}: {moves_before} moves merged to {moves_after} in {planner_time:.2f}s")
+
+        labels = ("constant speed", f"{LINE_OVERHEAD}s per line", f"acceleration {ACCELERATION}")
+        for label, before, after in zip(labels, plotTimes(steps_path), plotTimes(planned_path)):
+            print(f"  {label}: {plot_simulator.formatDuration(before)} -> {plot_simulator.formatDuration(after)} "
+                  f"({100 * (after / before - 1):+.1f}%)")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1:])
@@ -0,0 +1,41 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src.utils import constants, plot_simulator
+
+
+# Times the plot simulator on the given step files: python -m tests.bench_plot_simulator [path.txt ...]
+# Without files, a step file of 1M moves is made from a random walk, with a pen lift every 1000 moves
+# and a pause every 250k moves.
+def makeSteps(steps_path, move_count):
+    rng = np.random.default_rng(0)
+    positions = np.cumsum(rng.integers(-40, 41, (move_count, 2)), axis=0)
+    with open(steps_path, "w") as f:
+        f.write("PENUP:45\n")
+        for start in range(0, move_count, 1000):
+            if start and start % 250000 == 0:
+                f.write("PAUSE\n")
+            f.write(f"{positions[start, 0]},{positions[start, 1]}\nPENDOWN:0\n")
+            f.writelines(f"{a},{b}\n" for a, b in positions[start + 1:start + 1000])
+            f.write("PENUP:45\n")
+
+
+def benchmark(steps_paths):
+    if not steps_paths:
+        steps_path = os.path.join(tempfile.mkdtemp(), "path.txt")
+        makeSteps(steps_path, 1000000)
+        steps_paths.append(steps_path)
+
+    for steps_path in steps_paths:
+        start_time = time.time()
+        report = plot_simulator.simulate(steps_path, constants.DEFAULT_SETTINGS)
+        print(f"{steps_path} ({report['lines']} lines) simulated in {time.time() - start_time:.2f}s")
+        print(plot_simulator.formatReport(report))
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1:])
@@ -0,0 +1,46 @@
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+from rembg import remove
+
+from src.image_processing import background_removal
+
+
+# Compares the full resolution background removal with the low resolution mask mode:
+# python -m tests.bench_remove_bg photo.jpg [photo2.jpg ...]
+# The full resolution mask is taken as the reference, the masks are compared as foreground (> 127) sets
+def maskIou(mask, reference) -> float:
+    mask = np.asarray(mask) > 127
+    reference = np.asarray(reference) > 127
+    union = np.logical_or(mask, reference).sum()
+    if union == 0:
+        return 1.0
+    return np.logical_and(mask, reference).sum() / union
+
+
+def benchmark(paths):
+    session = background_removal.getSession()
+
+    for path in paths:
+        image = Image.open(path).convert("RGB")
+
+        start_time = time.time()
+        full_mask = remove(image, session=session, only_mask=True)
+        full_time = time.time() - start_time
+
+        start_time = time.time()
+        low_resolution_mask = background_removal.lowResolutionMask(image)
+        low_resolution_time = time.time() - start_time
+
+        print(f"{path} ({image.width}x{image.height}): full resolution {full_time:.2f}s, "
+              f"low resolution {low_resolution_time:.2f}s, speedup {full_time / low_resolution_time:.1f}x, "
+              f"mask IoU {maskIou(low_resolution_mask, full_mask):.4f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m tests.bench_remove_bg <image> [<image> ...]")
+        sys.exit(1)
+    benchmark(sys.argv[1:])
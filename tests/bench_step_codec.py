@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from numba import njit
+
+from src.utils import plot_simulator, step_codec
+from tests import bench_plot_simulator
+
+
+# Compares the size and the time to parse the text and the binary step files:
+# python -m tests.bench_step_codec [path.txt ...]
+# Without files, the 1M move step file of bench_plot_simulator is used.
+# Both formats are parsed by a compiled loop over the bytes into the same arrays, the way the firmware goes
+# through them (parseText and step_codec.decodeKernel). The numpy text reader of plot_simulator and the python
+# reference decoder are timed too, but they don't say much about the formats: one runs in C, the other is a
+# python loop.
+@njit(cache=True)
+def parseText(data):
+    # Reads the "a,b" lines into an array and skips the others. A move line is at least 4 bytes ("0,0\n")
+    positions = np.empty((len(data) // 4 + 1, 2), dtype=np.int64)
+    count = 0
+    i = 0
+    while i < len(data):
+        if data[i] == 45 or 48 <= data[i] <= 57:
+            for field in range(2):
+                if field == 1:
+                    # The comma
+                    i += 1
+                sign = 1
+                if data[i] == 45:
+                    sign = -1
+                    i += 1
+                value = 0
+                while i < len(data) and 48 <= data[i] <= 57:
+                    value = value * 10 + (data[i] - 48)
+                    i += 1
+                positions[count, field] = sign * value
+            count += 1
+        while i < len(data) and data[i] != 10:
+            i += 1
+        i += 1
+    return positions[:count]
+
+
+def timed(function, *args):
+    start_time = time.time()
+    result = function(*args)
+    return result, time.time() - start_time
+
+
+def benchmark(steps_paths):
+    tmp_dir = tempfile.mkdtemp()
+    if not steps_paths:
+        steps_path = os.path.join(tmp_dir, "path.txt")
+        bench_plot_simulator.makeSteps(steps_path, 1000000)
+        steps_paths.append(steps_path)
+
+    binary_path = os.path.join(tmp_dir, "path.vps")
+    for steps_path in steps_paths:
+        (text_size, binary_size), encode_time = timed(step_codec.encodeFile, steps_path, binary_path)
+        with open(steps_path, "rb") as f:
+            text = np.frombuffer(f.read(), dtype=np.uint8)
+        with open(binary_path, "rb") as f:
+            binary = f.read()
+
+        # Compile both before timing them
+        parseText(np.frombuffer(b"PENUP:45\n1,-2\n", dtype=np.uint8))
+        step_codec.decodeArrays(step_codec.encodeSteps(np.array([[1, -2]]), [(0, "PENUP:45")]))
+
+        text_positions, text_time = timed(parseText, text)
+        binary_result, binary_time = timed(step_codec.decodeKernel, np.frombuffer(binary, dtype=np.uint8),
+                                           len(step_codec.MAGIC))
+        if not np.array_equal(text_positions, binary_result[0]):
+            raise RuntimeError(f"{steps_path}: the text and binary files have different moves")
+        _, loadtxt_time = timed(plot_simulator.readSteps, steps_path)
+        _, reference_time = timed(step_codec.decodeSteps, binary)
+
+        print(f"{steps_path}: text {text_size} bytes, binary {binary_size} bytes "
+              f"({100 * binary_size / text_size:.1f}%), encoded in {encode_time:.2f}s")
+        print(f"  byte loop: parsed text in {text_time:.3f}s, decoded binary in {binary_time:.3f}s "
+              f"({text_time / max(binary_time, 1e-9):.1f}x)")
+        print(f"  not comparable: numpy text reader {loadtxt_time:.2f}s, python reference decoder {reference_time:.2f}s")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1:])
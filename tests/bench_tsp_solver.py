@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from src.image_processing import dithering
+from src.utils import constants, path_maker, tsp_solver
+
+
+# Times the built-in solver, and linkern when it is available, on the given .tsp files:
+# python -m tests.bench_tsp_solver [image.tsp ...]
+# Without files, stipple-like point sets of ~50k, ~200k, ~500k and ~1M points are made by dithering a gradient.
+# Sets larger than one tile are also solved with solvePartitioned.
+def makeTsp(tsp_path, point_count):
+    # About half of the gradient pixels end up as points
+    side = int(np.sqrt(point_count * 2))
+    gradient = np.tile(np.linspace(0, 255, side), (side, 1)).astype(np.uint8)
+    dithering.applyBlueNoiseDithering(Image.fromarray(gradient, "L"), tsp_path)
+
+
+def tourFromCyc(cyc_path) -> np.ndarray:
+    return path_maker.loadCyc(cyc_path)[:, 0]
+
+
+def runLinkern(tsp_path, cyc_path):
+    start_time = time.time()
+    result = subprocess.run([constants.PATH_MAKER, "-o", cyc_path, tsp_path], capture_output=True)
+    if result.returncode != 0:
+        return None
+    return time.time() - start_time
+
+
+def benchmark(tsp_paths, tile_size=100000):
+    tmp_dir = tempfile.mkdtemp()
+    has_linkern = os.path.exists(constants.PATH_MAKER)
+    if not has_linkern:
+        print(f"{constants.PATH_MAKER} not found, only timing the built-in solver")
+
+    if not tsp_paths:
+        for point_count in (50000, 200000, 500000, 1000000):
+            tsp_path = os.path.join(tmp_dir, f"stipple_{point_count}.tsp")
+            makeTsp(tsp_path, point_count)
+            tsp_paths.append(tsp_path)
+
+    # Compile the solver before timing it
+    tsp_solver.solve(np.random.default_rng(0).random((1000, 2)))
+
+    for tsp_path in tsp_paths:
+        points = path_maker.loadTsp(tsp_path)
+        cyc_path = os.path.join(tmp_dir, "tour.cyc")
+
+        start_time = time.time()
+        tour = tsp_solver.solve(points)
+        solver_time = time.time() - start_time
+        solver_length = tsp_solver.tourLength(points, tour)
+        line = f"{os.path.basename(tsp_path)} ({len(points)} points): built-in {solver_length:.0f} in {solver_time:.1f}s"
+
+        if len(points) > tile_size:
+            start_time = time.time()
+            tour = tsp_solver.solvePartitioned(points, tile_size=tile_size)
+            partitioned_time = time.time() - start_time
+            line += f", partitioned {tsp_solver.tourLength(points, tour):.0f} in {partitioned_time:.1f}s"
+
+        if has_linkern:
+            linkern_time = runLinkern(tsp_path, cyc_path)
+            if linkern_time is not None:
+                linkern_length = tsp_solver.tourLength(points, tourFromCyc(cyc_path))
+                line += (f", linkern {linkern_length:.0f} in {linkern_time:.1f}s, "
+                         f"built-in tour is {100 * (solver_length / linkern_length - 1):+.2f}%")
+        print(line)
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1:])
@@ -0,0 +1,32 @@
+import time
+
+from src.utils.convergence import ConvergenceMonitor
+
+
+def test_parses_linkern_output():
+    monitor = ConvergenceMonitor()
+    lines = ["Starting Cycle: 3012345", "1000 Steps   Best: 2950000   12.57 seconds", "LK Cycle: 2900000",
+             "Final Cycle: 2899000", "Initial Running Time: 0.40 (seconds)", "Overall Best Cycle: 2899000"]
+    assert [monitor.parseLine(line) for line in lines] == [True, True, True, True, False, False]
+    assert [length for _, length in monitor.history] == [3012345, 2950000, 2900000, 2899000]
+    assert monitor.history[1][0] == 12.57
+    assert monitor.best()[1] == 2899000
+
+
+def test_plateau():
+    monitor = ConvergenceMonitor(plateau_improvement=0.001, plateau_window=60)
+    monitor.add(0, 1000)
+    monitor.add(30, 900)
+    assert not monitor.shouldStop()
+    monitor.add(100, 899.5)
+    assert monitor.shouldStop()
+    assert "improved" in monitor.stop_reason
+
+
+def test_plateau_while_solver_is_quiet():
+    # The solver prints one length and then nothing, the window still moves on
+    monitor = ConvergenceMonitor(plateau_improvement=0.001, plateau_window=0.2)
+    monitor.add(0, 1000)
+    assert not monitor.shouldStop()
+    time.sleep(0.4)
+    assert monitor.shouldStop()
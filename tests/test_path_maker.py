@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.utils import path_maker, tsp_solver
+
+
+def writeTsp(path, points):
+    lines = ["NAME : test", "TYPE : TSP", f"DIMENSION : {len(points)}", "EDGE_WEIGHT_TYPE : EUC_2D",
+             "NODE_COORD_SECTION"]
+    lines += [f"{k} {x} {y}" for k, (x, y) in enumerate(points)]
+    path.write_text("\n".join(lines) + "\nEOF\n")
+
+
+def writeSnapshot(path, order):
+    # Like CCutil_writecycle, which linkern uses for -S: the count, then the nodes ten per line
+    text = f"{len(order)}\n"
+    for k, node in enumerate(order):
+        text += f"{node} "
+        if k % 10 == 9:
+            text += "\n"
+    if len(order) % 10:
+        text += "\n"
+    path.write_text(text)
+
+
+def test_snapshot_to_cyc(tmp_path):
+    rng = np.random.default_rng(0)
+    points = rng.integers(0, 1000, (25, 2))
+    order = rng.permutation(len(points))
+    writeTsp(tmp_path / "image.tsp", points)
+    writeSnapshot(tmp_path / "snapshot.cyc", order)
+
+    loaded = path_maker.loadCycle(tmp_path / "snapshot.cyc")
+    assert loaded.tolist() == order.tolist()
+    tsp_solver.writeCyc(tmp_path / "image.cyc", path_maker.loadTsp(tmp_path / "image.tsp"), loaded)
+
+    segments = path_maker.loadCyc(tmp_path / "image.cyc")
+    assert segments[:, 0].tolist() == order.tolist()
+    assert segments[:, 1].tolist() == np.roll(order, -1).tolist()
+
+    path_maker.pathMaker(tmp_path / "image.tsp", tmp_path / "image.cyc", tmp_path / "coordinates.txt")
+    coordinates = np.loadtxt(tmp_path / "coordinates.txt", dtype=np.int64, ndmin=2)
+    assert np.array_equal(coordinates, points[order])
+
+
+def test_truncated_snapshot(tmp_path):
+    writeSnapshot(tmp_path / "snapshot.cyc", np.arange(25))
+    text = (tmp_path / "snapshot.cyc").read_text()
+    (tmp_path / "snapshot.cyc").write_text(text[:len(text) // 2])
+    with pytest.raises(ValueError):
+        path_maker.loadCycle(tmp_path / "snapshot.cyc")
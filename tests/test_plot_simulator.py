@@ -0,0 +1,29 @@
+import pytest
+
+from src.utils import constants, plot_simulator
+
+
+def simulate(tmp_path, steps, **options):
+    (tmp_path / "path.txt").write_text("".join(f"{line}\n" for line in steps))
+    return plot_simulator.simulate(tmp_path / "path.txt", constants.DEFAULT_SETTINGS, **options)
+
+
+def test_no_pen_down_line_is_drawn(tmp_path):
+    # The steps of a wave or a tour: PENUP at the start and end only
+    report = simulate(tmp_path, ["PENUP:45", "1000,1000", "2000,0", "0,0", "PENUP:45"])
+    assert report["pen_down_mm"] > 0
+    assert report["pen_up_mm"] == 0
+
+
+def test_pen_up_and_down(tmp_path):
+    report = simulate(tmp_path, ["PENUP:45", "1000,1000", "PENDOWN:0", "2000,0", "PENUP:45", "0,0", "PENUP:45"])
+    drawn = simulate(tmp_path, ["PENUP:45", "1000,1000", "2000,0", "0,0", "PENUP:45"])
+    assert report["pen_down_mm"] > 0
+    assert report["pen_up_mm"] > 0
+    assert report["pen_down_mm"] + report["pen_up_mm"] == pytest.approx(drawn["pen_down_mm"])
+
+
+def test_move_time(tmp_path):
+    report = simulate(tmp_path, ["maxSpeed:1000", "3000,-1000", "3000,1000"], max_speed=3000, servo_delay=0.0)
+    assert report["move_time"] == pytest.approx(5.0)
+    assert report["moves"] == 2
@@ -0,0 +1,209 @@
+import os
+import select
+import threading
+import time
+
+import pytest
+
+from src.utils import serial_sender
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="needs a pseudo-terminal")
+
+
+class FakePlotter:
+    # Stands in for the plotter on the other end of a pty: runs every line it gets after <command_time>
+    # seconds, answers "ok" or <errors>[line], and keeps track of how much was waiting in its receive buffer
+    def __init__(self, command_time=0.0, errors=None):
+        self.master, self.slave = os.openpty()
+        self.port = os.ttyname(self.slave)
+        self.command_time = command_time
+        self.errors = errors or {}
+        self.received = []
+        self.max_buffered = 0
+        self.max_waiting = 0
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        buffer = b""
+        while not self.closed.is_set():
+            if select.select([self.master], [], [], 0.01)[0]:
+                buffer += os.read(self.master, 4096)
+                self.max_buffered = max(self.max_buffered, len(buffer))
+                self.max_waiting = max(self.max_waiting, buffer.count(b"\n"))
+            if b"\n" not in buffer:
+                continue
+            line, buffer = buffer.split(b"\n", 1)
+            line = line.decode("ascii")
+            time.sleep(self.command_time)
+            self.received.append(line)
+            answer = self.errors.get(line, "ok")
+            os.write(self.master, f"{answer}\n".encode("ascii"))
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+@pytest.fixture
+def plotter():
+    plotter = FakePlotter()
+    yield plotter
+    plotter.close()
+
+
+def stepLines(count):
+    lines = ["PENUP:45", "0,0", "PENDOWN:0"]
+    lines += [f"{k * 7 % 1000},{-(k * 13 % 1000)}" for k in range(count)]
+    return lines + ["PENUP:45"]
+
+
+def test_streams_all_lines(plotter):
+    lines = stepLines(500)
+    sender = serial_sender.SerialSender(plotter.port)
+    stats = sender.stream(lines)
+    sender.close()
+
+    assert plotter.received == lines
+    assert stats["acknowledged"] == len(lines)
+    assert sender.next_line == len(lines)
+    assert plotter.max_buffered <= 64
+
+
+def test_window(plotter):
+    sender = serial_sender.SerialSender(plotter.port, window=2, buffer_size=1000)
+    sender.stream(stepLines(200))
+    sender.close()
+    assert plotter.max_waiting <= 2
+
+
+def test_byte_budget(plotter):
+    sender = serial_sender.SerialSender(plotter.port, window=100, buffer_size=20)
+    sender.stream(stepLines(200))
+    sender.close()
+    assert plotter.max_buffered <= 20
+
+
+def test_line_longer_than_buffer(plotter):
+    sender = serial_sender.SerialSender(plotter.port, buffer_size=8)
+    with pytest.raises(ValueError):
+        sender.stream(["1234567,-1234567"])
+    sender.close()
+
+
+def test_pause_line(plotter):
+    lines = stepLines(50) + ["PAUSE", "PENDOWN:0"] + stepLines(50)
+    pause_index = lines.index("PAUSE")
+    sender = serial_sender.SerialSender(plotter.port)
+    paused = []
+
+    def onPause(line):
+        # Everything before the PAUSE line has been run
+        paused.append((line, len(plotter.received)))
+        sender.resume()
+
+    sender.stream(lines, on_pause=onPause)
+    sender.close()
+
+    assert paused == [(pause_index, pause_index)]
+    assert plotter.received == [line for line in lines if line != "PAUSE"]
+
+
+def test_pause_and_resume():
+    plotter = FakePlotter(command_time=0.002)
+    lines = stepLines(300)
+    sender = serial_sender.SerialSender(plotter.port)
+    thread = threading.Thread(target=sender.stream, args=(lines,))
+    thread.start()
+
+    while len(plotter.received) < 50:
+        time.sleep(0.001)
+    sender.pause()
+    # The lines in flight are run, then nothing more is sent
+    time.sleep(0.2)
+    received = len(plotter.received)
+    time.sleep(0.2)
+    assert len(plotter.received) == received < len(lines)
+    assert sender.next_line == received
+
+    sender.resume()
+    thread.join()
+    sender.close()
+    plotter.close()
+    assert plotter.received == lines
+
+
+def test_stop_and_resume_from_line():
+    plotter = FakePlotter(command_time=0.002)
+    lines = ["maxSpeed:2000"] + stepLines(300)
+    sender = serial_sender.SerialSender(plotter.port)
+    thread = threading.Thread(target=sender.stream, args=(lines,))
+    thread.start()
+    while len(plotter.received) < 100:
+        time.sleep(0.001)
+    sender.stop()
+    thread.join()
+    sender.close()
+    plotter.close()
+
+    # The lines still in flight when it stopped may have been run too
+    next_line = sender.next_line
+    assert 100 <= next_line < len(lines)
+    assert plotter.received[:next_line] == lines[:next_line]
+
+    plotter = FakePlotter()
+    sender = serial_sender.SerialSender(plotter.port)
+    sender.stream(lines, start_line=next_line)
+    sender.close()
+    plotter.close()
+
+    # Pen up, speed, back to the last position, pen down, and on from the line
+    restore = ["PENUP:45", "maxSpeed:2000", lines[next_line - 1], "PENDOWN:0"]
+    assert plotter.received == restore + lines[next_line:]
+
+
+def test_restore_lines():
+    lines = ["PENUP:40", "5,5", "PENDOWN:0", "10,10,1500", "PENUP:40", "20,20", "PENDOWN:0", "30,30"]
+    assert serial_sender.restoreLines(lines, 0) == []
+    assert serial_sender.restoreLines(lines, 4) == ["PENUP:40", "10,10", "PENDOWN:0"]
+    # The pen was up before line 6
+    assert serial_sender.restoreLines(lines, 6) == ["PENUP:40", "20,20"]
+
+
+def test_error_answer():
+    plotter = FakePlotter(errors={"5,5": "error: out of range"})
+    sender = serial_sender.SerialSender(plotter.port)
+    with pytest.raises(RuntimeError, match="line 2"):
+        sender.stream(["PENUP:45", "1,1", "5,5", "6,6"])
+    sender.close()
+    plotter.close()
+    assert sender.next_line == 2
+
+
+def test_stats_per_stream(plotter):
+    # Stopping and resuming on the same sender counts every call on its own
+    lines = stepLines(50)
+    sender = serial_sender.SerialSender(plotter.port)
+    first = dict(sender.stream(lines[:20]))
+    second = sender.stream(lines, start_line=20)
+    sender.close()
+
+    assert first["acknowledged"] == 20
+    # The restore lines are sent before line 20
+    restore = len(serial_sender.restoreLines(lines, 20))
+    assert second["acknowledged"] == second["sent"] == len(lines) - 20 + restore
+    assert second["bytes"] == sum(len(line) + 1 for line in serial_sender.restoreLines(lines, 20) + lines[20:])
+    assert second["commands_per_second"] == pytest.approx(second["acknowledged"] / second["seconds"])
+
+
+def test_throughput(plotter):
+    lines = stepLines(5000)
+    sender = serial_sender.SerialSender(plotter.port, window=8)
+    stats = sender.stream(lines)
+    sender.close()
+
+    assert plotter.received == lines
+    assert stats["commands_per_second"] > 100, f"{stats['commands_per_second']:.0f} commands per second"
@@ -0,0 +1,71 @@
+import os
+
+from src.utils import stage_cache
+
+
+def writeFile(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_key_changes_with_input(tmp_path):
+    cache = stage_cache.StageCache(tmp_path / "cache")
+    input_path = writeFile(tmp_path / "image.tsp", "a")
+    key = cache.key("tour", files=[input_path], params={"solver": "builtin"})
+
+    assert key.startswith("tour-")
+    assert cache.key("tour", files=[input_path], params={"solver": "builtin"}) == key
+    assert cache.key("tour", files=[input_path], params={"solver": "linkern"}) != key
+    assert cache.key("path", files=[input_path], params={"solver": "builtin"}) != key
+    writeFile(tmp_path / "image.tsp", "b")
+    assert cache.key("tour", files=[input_path], params={"solver": "builtin"}) != key
+
+
+def test_key_separates_blobs():
+    cache = stage_cache.StageCache("unused")
+    assert cache.key("dither", blobs=[b"ab", b"c"]) != cache.key("dither", blobs=[b"a", b"bc"])
+
+
+def test_store_and_fetch(tmp_path):
+    cache = stage_cache.StageCache(tmp_path / "cache")
+    output_path = writeFile(tmp_path / "path.txt", "1,2\n")
+    key = cache.key("steps", params={"tolerance": 0.1})
+
+    assert cache.fetch(key, {"path.txt": output_path}) is None
+    cache.store(key, {"path.txt": output_path}, {"output": ["Done"]})
+    os.remove(output_path)
+
+    assert cache.fetch(key, {"path.txt": output_path}) == {"output": ["Done"]}
+    assert open(output_path).read() == "1,2\n"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_missing_file_is_a_miss(tmp_path):
+    cache = stage_cache.StageCache(tmp_path / "cache")
+    output_path = writeFile(tmp_path / "path.txt", "1,2\n")
+    cache.store("steps-1", {"path.txt": output_path})
+
+    assert cache.fetch("steps-1", {"path.vps": str(tmp_path / "path.vps")}) is None
+    assert cache.misses == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = stage_cache.StageCache(tmp_path / "cache", max_bytes=2500)
+    output_path = writeFile(tmp_path / "out.txt", "x" * 1000)
+    for number, key in enumerate(("a", "b")):
+        cache.store(key, {"out.txt": output_path})
+        os.utime(cache.entryPath(key), (number, number))
+    # "a" is used, so "b" is the least recently used
+    cache.fetch("a", {"out.txt": output_path})
+    cache.store("c", {"out.txt": output_path})
+
+    assert sorted(os.listdir(cache.cache_dir)) == ["a", "c"]
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_clear(tmp_path):
+    cache = stage_cache.StageCache(tmp_path / "cache")
+    cache.store("a", {"out.txt": writeFile(tmp_path / "out.txt", "x")})
+    cache.clear()
+    assert cache.stats()["entries"] == 0
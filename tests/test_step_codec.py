@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+from src.utils import constants, motion_planner, plot_simulator, step_codec, to_steps
+
+
+def roundTrip(tmp_path, lines):
+    steps_path = tmp_path / "path.txt"
+    steps_path.write_text("".join(f"{line}\n" for line in lines))
+    text_size, binary_size = step_codec.encodeFile(steps_path, tmp_path / "path.vps")
+    step_codec.decodeFile(tmp_path / "path.vps", tmp_path / "decoded.txt")
+
+    # The array decoder reads the same as the text file
+    positions, commands, speeds = step_codec.decodeArrays((tmp_path / "path.vps").read_bytes())
+    text_positions, text_commands, text_speeds = plot_simulator.readSteps(steps_path)
+    assert np.array_equal(positions, text_positions.reshape(-1, 2))
+    assert commands == text_commands
+    assert np.array_equal(speeds, text_speeds, equal_nan=True)
+    return (tmp_path / "decoded.txt").read_text().splitlines(), text_size, binary_size
+
+
+@pytest.mark.parametrize("value", [0, 1, -1, 2, -2, 63, -64, 64, 2 ** 20, -(2 ** 20), 2 ** 62, -(2 ** 62)])
+def test_zigzag(value):
+    assert step_codec.unzigzag(step_codec.zigzag(value)) == value
+    assert step_codec.zigzag(value) >= 0
+
+
+def test_zigzag_order():
+    assert [step_codec.zigzag(value) for value in (0, -1, 1, -2, 2)] == [0, 1, 2, 3, 4]
+
+
+def test_empty(tmp_path):
+    lines, _, binary_size = roundTrip(tmp_path, [])
+    assert lines == []
+    assert binary_size == len(step_codec.MAGIC)
+
+
+def test_commands(tmp_path):
+    steps = ["maxSpeed:1500", "PENUP:45", "PENDOWN:0", "PAUSE", "PENUP:180", "PAUSE", "maxSpeed:3000"]
+    assert roundTrip(tmp_path, steps)[0] == steps
+
+
+def test_moves_and_commands(tmp_path):
+    steps = ["PENUP:45", "0,0", "5,-5", "PENDOWN:0", "-70,64", "-70,64", "100000,-250000", "PAUSE", "PENUP:45",
+             "-3,2", "PENUP:45"]
+    assert roundTrip(tmp_path, steps)[0] == steps
+
+
+def test_planned_speeds(tmp_path):
+    steps = ["PENUP:45", "10,-10,0", "PENDOWN:0", "20,-15,1200", "30,-20,2999", "35,-18", "PENUP:45"]
+    assert roundTrip(tmp_path, steps)[0] == steps
+
+
+def test_random_walk(tmp_path):
+    rng = np.random.default_rng(0)
+    positions = np.cumsum(rng.integers(-5000, 5000, (5000, 2)), axis=0)
+    steps = ["PENUP:45"]
+    for k, (a, b) in enumerate(positions):
+        steps.append(f"{a},{b}")
+        if k % 97 == 0:
+            steps.append("PENDOWN:0" if k % 2 else "PENUP:45")
+        if k % 1000 == 999:
+            steps.append("PAUSE")
+    assert roundTrip(tmp_path, steps)[0] == steps
+
+
+def test_small_moves_are_two_bytes(tmp_path):
+    steps = [f"{k % 31},{-(k % 29)}" for k in range(1000)]
+    _, _, binary_size = roundTrip(tmp_path, steps)
+    assert binary_size == len(step_codec.MAGIC) + 2 * len(steps)
+
+
+def test_blank_lines_and_spaces(tmp_path):
+    steps_path = tmp_path / "path.txt"
+    steps_path.write_text("PENUP:45\n\n  12,34 \n\nPENDOWN:0\n")
+    step_codec.encodeFile(steps_path, tmp_path / "path.vps")
+    step_codec.decodeFile(tmp_path / "path.vps", tmp_path / "decoded.txt")
+    assert (tmp_path / "decoded.txt").read_text().splitlines() == ["PENUP:45", "12,34", "PENDOWN:0"]
+
+
+def test_convert_to_steps_output(tmp_path):
+    coordinates = ["PENUP", "0 0", "PENDOWN", "100 100", "250 40", "1000 1000", "PENUP", "500 500", "PENDOWN",
+                   "501 501", "PAUSE", "PENUP", "0 1000", "PENDOWN", "1000 0"]
+    (tmp_path / "coordinates.txt").write_text("\n".join(coordinates))
+    to_steps.convertToSteps(constants.DEFAULT_SETTINGS, tmp_path / "coordinates.txt", tmp_path / "path.txt", fit=True,
+                            max_deviation=0.1)
+    motion_planner.planFile(tmp_path / "path.txt", tmp_path / "planned.txt", acceleration=6000)
+
+    for name in ("path.txt", "planned.txt"):
+        steps = (tmp_path / name).read_text().splitlines()
+        assert roundTrip(tmp_path, steps)[0] == steps
+
+
+@pytest.mark.parametrize("decode", [step_codec.decodeSteps, step_codec.decodeArrays])
+def test_not_a_step_file(decode):
+    with pytest.raises(ValueError):
+        decode(b"PENUP:45\n")
+
+
+@pytest.mark.parametrize("decode", [step_codec.decodeSteps, step_codec.decodeArrays])
+def test_truncated(decode):
+    data = step_codec.encodeSteps(np.array([[100000, -100000]]), [])
+    with pytest.raises(ValueError):
+        decode(data[:-1])
+
+
+@pytest.mark.parametrize("decode", [step_codec.decodeSteps, step_codec.decodeArrays])
+def test_unknown_opcode(decode):
+    with pytest.raises(ValueError):
+        decode(step_codec.MAGIC + bytes([(7 << 2) | 3]))
+
+
+def test_unknown_line(tmp_path):
+    steps_path = tmp_path / "path.txt"
+    steps_path.write_text("PENUP:45\nHOME\n")
+    with pytest.raises(ValueError):
+        step_codec.encodeFile(steps_path, tmp_path / "path.vps")
@@ -0,0 +1,50 @@
+import numpy as np
+
+from src.utils import constants, to_steps
+
+# A zigzag over the whole paper, the long lines bend a lot when both motors move at a constant speed
+ZIGZAG = ["0 0", "1000 0", "0 500", "1000 1000"]
+
+
+def convert(tmp_path, coordinates, **options):
+    (tmp_path / "coordinates.txt").write_text("\n".join(coordinates))
+    output = to_steps.convertToSteps(constants.DEFAULT_SETTINGS, tmp_path / "coordinates.txt",
+                                     tmp_path / "path.txt", fit=True, **options)
+    return output, (tmp_path / "path.txt").read_text().splitlines()
+
+
+def moveCount(steps):
+    return sum("," in line for line in steps)
+
+
+def test_pen_down_segments():
+    markers = [(0, "PENUP"), (1, "PENDOWN"), (3, "PAUSE"), (3, "PENUP"), (4, "PENDOWN")]
+    assert to_steps.penDownSegments(6, markers).tolist() == [True, True, False, True, True]
+    assert to_steps.penDownSegments(3, [(0, "PENUP")]).tolist() == [True, True]
+
+
+def test_no_pen_markers_is_drawn():
+    assert to_steps.penDownSegments(4, []).tolist() == [True, True, True]
+    assert to_steps.penDownSegments(4, [(2, "PAUSE")]).tolist() == [True, True, True]
+
+
+def test_subdivides_lines_without_pen_markers(tmp_path):
+    output, steps = convert(tmp_path, ZIGZAG, max_deviation=0.1)
+    assert "Added" in output
+    assert moveCount(steps) > len(ZIGZAG)
+    # The points of the file are still where they were
+    _, plain = convert(tmp_path, ZIGZAG)
+    assert set(line for line in plain if "," in line) <= set(steps)
+
+
+def test_pen_up_lines_are_not_subdivided(tmp_path):
+    coordinates = ["PENUP", "0 0", "PENDOWN", "0 1", "PENUP", "1000 0", "PENDOWN", "1000 1"]
+    output, steps = convert(tmp_path, coordinates, max_deviation=0.1)
+    assert "Added" not in output
+    assert moveCount(steps) == 4
+
+
+def test_subdivided_positions_are_not_repeated(tmp_path):
+    _, steps = convert(tmp_path, ZIGZAG, max_deviation=0.1)
+    positions = np.array([[int(value) for value in line.split(",")] for line in steps if "," in line])
+    assert (np.abs(np.diff(positions, axis=0)).max(axis=1) > 0).all()
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import numba
+import numpy as np
+import pytest
+
+from src.utils import path_maker, tsp_solver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A solve() before solvePartitioned() starts numba's threads in the process that then starts the tile workers,
+# like the window does after a Make Path with the built-in solver
+SOLVE_THEN_PARTITION = """
+import numpy as np
+from src.utils import tsp_solver
+
+points = np.random.default_rng(0).random((4000, 2)) * 1000
+tsp_solver.solve(points)
+tour = tsp_solver.solvePartitioned(points, tile_size=500, workers=2)
+assert sorted(tour.tolist()) == list(range(len(points)))
+"""
+
+
+def test_solve_then_partitioned_exits():
+    result = subprocess.run([sys.executable, "-c", SOLVE_THEN_PARTITION], cwd=ROOT, capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
+
+
+def test_solve_visits_every_point():
+    points = np.random.default_rng(1).random((2000, 2)) * 1000
+    tour = tsp_solver.solve(points)
+    assert sorted(tour.tolist()) == list(range(len(points)))
+    assert tsp_solver.tourLength(points, tour) < tsp_solver.tourLength(points, np.arange(len(points)))
+
+
+@pytest.mark.parametrize("offset", range(-4, 5))
+def test_local_repair_across_chunk_border(offset):
+    # A crossing made by reversing a few cities around a chunk border can only be undone after the borders moved
+    points = np.random.default_rng(2).random((4000, 2)) * 1000
+    good = tsp_solver.solve(points)
+    count = len(good)
+    chunk_size = 1000
+    chunk_count = max(numba.get_num_threads(), -(-count // chunk_size))
+    border = int(np.linspace(0, count, chunk_count + 1)[1])
+
+    tour = good.copy()
+    start = border - 5 + offset
+    tour[start:start + 10] = tour[start:start + 10][::-1]
+    active = np.zeros(count, dtype=np.bool_)
+    active[tour[start - 3:start + 13]] = True
+
+    repaired = tsp_solver.improveTour(points, tour, tsp_solver.neighbourLists(points), active=active,
+                                      chunk_size=chunk_size)
+    assert sorted(repaired.tolist()) == list(range(count))
+    assert tsp_solver.tourLength(points, repaired) <= tsp_solver.tourLength(points, good) + 1e-6
+
+
+def test_no_points(tmp_path):
+    points = np.zeros((0, 2))
+    assert tsp_solver.solve(points).tolist() == []
+    assert tsp_solver.solvePartitioned(points).tolist() == []
+
+    tsp_solver.writeCyc(tmp_path / "image.cyc", points, tsp_solver.solve(points))
+    assert len(path_maker.loadCyc(tmp_path / "image.cyc")) == 0